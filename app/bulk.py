@@ -0,0 +1,190 @@
+import codecs
+import json
+import zlib
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from . import schemas
+
+# Upper bound on a single buffered record, so a malformed body cannot grow the buffer without limit
+MAX_RECORD_BYTES = 1024 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+# zlib window bits for each accepted Content-Encoding
+_CONTENT_ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "x-gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+# Decompressed bytes produced per step, so a small compressed chunk cannot expand all at once
+_INFLATE_STEP = 64 * 1024
+
+class BulkParseError(ValueError):
+    """Raised when a bulk body cannot be parsed any further"""
+
+class UnsupportedEncoding(ValueError):
+    """Raised for a Content-Encoding other than gzip, deflate or identity"""
+
+def body_decompressor(content_encoding: Optional[str]):
+    """A zlib decompressor for the request's Content-Encoding, or None for an uncompressed body"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return None
+    if encoding not in _CONTENT_ENCODINGS:
+        raise UnsupportedEncoding(f"Unsupported Content-Encoding {content_encoding!r}; use gzip or deflate")
+    return zlib.decompressobj(_CONTENT_ENCODINGS[encoding])
+
+async def decompress_stream(chunks: AsyncIterator[bytes], decompressor) -> AsyncIterator[bytes]:
+    """Decompress a body as it arrives; the parsers' own limits bound how much is ever held"""
+    try:
+        async for chunk in chunks:
+            while chunk:
+                data = decompressor.decompress(chunk, _INFLATE_STEP)
+                chunk = decompressor.unconsumed_tail
+                if data:
+                    yield data
+        data = decompressor.flush()
+    except zlib.error as e:
+        raise BulkParseError(f"Invalid compressed body: {e}") from None
+    if data:
+        yield data
+    if not decompressor.eof:
+        raise BulkParseError("Compressed body ends early")
+
+def decompress_body(body: bytes, decompressor, limit: int = MAX_RECORD_BYTES) -> bytes:
+    """Decompress a whole single-record body, refusing one that expands beyond limit"""
+    try:
+        data = decompressor.decompress(body, limit + 1)
+    except zlib.error as e:
+        raise BulkParseError(f"Invalid compressed body: {e}") from None
+    if len(data) > limit:
+        raise BulkParseError(f"Body exceeds {limit} bytes decompressed")
+    if not decompressor.eof:
+        raise BulkParseError("Compressed body ends early")
+    return data
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Any, str]]:
+    """
+    Yield (line, None) pairs for each non-blank line of an NDJSON body.
+
+    Lines are split off as they arrive and left undecoded: validate_record
+    parses and validates each one in a single pass, so a malformed line is
+    reported and parsing continues with the next one.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            result = _decode_line(line)
+            if result is not None:
+                yield result
+        if len(buffer) > MAX_RECORD_BYTES:
+            raise BulkParseError(f"Line exceeds {MAX_RECORD_BYTES} bytes")
+
+    result = _decode_line(buffer)
+    if result is not None:
+        yield result
+
+def _decode_line(line: bytes):
+    line = line.strip()
+    if not line:
+        return None
+    return line, None
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Any, str]]:
+    """
+    Yield (record, None) pairs for each element of a top-level JSON array.
+
+    Only the element currently being decoded is held in memory. A syntax
+    error cannot be resynchronised, so it raises BulkParseError.
+    """
+    parser = JsonArrayParser()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    async for chunk in chunks:
+        for record in parser.feed(text_decoder.decode(chunk)):
+            yield record, None
+
+    for record in parser.feed(text_decoder.decode(b"", final=True), final=True):
+        yield record, None
+
+class JsonArrayParser:
+    """Incremental decoder for the elements of a single top-level JSON array"""
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "open"
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        """Append text and return every element that is now complete"""
+        buffer = self._buffer + text
+        records: List[Any] = []
+        pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if self._state == "done":
+                raise BulkParseError("Unexpected data after JSON array")
+
+            char = buffer[pos]
+            if self._state == "open":
+                if char != "[":
+                    raise BulkParseError("Expected a JSON array")
+                pos += 1
+                self._state = "first"
+            elif self._state == "separator":
+                if char not in ",]":
+                    raise BulkParseError(f"Expected ',' or ']' after element {len(records)}")
+                pos += 1
+                self._state = "value" if char == "," else "done"
+            elif self._state == "first" and char == "]":
+                pos += 1
+                self._state = "done"
+            else:
+                try:
+                    record, end = self._decoder.raw_decode(buffer, pos)
+                except ValueError as e:
+                    if final:
+                        raise BulkParseError(f"Invalid JSON: {str(e)}")
+                    break
+                # A value running up to the end of the buffer (e.g. a number) may still be incomplete
+                if end >= len(buffer) and not final:
+                    break
+                records.append(record)
+                pos = end
+                self._state = "separator"
+
+        self._buffer = buffer[pos:]
+        if len(self._buffer) > MAX_RECORD_BYTES:
+            raise BulkParseError(f"Array element exceeds {MAX_RECORD_BYTES} bytes")
+        if final and self._state != "done":
+            raise BulkParseError("Unexpected end of JSON array")
+
+        return records
+
+def validate_record(record: Any) -> schemas.EventCreate:
+    """Validate a decoded record, or the raw JSON of one, against the single-event ingest schema"""
+    try:
+        if isinstance(record, bytes):
+            return schemas.parse_event_json(record)
+        if not isinstance(record, dict):
+            raise ValueError("Expected a JSON object")
+        return schemas.parse_event(record)
+    except ValidationError as e:
+        raise ValueError(format_validation_error(e))
+
+def format_validation_error(error: ValidationError) -> str:
+    """Collapse a pydantic ValidationError into a single line"""
+    messages: List[str] = []
+    for err in error.errors():
+        loc = err["loc"]
+        # Errors inside a variant are prefixed with its event_type tag
+        if loc and loc[0] in schemas.EVENT_TYPE_TAGS:
+            loc = loc[1:]
+        location = ".".join(str(part) for part in loc)
+        messages.append(f"{location}: {err['msg']}" if location else err["msg"])
+    return "; ".join(messages)
@@ -0,0 +1,124 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from . import config
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    # None for closed historical ranges, which never change once cached
+    expires_at: Optional[float]
+    size: int
+
+class QueryCache:
+    """
+    LRU cache of serialized analytics responses with a memory cap.
+
+    Entries for closed ranges (ending before now minus a grace period, and
+    before the oldest event still waiting in the ingest log) are kept until
+    evicted. Entries for ranges that include "now" expire after a short
+    TTL and are dropped whenever the ingest path commits new events.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = config.ANALYTICS_CACHE_MAX_BYTES,
+        open_ttl_seconds: float = config.ANALYTICS_CACHE_OPEN_TTL_SECONDS,
+        closed_grace_seconds: float = config.ANALYTICS_CACHE_CLOSED_GRACE_SECONDS
+    ):
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl_seconds
+        self.closed_grace = timedelta(seconds=closed_grace_seconds)
+        # Timestamp of the oldest accepted event not yet in the database (see EventLog.unapplied_since)
+        self.unapplied_since: Optional[Callable[[], Optional[datetime]]] = None
+
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def is_closed(self, end: Optional[datetime]) -> bool:
+        """True when no new events can land in a range ending at `end` (naive UTC)"""
+        if end is None:
+            return False
+        closed_before = datetime.utcnow() - self.closed_grace
+        oldest_unapplied = self.unapplied_since() if self.unapplied_since is not None else None
+        if oldest_unapplied is not None:
+            closed_before = min(closed_before, oldest_unapplied)
+        return end < closed_before
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, body: bytes, closed: bool) -> CacheEntry:
+        """Store a serialized response and return its entry (with ETag)"""
+        entry = CacheEntry(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            expires_at=None if closed else time.monotonic() + self.open_ttl,
+            size=len(body) + len(repr(key))
+        )
+        # Too large to ever fit, serve it uncached
+        if entry.size > self.max_bytes:
+            return entry
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+        return entry
+
+    def invalidate_open(self) -> None:
+        """Drop every entry whose range may still receive events"""
+        stale = [key for key, entry in self._entries.items() if entry.expires_at is not None]
+        for key in stale:
+            self._remove(key)
+        self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+analytics_cache = QueryCache()
@@ -0,0 +1,152 @@
+"""
+Compact columnar event files (.evc).
+
+Events are written in row groups. Within a group every column is stored and
+zlib-compressed separately: user_id is dictionary-encoded into integer codes,
+event_type becomes a one-byte code, timestamps are delta-encoded epoch
+microseconds, event IDs are raw 16-byte UUIDs and payloads keep their JSON
+text. Repetitive columns compress to a fraction of their size in the events
+table, and reloading is a handful of array decodes per group instead of
+per-row JSON parsing.
+
+Layout (all integers little-endian):
+
+    b"EVC1" | u32 header length | header JSON
+    row group*: u32 row count | 6 x (u32 length | zlib column bytes)
+    u32 0   (end marker)
+"""
+
+import json
+import struct
+import sys
+import uuid
+import zlib
+from array import array
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .models import EVENT_TYPE_CODES, EVENT_TYPES, from_epoch_micros, to_epoch_micros
+
+MAGIC = b"EVC1"
+VERSION = 1
+COLUMNS = ("users", "user_codes", "event_types", "timestamps", "event_ids", "payloads")
+
+_U32 = struct.Struct("<I")
+
+Row = Tuple[str, str, str, datetime, str]
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+class ColumnarWriter:
+    """Write (event_id, user_id, event_type, timestamp, payload) rows as row groups"""
+
+    def __init__(self, fileobj: BinaryIO, compression_level: int = 6):
+        self.fileobj = fileobj
+        self.compression_level = compression_level
+        self.rows_written = 0
+
+        header = json.dumps({"version": VERSION, "event_types": list(EVENT_TYPES), "columns": list(COLUMNS)}).encode()
+        fileobj.write(MAGIC)
+        fileobj.write(_U32.pack(len(header)))
+        fileobj.write(header)
+
+    def write_row_group(self, rows: Sequence[Row]) -> None:
+        if not rows:
+            return
+
+        user_index: Dict[str, int] = {}
+        user_codes = array("I")
+        type_codes = bytearray()
+        timestamps = array("q")
+        event_ids = bytearray()
+        payloads: List[str] = []
+
+        previous = 0
+        for event_id, user_id, event_type, timestamp, payload in rows:
+            user_codes.append(user_index.setdefault(user_id, len(user_index)))
+            type_codes.append(EVENT_TYPE_CODES[event_type])
+            micros = to_epoch_micros(timestamp)
+            timestamps.append(micros - previous)
+            previous = micros
+            event_ids += uuid.UUID(event_id).bytes
+            payloads.append(payload)
+
+        columns = [
+            json.dumps(list(user_index)).encode(),
+            _little_endian(user_codes),
+            bytes(type_codes),
+            _little_endian(timestamps),
+            bytes(event_ids),
+            # json.dumps never emits raw newlines, so they are a safe separator
+            "\n".join(payloads).encode(),
+        ]
+
+        self.fileobj.write(_U32.pack(len(rows)))
+        for column in columns:
+            compressed = zlib.compress(column, self.compression_level)
+            self.fileobj.write(_U32.pack(len(compressed)))
+            self.fileobj.write(compressed)
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        self.fileobj.write(_U32.pack(0))
+
+def _read_exact(fileobj: BinaryIO, size: int) -> bytes:
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated columnar file")
+    return data
+
+def read_row_groups(fileobj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Yield each row group as a dict of decoded column lists"""
+    if fileobj.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar event file")
+    (header_length,) = _U32.unpack(_read_exact(fileobj, 4))
+    header = json.loads(_read_exact(fileobj, header_length))
+    if header.get("version") != VERSION:
+        raise ValueError(f"Unsupported columnar file version: {header.get('version')}")
+    event_types = header["event_types"]
+
+    while True:
+        (row_count,) = _U32.unpack(_read_exact(fileobj, 4))
+        if row_count == 0:
+            return
+
+        raw = []
+        for _ in COLUMNS:
+            (length,) = _U32.unpack(_read_exact(fileobj, 4))
+            raw.append(zlib.decompress(_read_exact(fileobj, length)))
+        users, user_codes, type_codes, deltas, event_ids, payloads = raw
+
+        dictionary = json.loads(users)
+        timestamps = []
+        micros = 0
+        for delta in _from_little_endian("q", deltas):
+            micros += delta
+            timestamps.append(from_epoch_micros(micros))
+
+        yield {
+            "event_id": [str(uuid.UUID(bytes=event_ids[i:i + 16])) for i in range(0, len(event_ids), 16)],
+            "user_id": [dictionary[code] for code in _from_little_endian("I", user_codes)],
+            "event_type": [event_types[code] for code in type_codes],
+            "timestamp": timestamps,
+            "payload": payloads.decode().split("\n"),
+        }
+
+def read_rows(fileobj: BinaryIO) -> Iterable[Dict[str, Any]]:
+    """Yield events row by row from a columnar file"""
+    for group in read_row_groups(fileobj):
+        names = list(group)
+        for values in zip(*(group[name] for name in names)):
+            yield dict(zip(names, values))
@@ -1,100 +1,410 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Optional, Dict
-from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, insert, literal, select, tuple_
+from typing import Optional, Dict, Any, AsyncIterator, Iterable, List, Tuple
+from datetime import datetime, timedelta
+import base64
 import json
 import uuid
 
-from . import models, schemas
+from . import fields, geohash, heatmap, metrics, models, partitions, rollups, schemas, sessions, sketches, topk
+from .hll import relative_error
+from .database import dialect_insert
 
-def create_event(db: Session, event: schemas.EventCreate):
-    """Create a new event in the database"""
-    # Generate UUID for event_id
-    event_id = str(uuid.uuid4())
+def build_event_row(event: schemas.EventCreate) -> Dict[str, Any]:
+    """
+    Build an insertable row for a validated event, assigning its ID and timestamp.
 
-    # Create database event
-    db_event = models.Event(
-        event_id=event_id,
-        user_id=event.user_id,
-        event_type=event.event_type,
-        payload=json.dumps(event.payload),
-        timestamp=datetime.utcnow()
-    )
+    The payload is serialized from its validated model: fields the client
+    left out stay out, extra keys are kept. The model's declared fields
+    (its vars) are all fields.extract reads. The ID is a UUIDv7 of the
+    timestamp, so get_event_by_id knows which partition to look in.
+    """
+    timestamp = datetime.utcnow()
+    return {
+        "event_id": models.uuid7(timestamp),
+        "user_id": event.user_id,
+        "event_type": event.event_type,
+        "payload": event.payload.model_dump_json(exclude_unset=True),
+        "timestamp": timestamp,
+        **fields.extract(event.event_type, vars(event.payload))
+    }
+
+# user_id -> users.id; rows in users are never deleted, so entries never go stale
+_user_keys: Dict[str, int] = {}
+USER_KEY_CACHE_SIZE = 1_000_000
+
+async def resolve_user_keys(db: AsyncSession, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Map user_id strings to their integer surrogate keys, creating missing users"""
+    wanted = set(user_ids)
+    if len(_user_keys) + len(wanted) > USER_KEY_CACHE_SIZE:
+        _user_keys.clear()
+    missing = [user_id for user_id in wanted if user_id not in _user_keys]
+
+    if missing:
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            await db.execute(
+                dialect_insert(db)(models.User).on_conflict_do_nothing(index_elements=[models.User.user_id]),
+                [{"user_id": user_id} for user_id in chunk]
+            )
+            found = await db.execute(
+                select(models.User.user_id, models.User.id).where(models.User.user_id.in_(chunk))
+            )
+            _user_keys.update(found.all())
+
+    return {user_id: _user_keys[user_id] for user_id in wanted}
+
+async def add_event_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Add a batch of event rows, their rollups, sketches and top values to the transaction (the caller commits).
+
+    Rows built by build_event_row carry the extracted payload fields; for any
+    other row they are extracted from the stored JSON here. If the
+    transaction fails, the caller must call forget_write_state().
+    """
+    if not rows:
+        return
 
-    db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
+    user_keys = await resolve_user_keys(db, (row["user_id"] for row in rows))
+    events = [
+        {
+            "event_id": row["event_id"],
+            "user_key": user_keys[row["user_id"]],
+            "event_type": row["event_type"],
+            "timestamp": row["timestamp"],
+            "payload": row["payload"],
+            **(
+                {field: row[field] for field in fields.COLUMNS} if "url" in row
+                else fields.extract_json(row["event_type"], row["payload"])
+            )
+        }
+        for row in rows
+    ]
+    for table, partition_events in await partitions.assign(db, events):
+        await db.execute(insert(table), partition_events)
+    await rollups.apply_rows(db, events)
+    await sketches.apply_rows(db, events)
+    await topk.apply_rows(db, events)
 
-    return db_event
+def forget_write_state() -> None:
+    """Drop cached users and partitions after a rolled back write transaction, which may have created them"""
+    _user_keys.clear()
+    partitions.forget()
 
-def get_event_count(
-    db: Session,
+@metrics.timed_db
+async def insert_event_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Insert a batch of event rows with one executemany per partition, in one transaction"""
+    if not rows:
+        return
+
+    try:
+        await add_event_rows(db, rows)
+        with metrics.COMMIT_SECONDS.time():
+            await db.commit()
+    except Exception:
+        forget_write_state()
+        raise
+
+@metrics.timed_db
+async def get_event_count(
+    db: AsyncSession,
     event_type: Optional[str] = None,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None,
+    filters: Optional[Dict[str, str]] = None
 ) -> int:
-    """Get total count of events with optional filtering"""
-    query = db.query(models.Event)
+    """
+    Get total count of events with optional filtering (end_date is inclusive).
 
-    # Apply filters
-    if event_type:
-        query = query.filter(models.Event.event_type == event_type)
+    `filters` maps extracted payload fields (url, element_id) to required
+    values; filtered counts come from the events table instead of the rollups.
+    """
+    stop = rollups.inclusive_stop(end_date)
+    if filters:
+        counts = await fields.count_by_type(db, filters, start=start_date, stop=stop, event_type=event_type)
+    else:
+        counts = await rollups.count_by_type(db, start=start_date, stop=stop, event_type=event_type)
+    return sum(counts.values())
 
-    if start_date:
-        query = query.filter(models.Event.timestamp >= start_date)
+@metrics.timed_db
+async def get_event_counts_by_type(
+    db: AsyncSession,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    filters: Optional[Dict[str, str]] = None
+) -> Dict[str, int]:
+    """Get count of events grouped by event_type (end_date is inclusive)"""
+    stop = rollups.inclusive_stop(end_date)
+    if filters:
+        return await fields.count_by_type(db, filters, start=start_date, stop=stop)
+    return await rollups.count_by_type(db, start=start_date, stop=stop)
 
-    if end_date:
-        query = query.filter(models.Event.timestamp <= end_date)
+@metrics.timed_db
+async def get_event_timeseries(
+    db: AsyncSession,
+    interval: str,
+    start_date: datetime,
+    end_date: datetime,
+    event_type: Optional[str] = None,
+    filters: Optional[Dict[str, str]] = None
+) -> List[Tuple[datetime, int]]:
+    """Get zero-filled event counts per interval bucket (end_date is inclusive)"""
+    stop = rollups.inclusive_stop(end_date)
+    if filters:
+        return await fields.timeseries(
+            db, filters, granularity=interval, start=start_date, stop=stop, event_type=event_type
+        )
+    return await rollups.timeseries(
+        db,
+        granularity=interval,
+        start=start_date,
+        stop=stop,
+        event_type=event_type
+    )
+
+@metrics.timed_db
+async def get_unique_users(
+    db: AsyncSession,
+    event_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    exact: bool = False,
+    filters: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Count distinct users with events in the range (end_date is inclusive).
 
-    return query.count()
+    Estimated from the HyperLogLog sketches unless `exact` is set, in which
+    case the events table is scanned with COUNT(DISTINCT user_key). There are
+    no sketches per payload value, so filtered counts are always exact.
+    """
+    stop = rollups.inclusive_stop(end_date)
+    if filters:
+        count = await fields.unique_users(db, filters, start=start_date, stop=stop, event_type=event_type)
+        return {"unique_users": count, "exact": True, "precision": None, "relative_error": 0.0}
+    if exact:
+        count = await sketches.exact_unique_users(db, start=start_date, stop=stop, event_type=event_type)
+        return {"unique_users": count, "exact": True, "precision": None, "relative_error": 0.0}
 
-def get_event_counts_by_type(
-    db: Session,
+    sketch = await sketches.unique_users(db, start=start_date, stop=stop, event_type=event_type)
+    return {
+        "unique_users": sketch.count(),
+        "exact": False,
+        "precision": sketch.precision,
+        "relative_error": round(relative_error(sketch.precision), 5),
+    }
+
+@metrics.timed_db
+async def get_top_values(
+    db: AsyncSession,
+    field: str,
+    n: int,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
-) -> Dict[str, int]:
-    """Get count of events grouped by event_type"""
-    query = db.query(
-        models.Event.event_type,
-        func.count(models.Event.event_id).label('count')
-    )
+    end_date: Optional[datetime] = None,
+    exact: bool = False
+) -> Dict[str, Any]:
+    """
+    The n most frequent values of a payload field in the range (end_date is inclusive).
 
-    # Apply date filters
-    if start_date:
-        query = query.filter(models.Event.timestamp >= start_date)
+    Answered from the Space-Saving summaries unless `exact` is set. Estimated
+    counts are upper bounds and `count - error` is a lower bound.
+    """
+    stop = rollups.inclusive_stop(end_date)
+    if exact:
+        values = await topk.exact_top(db, field, n, start=start_date, stop=stop)
+        return {
+            "field": field,
+            "exact": True,
+            "items": [{"value": value, "count": count, "error": 0} for value, count in values],
+        }
 
-    if end_date:
-        query = query.filter(models.Event.timestamp <= end_date)
+    summary = await topk.top(db, field, start=start_date, stop=stop)
+    return {
+        "field": field,
+        "exact": False,
+        "items": [{"value": value, "count": count, "error": error} for value, count, error in summary.top(n)],
+    }
 
-    # Group by event_type
-    results = query.group_by(models.Event.event_type).all()
+@metrics.timed_db
+async def get_location_heatmap(
+    db: AsyncSession,
+    precision: int,
+    bbox: Optional[geohash.BBox] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    max_cells: int = 10000
+) -> Dict[str, Any]:
+    """
+    Location event counts per geohash cell in the range (end_date is inclusive).
+
+    With a bounding box, every cell overlapping it is counted whole. Raises
+    heatmap.TooManyCells past max_cells.
+    """
+    counts = await heatmap.cell_counts(
+        db, precision, bbox=bbox, start=start_date, stop=rollups.inclusive_stop(end_date), max_cells=max_cells
+    )
+    cells = []
+    for cell, count in counts:
+        latitude, longitude = geohash.center(cell)
+        cells.append({"geohash": cell, "latitude": latitude, "longitude": longitude, "count": count})
+    return {
+        "precision": precision,
+        "bbox": list(bbox) if bbox is not None else None,
+        "total": sum(count for _, count in counts),
+        "cells": cells,
+    }
 
-    # Convert to dictionary with default values
-    counts = {"view": 0, "click": 0, "location": 0}
+def encode_cursor(timestamp: datetime, event_id: str) -> str:
+    """Opaque page cursor for the (timestamp, event_id) position of the last returned event"""
+    raw = json.dumps([timestamp.isoformat(), event_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    for event_type, count in results:
-        counts[event_type] = count
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, event_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), str(event_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
 
-    return counts
+def select_events():
+    """Select (event_id, user_id, event_type, timestamp, payload) with user_id resolved from users"""
+    return select(
+        models.Event.event_id,
+        models.User.user_id,
+        models.Event.event_type,
+        models.Event.timestamp,
+        models.Event.payload
+    ).join(models.User, models.User.id == models.Event.user_key)
 
-def get_events(
-    db: Session,
-    skip: int = 0,
+def user_key_of(user_id: str):
+    """Scalar subquery for a user's surrogate key, keeping (user_key, timestamp) index scans"""
+    return select(models.User.id).where(models.User.user_id == user_id).scalar_subquery()
+
+@metrics.timed_db
+async def get_events(
+    db: AsyncSession,
     limit: int = 100,
+    cursor: Optional[str] = None,
     user_id: Optional[str] = None,
     event_type: Optional[str] = None
-):
-    """Get events with pagination and optional filtering"""
-    query = db.query(models.Event)
+) -> Tuple[List[Row], Optional[str]]:
+    """
+    Get a page of events, newest first, with optional filtering.
+
+    Pages are keyset-paginated on (timestamp, event_id): the cursor marks the
+    last event of the previous page, so every page is an index range scan no
+    matter how deep it is. Returns the events and the cursor for the next page.
+    """
+    query = select_events()
 
     if user_id:
-        query = query.filter(models.Event.user_id == user_id)
+        query = query.where(models.Event.user_key == user_key_of(user_id))
 
     if event_type:
-        query = query.filter(models.Event.event_type == event_type)
+        query = query.where(models.Event.event_type == event_type)
+
+    stop = None
+    if cursor:
+        after_timestamp, after_event_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.Event.timestamp, models.Event.event_id) < tuple_(
+                literal(after_timestamp, models.Event.timestamp.type),
+                literal(after_event_id, models.Event.event_id.type)
+            )
+        )
+        stop = rollups.inclusive_stop(after_timestamp)
+
+    query = query.order_by(models.Event.timestamp.desc(), models.Event.event_id.desc())
+    events: List[Row] = []
+    # Newest partition first, until the page (plus one row to tell whether there is a next) is full
+    for routed in await partitions.route(db, query, stop=stop, newest_first=True):
+        events.extend((await db.execute(routed.limit(limit + 1 - len(events)))).all())
+        if len(events) > limit:
+            break
+
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1].timestamp, events[-1].event_id)
+
+    return events, next_cursor
+
+async def stream_event_rows(
+    db: AsyncSession,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    chunk_size: int = 10000
+) -> AsyncIterator[List[Tuple[str, str, str, datetime, str]]]:
+    """
+    Stream (event_id, user_id, event_type, timestamp, payload) tuples in time order.
+
+    Rows are fetched through a server-side cursor in chunks of `chunk_size`
+    without building ORM objects (end_date is inclusive).
+    """
+    query = select_events()
+
+    if event_type:
+        query = query.where(models.Event.event_type == event_type)
+
+    if start_date:
+        query = query.where(models.Event.timestamp >= start_date)
+
+    if end_date:
+        query = query.where(models.Event.timestamp <= end_date)
+
+    query = query.order_by(models.Event.timestamp).execution_options(yield_per=chunk_size)
+
+    for routed in await partitions.route(db, query, start_date, rollups.inclusive_stop(end_date)):
+        result = await db.stream(routed)
+        async for chunk in result.partitions():
+            yield [tuple(row) for row in chunk]
+
+@metrics.timed_db
+async def get_user_key(db: AsyncSession, user_id: str) -> Optional[int]:
+    """The user's surrogate key, or None if the user has no events"""
+    if user_id in _user_keys:
+        return _user_keys[user_id]
+    return (await db.execute(select(models.User.id).where(models.User.user_id == user_id))).scalar()
+
+async def stream_user_sessions(
+    db: AsyncSession,
+    user_key: int,
+    gap_seconds: float,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    chunk_size: int = 10000
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream a user's sessions in time order (end_date is inclusive)"""
+    async for session in sessions.user_sessions(
+        db,
+        user_key,
+        gap_seconds,
+        start=start_date,
+        stop=rollups.inclusive_stop(end_date),
+        chunk_size=chunk_size
+    ):
+        yield session
 
-    return query.offset(skip).limit(limit).all()
+@metrics.timed_db
+async def get_event_by_id(db: AsyncSession, event_id: str):
+    """
+    Get a specific event by ID.
 
-def get_event_by_id(db: Session, event_id: str):
-    """Get a specific event by ID"""
-    return db.query(models.Event).filter(models.Event.event_id == event_id).first()
+    A UUIDv7 carries the millisecond its event was stored at, so only that
+    partition is searched; other IDs are looked up in every partition.
+    """
+    try:
+        parsed = uuid.UUID(event_id)
+    except ValueError:
+        return None
+    query = select_events().where(models.Event.event_id == str(parsed))
+    created = models.uuid7_time(parsed)
+    stop = created + timedelta(milliseconds=1) if created is not None else None
+    for routed in await partitions.route(db, query, created, stop, newest_first=True):
+        row = (await db.execute(routed)).first()
+        if row is not None:
+            return row
+    return None
@@ -1,15 +1,168 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from typing import List, Tuple
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./analytics.db"
+from sqlalchemy import event, inspect, make_url
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False
-)
+from . import config
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Plain driver-less URLs are mapped onto their async drivers
+_ASYNC_DRIVERS = {
+    "sqlite://": "sqlite+aiosqlite://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+}
+
+def async_database_url(url: str) -> str:
+    """Return the URL with an async driver, e.g. sqlite:// -> sqlite+aiosqlite://"""
+    for prefix, async_prefix in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+SQLALCHEMY_DATABASE_URL = async_database_url(config.DATABASE_URL)
+
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+def is_file_sqlite(url: str) -> bool:
+    """True for SQLite URLs backed by a file (in-memory databases cannot be shared across pools)"""
+    if not url.startswith("sqlite"):
+        return False
+    database = make_url(url).database
+    return bool(database) and database != ":memory:" and "mode=memory" not in url
+
+def sqlite_pragmas(read_only: bool = False) -> List[str]:
+    """PRAGMAs run on every new connection under the tuned SQLite profile"""
+    if config.SQLITE_SYNCHRONOUS not in _SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(_SYNCHRONOUS_LEVELS)}")
+    pragmas = [
+        # Only takes effect on a new database; lets dropped partitions give their pages back
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        # Readers see a snapshot and never block the writer (or vice versa)
+        "PRAGMA journal_mode = WAL",
+        f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size = {config.SQLITE_MMAP_SIZE}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{config.SQLITE_CACHE_SIZE_KIB}",
+        "PRAGMA temp_store = MEMORY",
+        f"PRAGMA busy_timeout = {config.SQLITE_BUSY_TIMEOUT_MS}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    return pragmas
+
+def _apply_pragmas(engine: AsyncEngine, pragmas: List[str]) -> None:
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+def _create_engines(url: str) -> Tuple[AsyncEngine, AsyncEngine]:
+    """
+    Build the (reader, writer) engines.
+
+    Under the tuned SQLite profile reads get a pool of query-only connections
+    and writes share a single connection, so commits are serialized in the
+    pool instead of contending for SQLite's write lock. Elsewhere both roles
+    use the same engine.
+    """
+    if config.SQLITE_PROFILE not in ("tuned", "default"):
+        raise ValueError("SQLITE_PROFILE must be 'tuned' or 'default'")
+
+    if is_file_sqlite(url) and config.SQLITE_PROFILE == "tuned":
+        writer = create_async_engine(url, echo=config.DATABASE_ECHO, pool_size=1, max_overflow=0)
+        reader = create_async_engine(
+            url,
+            echo=config.DATABASE_ECHO,
+            pool_size=config.SQLITE_READER_POOL_SIZE,
+            max_overflow=0
+        )
+        _apply_pragmas(writer, sqlite_pragmas())
+        _apply_pragmas(reader, sqlite_pragmas(read_only=True))
+        return reader, writer
+
+    options = {}
+    if not url.startswith("sqlite"):
+        options = {
+            "pool_size": config.DATABASE_POOL_SIZE,
+            "max_overflow": config.DATABASE_MAX_OVERFLOW,
+            "pool_pre_ping": True,
+        }
+    shared = create_async_engine(url, echo=config.DATABASE_ECHO, **options)
+    return shared, shared
+
+engine, writer_engine = _create_engines(SQLALCHEMY_DATABASE_URL)
+
+# Sessions for reads; writes go through WriterSession
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+WriterSession = async_sessionmaker(bind=writer_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+async def dispose_engines() -> None:
+    await engine.dispose()
+    if writer_engine is not engine:
+        await writer_engine.dispose()
 
 Base = declarative_base()
+
+def dialect_insert(db: AsyncSession):
+    """The dialect's insert() construct, which supports ON CONFLICT clauses"""
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(f"Upserts are not implemented for {dialect}")
+    return insert
+
+class LegacySchemaError(RuntimeError):
+    """Raised when the events table predates the current schema and needs a migration script"""
+
+def is_legacy_schema(sync_conn) -> bool:
+    """True when the events table stores user_id strings instead of user_key references"""
+    inspector = inspect(sync_conn)
+    if not inspector.has_table("events"):
+        return False
+    return "user_id" in {column["name"] for column in inspector.get_columns("events")}
+
+def missing_event_columns(sync_conn) -> List[str]:
+    """Columns of the events model that an existing events table lacks"""
+    from . import models
+
+    inspector = inspect(sync_conn)
+    if not inspector.has_table("events"):
+        return []
+    existing = {column["name"] for column in inspector.get_columns("events")}
+    return [column.name for column in models.Event.__table__.columns if column.name not in existing]
+
+def sqlite_create_index(index) -> str:
+    """CREATE INDEX statement for scripts that build indexes themselves after a bulk load"""
+    return str(CreateIndex(index).compile(dialect=sqlite.dialect()))
+
+def sqlite_create_table(table, if_not_exists: bool = False) -> str:
+    """CREATE TABLE statement, without indexes, for scripts that create partitions over sqlite3"""
+    return str(CreateTable(table, if_not_exists=if_not_exists).compile(dialect=sqlite.dialect()))
+
+async def init_db() -> None:
+    """Create any missing tables"""
+    from . import models, partitions  # noqa: F401 - models registers the tables on Base.metadata
+
+    async with writer_engine.begin() as conn:
+        if await conn.run_sync(is_legacy_schema):
+            raise LegacySchemaError(
+                "The events table uses the legacy schema; run scripts/migrate_compact_storage.py first"
+            )
+        missing = await conn.run_sync(missing_event_columns)
+        if missing:
+            raise LegacySchemaError(
+                f"The events table lacks the payload columns {', '.join(missing)}; "
+                "run scripts/migrate_payload_columns.py first"
+            )
+        await conn.run_sync(Base.metadata.create_all)
+        layout_error = await conn.run_sync(partitions.layout_error)
+        if layout_error:
+            raise LegacySchemaError(layout_error)
@@ -0,0 +1,446 @@
+"""
+Durable append-only ingest log.
+
+POST /events appends each validated event to a local log and answers 202
+once the record is on disk, without waiting for the database. Appends that
+arrive while a group of records is being written and synced go out together
+with the next fsync, so one fsync covers every request waiting on it and no
+request waits for more than about two.
+
+The log is a directory of numbered segment files (0000000000.log, ...). A
+record is a 4-byte big-endian length, the CRC-32 of the body, and the body:
+the event row as JSON. A new segment is started when the current one reaches
+INGEST_LOG_SEGMENT_BYTES, and on every start.
+
+A materializer task reads the synced records in batches of INGEST_BATCH_SIZE
+and inserts the events, rollups, sketches and top-value summaries in the
+same transaction as its checkpoint (the segment and offset of the next
+record, in ingest_log_checkpoints). Each record is applied exactly once:
+after a crash, replay resumes from the checkpoint committed with the last
+applied batch. Segments are deleted once the checkpoint has moved past them.
+While the database is slow or down the materializer retries with backoff and
+the log keeps accepting events, up to INGEST_LOG_MAX_LAG_BYTES not yet
+applied.
+
+`unapplied_since` gives the timestamp of the oldest event not yet applied,
+so the analytics cache never treats a range that still has events waiting
+in the log as closed.
+
+On start the last segment is cut back to its last complete record, since a
+crash can leave a partly written one behind. Only one process can have the
+log open; several API workers share it through the writer process (see
+app/writer.py).
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import make_url, select
+
+from . import config, crud, metrics, models
+from .cache import analytics_cache
+from .database import SQLALCHEMY_DATABASE_URL, WriterSession, dialect_insert, is_file_sqlite
+from .ingest import IngestClosed, IngestQueueFull
+from .live import live_counts
+
+logger = logging.getLogger(__name__)
+
+_RECORD_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".log"
+# Key of this log's row in ingest_log_checkpoints
+LOG_NAME = "events"
+
+@dataclass(frozen=True, order=True)
+class Position:
+    """A byte offset in a numbered segment"""
+    segment: int
+    offset: int
+
+# fdatasync skips the metadata flush fsync does; not every platform has it
+_sync = getattr(os, "fdatasync", os.fsync)
+
+def log_directory(url: str = SQLALCHEMY_DATABASE_URL, setting: str = config.INGEST_LOG_DIR) -> Optional[str]:
+    """Where the ingest log lives, None when it is off"""
+    if setting.lower() == "none":
+        return None
+    if setting:
+        return setting
+    if is_file_sqlite(url):
+        return f"{make_url(url).database}-ingest-log"
+    return None
+
+def encode_record(row: Dict[str, Any]) -> bytes:
+    body = json.dumps(
+        {**row, "timestamp": models.to_epoch_micros(row["timestamp"])}, separators=(",", ":")
+    ).encode()
+    return _RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+def decode_record(body: bytes) -> Dict[str, Any]:
+    row = json.loads(body)
+    row["timestamp"] = models.from_epoch_micros(row["timestamp"])
+    return row
+
+def iter_records(f: BinaryIO, offset: int, end: int) -> Iterator[Tuple[bytes, int]]:
+    """(body, offset after it) for each intact record between offset and end; stops at the first damaged one"""
+    f.seek(offset)
+    while offset < end:
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return
+        length, checksum = _RECORD_HEADER.unpack(header)
+        if offset + _RECORD_HEADER.size + length > end:
+            return
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) != checksum:
+            return
+        offset += _RECORD_HEADER.size + length
+        yield body, offset
+
+@metrics.timed_db
+async def apply_logged_rows(rows: List[Dict[str, Any]], checkpoint: Position) -> None:
+    """Insert logged rows and move the checkpoint past them, in one transaction"""
+    async with WriterSession() as db:
+        try:
+            await crud.add_event_rows(db, rows)
+            statement = dialect_insert(db)(models.IngestLogCheckpoint).values(
+                log=LOG_NAME, segment=checkpoint.segment, segment_offset=checkpoint.offset
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[models.IngestLogCheckpoint.log],
+                set_={"segment": statement.excluded.segment, "segment_offset": statement.excluded.segment_offset}
+            ))
+            with metrics.COMMIT_SECONDS.time():
+                await db.commit()
+        except Exception:
+            crud.forget_write_state()
+            raise
+    analytics_cache.invalidate_open()
+    live_counts.add_rows(rows)
+
+async def load_checkpoint() -> Optional[Position]:
+    async with WriterSession() as db:
+        row = (await db.execute(
+            select(models.IngestLogCheckpoint.segment, models.IngestLogCheckpoint.segment_offset)
+            .where(models.IngestLogCheckpoint.log == LOG_NAME)
+        )).first()
+    return Position(*row) if row is not None else None
+
+class EventLog:
+    """
+    Segmented log of accepted events, synced in groups and applied to the database in the background.
+
+    `append` has the signature of a batch writer: it returns once the rows
+    are durable. `on_apply` is called with every batch of rows the
+    materializer commits.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = config.INGEST_LOG_SEGMENT_BYTES,
+        max_lag_bytes: int = config.INGEST_LOG_MAX_LAG_BYTES,
+        fsync: bool = config.INGEST_LOG_FSYNC,
+        batch_size: int = config.INGEST_BATCH_SIZE,
+        on_apply: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_lag_bytes = max_lag_bytes
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.on_apply = on_apply
+
+        self._fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._segment = 0
+        self._segment_size = 0
+        # End of the synced records, and the next record to apply
+        self._durable = Position(0, 0)
+        self._applied = Position(0, 0)
+        self._lag_bytes = 0
+        # (end of a synced group, its oldest event timestamp) for the groups not yet fully applied
+        self._unapplied: Deque[Tuple[Position, datetime]] = deque()
+
+        self._pending: List[Tuple[bytes, int, datetime, asyncio.Future]] = []
+        self._has_pending = asyncio.Event()
+        self._synced = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._materializer: Optional[asyncio.Task] = None
+        self._closed = True
+
+        self.appended_events = 0
+        self.applied_events = 0
+        self.rejected = 0
+        self.syncs = 0
+        self.apply_failures = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:010d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[:-len(_SEGMENT_SUFFIX)].isdigit()
+        )
+
+    async def start(self) -> None:
+        """Recover the log, start a new segment and start the writer and materializer tasks"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock()
+        checkpoint = await load_checkpoint()
+        await asyncio.to_thread(self._recover, checkpoint)
+        self._stopping.clear()
+        self._closed = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._materializer = asyncio.create_task(self._materialize_loop())
+        if self._lag_bytes:
+            logger.info("Replaying ingest log", extra={"from": self._applied, "to": self._durable, "bytes": self._lag_bytes})
+
+    async def stop(self) -> None:
+        """Sync every accepted append and stop after the batch being applied; the rest is replayed on start"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        self._has_pending.set()
+        self._synced.set()
+        await self._flusher
+        await self._materializer
+        os.close(self._fd)
+        self._fd = None
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    def _lock(self) -> None:
+        fd = os.open(os.path.join(self.directory, "LOCK"), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(
+                f"The ingest log in {self.directory} is open in another process; "
+                "run several workers with `python -m app.serve` or set INGEST_LOG_DIR=none"
+            ) from None
+        self._lock_fd = fd
+
+    def _recover(self, checkpoint: Optional[Position]) -> None:
+        segments = self._segments()
+        applied = checkpoint or Position(segments[0] if segments else 0, 0)
+        for segment in segments:
+            if segment < applied.segment:
+                os.remove(self._path(segment))
+        segments = [segment for segment in segments if segment >= applied.segment]
+
+        if segments:
+            last = self._path(segments[-1])
+            with open(last, "rb", buffering=1 << 20) as f:
+                size = os.fstat(f.fileno()).st_size
+                end = 0
+                for _, end in iter_records(f, 0, size):
+                    pass
+            if end < size:
+                logger.warning(
+                    "Cutting incomplete records from the ingest log",
+                    extra={"segment": segments[-1], "offset": end, "bytes": size - end}
+                )
+                os.truncate(last, end)
+
+        self._applied = applied
+        self._lag_bytes = sum(os.path.getsize(self._path(segment)) for segment in segments) - (
+            applied.offset if applied.segment in segments else 0
+        )
+        self._open_segment(max(segments[-1] if segments else 0, applied.segment) + 1)
+        self._unapplied.clear()
+        oldest = self._first_timestamp(segments, applied)
+        if oldest is not None:
+            self._unapplied.append((self._durable, oldest))
+
+    def _first_timestamp(self, segments: List[int], applied: Position) -> Optional[datetime]:
+        """Timestamp of the first record left to replay; records are appended in timestamp order"""
+        for segment in segments:
+            offset = applied.offset if segment == applied.segment else 0
+            with open(self._path(segment), "rb") as f:
+                for body, _ in iter_records(f, offset, os.fstat(f.fileno()).st_size):
+                    return decode_record(body)["timestamp"]
+        return None
+
+    def _open_segment(self, segment: int) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self._path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._segment = segment
+        self._segment_size = os.fstat(self._fd).st_size
+        if self.fsync:
+            # The new file's directory entry must survive a crash too
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self._durable = Position(segment, self._segment_size)
+
+    async def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Log rows, returning once they are synced to disk"""
+        if self._closed:
+            raise IngestClosed("Ingest log is not running")
+        if self._lag_bytes > self.max_lag_bytes:
+            self.rejected += len(rows)
+            raise IngestQueueFull("Ingest log is too far ahead of the database")
+
+        future = asyncio.get_running_loop().create_future()
+        oldest = min(row["timestamp"] for row in rows)
+        self._pending.append((b"".join(encode_record(row) for row in rows), len(rows), oldest, future))
+        self._has_pending.set()
+        await future
+
+    def _write(self, data: bytes) -> Position:
+        """Append one group of records and sync it; runs in a worker thread, the only one touching the file"""
+        if self._segment_size >= self.segment_bytes:
+            self._open_segment(self._segment + 1)
+        view = memoryview(data)
+        written = 0
+        try:
+            while written < len(data):
+                written += os.write(self._fd, view[written:])
+            if self.fsync:
+                _sync(self._fd)
+        except OSError:
+            # Never leave part of a failed group in front of the records that follow
+            os.ftruncate(self._fd, self._segment_size)
+            raise
+        self._segment_size += len(data)
+        return Position(self._segment, self._segment_size)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            self._has_pending.clear()
+            group, self._pending = self._pending, []
+            if group:
+                await self._flush_group(group)
+            # stop() wakes this loop once; whatever was appended before it has been written by now
+            if self._closed and not self._pending:
+                return
+
+    async def _flush_group(self, group: List[Tuple[bytes, int, datetime, asyncio.Future]]) -> None:
+        data = b"".join(records for records, _, _, _ in group)
+        try:
+            with metrics.INGEST_LOG_SYNC_SECONDS.time():
+                durable = await asyncio.to_thread(self._write, data)
+        except OSError as e:
+            logger.error("Failed to write %d events to the ingest log: %s", sum(n for _, n, _, _ in group), e)
+            for _, _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._durable = durable
+        self._lag_bytes += len(data)
+        self._unapplied.append((durable, min(oldest for _, _, oldest, _ in group)))
+        self.syncs += 1
+        for _, count, _, future in group:
+            self.appended_events += count
+            if not future.done():
+                future.set_result(None)
+        self._synced.set()
+
+    def _read_batch(self, start: Position, durable: Position) -> Tuple[List[Dict[str, Any]], Position, int]:
+        """Up to batch_size synced records from start, the position after them and the bytes they took"""
+        sealed = start.segment < durable.segment
+        path = self._path(start.segment)
+        if sealed and not os.path.exists(path):
+            # Never written: a start after the log directory was cleared
+            return [], Position(start.segment + 1, 0), 0
+
+        bodies = []
+        offset = start.offset
+        with open(path, "rb", buffering=1 << 20) as f:
+            end = os.fstat(f.fileno()).st_size if sealed else durable.offset
+            for body, offset in iter_records(f, start.offset, end):
+                bodies.append(body)
+                if len(bodies) >= self.batch_size:
+                    break
+
+        if not bodies:
+            if not sealed:
+                raise RuntimeError(f"Damaged record in the open ingest log segment {start.segment} at {offset}")
+            if offset < end:
+                logger.error(
+                    "Skipping damaged ingest log records",
+                    extra={"segment": start.segment, "offset": offset, "bytes": end - offset}
+                )
+            return [], Position(start.segment + 1, 0), end - start.offset
+        return [decode_record(body) for body in bodies], Position(start.segment, offset), offset - start.offset
+
+    async def _materialize_loop(self) -> None:
+        failures = 0
+        while not self._closed:
+            if self._applied >= self._durable:
+                self._synced.clear()
+                await self._synced.wait()
+                continue
+
+            try:
+                rows, position, consumed = await asyncio.to_thread(self._read_batch, self._applied, self._durable)
+                if rows:
+                    await apply_logged_rows(rows, position)
+            except Exception as e:
+                failures += 1
+                self.apply_failures += 1
+                delay = min(30.0, 0.1 * 2 ** min(failures, 9))
+                logger.error("Failed to apply the ingest log, retrying in %.1fs: %s", delay, e)
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+                continue
+
+            failures = 0
+            if position.segment != self._applied.segment:
+                for segment in self._segments():
+                    if segment < position.segment:
+                        os.remove(self._path(segment))
+            self._applied = position
+            self._lag_bytes -= consumed
+            while self._unapplied and self._unapplied[0][0] <= position:
+                self._unapplied.popleft()
+            if not self._lag_bytes:
+                # A recovered backlog is marked at the start of the segment opened after it
+                self._unapplied.clear()
+            self.applied_events += len(rows)
+            if rows and self.on_apply is not None:
+                self.on_apply(rows)
+
+    @property
+    def lag_bytes(self) -> int:
+        return self._lag_bytes
+
+    def unapplied_since(self) -> Optional[datetime]:
+        """Timestamp of the oldest logged event not yet in the database, None when all are applied"""
+        return self._unapplied[0][1] if self._unapplied else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Log positions, lag and sync counters"""
+        return {
+            "running": not self._closed,
+            "directory": self.directory,
+            "durable": [self._durable.segment, self._durable.offset],
+            "applied": [self._applied.segment, self._applied.offset],
+            "lag_bytes": self._lag_bytes,
+            "unapplied_since": self.unapplied_since(),
+            "appended_events": self.appended_events,
+            "applied_events": self.applied_events,
+            "rejected": self.rejected,
+            "syncs": self.syncs,
+            "avg_events_per_sync": round(self.appended_events / self.syncs, 2) if self.syncs else 0.0,
+            "apply_failures": self.apply_failures,
+        }
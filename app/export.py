@@ -0,0 +1,37 @@
+import csv
+import io
+import json
+from typing import Sequence
+
+EXPORT_COLUMNS = ("event_id", "user_id", "event_type", "timestamp", "payload")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def encode_ndjson(rows: Sequence) -> bytes:
+    """
+    Encode (event_id, user_id, event_type, timestamp, payload) rows as NDJSON.
+
+    The stored payload is already JSON text, so it is spliced in as-is rather
+    than parsed and re-serialized.
+    """
+    dumps = json.dumps
+    return "".join(
+        f'{{"event_id":{dumps(event_id)},"user_id":{dumps(user_id)},"event_type":{dumps(event_type)},'
+        f'"timestamp":"{timestamp.isoformat()}","payload":{payload}}}\n'
+        for event_id, user_id, event_type, timestamp, payload in rows
+    ).encode()
+
+def encode_csv(rows: Sequence, header: bool = False) -> bytes:
+    """Encode rows as CSV, optionally preceded by the header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(
+        (event_id, user_id, event_type, timestamp.isoformat(), payload)
+        for event_id, user_id, event_type, timestamp, payload in rows
+    )
+    return buffer.getvalue().encode()
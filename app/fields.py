@@ -0,0 +1,134 @@
+"""
+Typed columns extracted from event payloads.
+
+The per-type payload fields (see `schemas.ViewPayload`, `ClickPayload` and
+`LocationPayload`) are copied into nullable columns of the events table when
+an event is written, so they can be indexed and filtered on without parsing
+the JSON. Location events also get the geohash of their coordinates. The
+payload itself is stored unchanged.
+
+Analytics filtered on an extracted field cannot use the rollup tables, so
+they are counted from the event partitions covering the range through the
+field's (field, timestamp) index instead.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, distinct, false, func, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import geohash, models, partitions
+from .rollups import BUCKET_WIDTHS, EVENT_TYPES, zero_fill
+
+# Extracted fields per event type
+EVENT_FIELDS = {
+    "view": ("url", "title"),
+    "click": ("element_id",),
+    "location": ("latitude", "longitude", "accuracy"),
+}
+
+# Columns derived from the extracted fields rather than copied from the payload
+DERIVED_COLUMNS = ("geohash",)
+
+COLUMNS = tuple(field for names in EVENT_FIELDS.values() for field in names) + DERIVED_COLUMNS
+
+# Event type each extracted field belongs to
+FIELD_EVENT_TYPES = {field: event_type for event_type, names in EVENT_FIELDS.items() for field in names}
+
+NUMERIC_FIELDS = {"latitude", "longitude", "accuracy"}
+
+# Indexed fields the analytics endpoints accept as filters
+FILTER_FIELDS = ("url", "element_id")
+
+def extract(event_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Column values for a payload; fields of other event types, and malformed values, are None"""
+    values = dict.fromkeys(COLUMNS)
+    for field in EVENT_FIELDS.get(event_type, ()):
+        value = payload.get(field)
+        if field in NUMERIC_FIELDS:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[field] = float(value)
+        elif isinstance(value, str):
+            values[field] = value
+    if event_type == "location":
+        values["geohash"] = location_geohash(values["latitude"], values["longitude"])
+    return values
+
+def location_geohash(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    """Stored geohash of a location, None unless both coordinates are valid"""
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return geohash.encode(latitude, longitude)
+
+def extract_json(event_type: str, payload: str) -> Dict[str, Any]:
+    """Like extract, for a payload still in its stored JSON form"""
+    try:
+        decoded = json.loads(payload)
+    except ValueError:
+        decoded = None
+    return extract(event_type, decoded if isinstance(decoded, dict) else {})
+
+def _filtered(query, filters: Dict[str, str], event_type: Optional[str], start: Optional[datetime], stop: Optional[datetime]):
+    for field, value in filters.items():
+        query = query.where(getattr(models.Event, field) == value)
+    # A field filter already implies its event type, and an explicit event_type term
+    # could lead the planner to (event_type, timestamp) instead of the field's index
+    if event_type and any(FIELD_EVENT_TYPES[field] != event_type for field in filters):
+        query = query.where(false())
+    if start is not None:
+        query = query.where(models.Event.timestamp >= start)
+    if stop is not None:
+        query = query.where(models.Event.timestamp < stop)
+    return query
+
+async def count_by_type(
+    db: AsyncSession,
+    filters: Dict[str, str],
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    event_type: Optional[str] = None
+) -> Dict[str, int]:
+    """Count events matching every filter per event_type in [start, stop)"""
+    counts = {name: 0 for name in EVENT_TYPES}
+    query = _filtered(select(models.Event.event_type, func.count()), filters, event_type, start, stop)
+    for routed in await partitions.route(db, query.group_by(models.Event.event_type), start, stop):
+        for name, count in (await db.execute(routed)).all():
+            counts[name] += int(count)
+    return counts
+
+async def timeseries(
+    db: AsyncSession,
+    filters: Dict[str, str],
+    granularity: str,
+    start: datetime,
+    stop: datetime,
+    event_type: Optional[str] = None
+) -> List[Tuple[datetime, int]]:
+    """Zero-filled counts per bucket of the events matching every filter in [start, stop)"""
+    width = BUCKET_WIDTHS[granularity] // timedelta(microseconds=1)
+    # Buckets are computed on the stored epoch microseconds; minutes, hours and days all align to the epoch
+    bucket = type_coerce(models.Event.timestamp, BigInteger) // width * width
+    query = _filtered(select(bucket, func.count()), filters, event_type, start, stop)
+    counts: Dict[datetime, int] = {}
+    for routed in await partitions.route(db, query.group_by(bucket), start, stop):
+        for micros, count in (await db.execute(routed)).all():
+            key = models.from_epoch_micros(int(micros))
+            counts[key] = counts.get(key, 0) + int(count)
+    return zero_fill(counts, granularity, start, stop)
+
+async def unique_users(
+    db: AsyncSession,
+    filters: Dict[str, str],
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    event_type: Optional[str] = None
+) -> int:
+    """COUNT(DISTINCT user_key) over the events matching every filter in [start, stop)"""
+    query = _filtered(select(models.Event.user_key), filters, event_type, start, stop)
+    queries = await partitions.route(db, query, start, stop)
+    if not queries:
+        return 0
+    user_keys = partitions.combine(queries)
+    return int((await db.execute(select(func.count(distinct(user_keys.c.user_key))))).scalar() or 0)
@@ -0,0 +1,135 @@
+"""
+Geohash encoding of latitude/longitude points.
+
+A geohash of precision p interleaves 5 * p bits, longitude first, each bit
+halving the remaining longitude or latitude interval, and writes them in
+base 32. Every cell of precision p is split into 32 cells of precision
+p + 1 that share its geohash as a prefix, so the hashes of the points in a
+cell form one contiguous range of a sorted index.
+
+Points are encoded by quantizing both coordinates to integers and spreading
+their bits apart with masks, and cells decoded by the reverse, rather than
+bisecting bit by bit.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+
+ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_VALUES = {char: value for value, char in enumerate(ALPHABET)}
+
+# Precision of the geohash stored per location event, cells of about 4.8m x 4.8m
+PRECISION = 9
+
+# (west, south, east, north) in degrees
+BBox = Tuple[float, float, float, float]
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """(longitude bits, latitude bits) of a precision"""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+def _spread(value: int) -> int:
+    """Move bit k of a 32-bit integer to bit 2k"""
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+def _compact(value: int) -> int:
+    """Inverse of _spread: gather the even bits of value into a 32-bit integer"""
+    value &= 0x5555555555555555
+    value = (value | (value >> 1)) & 0x3333333333333333
+    value = (value | (value >> 2)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value >> 4)) & 0x00FF00FF00FF00FF
+    value = (value | (value >> 8)) & 0x0000FFFF0000FFFF
+    return (value | (value >> 16)) & 0x00000000FFFFFFFF
+
+def _quantize(value: float, low: float, span: float, bits: int) -> int:
+    """Index of the interval holding value when [low, low + span] is cut into 2**bits"""
+    index = int((value - low) / span * (1 << bits))
+    return min(max(index, 0), (1 << bits) - 1)
+
+def _cell(lon_index: int, lat_index: int, precision: int) -> str:
+    """Geohash of the cell at the given quantized longitude and latitude"""
+    lon_bits, lat_bits = _bits(precision)
+    if lon_bits == lat_bits:
+        code = (_spread(lon_index) << 1) | _spread(lat_index)
+    else:
+        code = _spread(lon_index) | (_spread(lat_index) << 1)
+    return "".join(ALPHABET[(code >> shift) & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    """Geohash of a point"""
+    lon_bits, lat_bits = _bits(precision)
+    return _cell(
+        _quantize(longitude, -180.0, 360.0, lon_bits),
+        _quantize(latitude, -90.0, 180.0, lat_bits),
+        precision
+    )
+
+def bounds(geohash: str) -> BBox:
+    """(west, south, east, north) of a geohash cell"""
+    code = 0
+    for char in geohash:
+        code = (code << 5) | _VALUES[char]
+    lon_bits, lat_bits = _bits(len(geohash))
+    if lon_bits == lat_bits:
+        lon_index, lat_index = _compact(code >> 1), _compact(code)
+    else:
+        lon_index, lat_index = _compact(code), _compact(code >> 1)
+    lon_width, lat_width = 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+    west, south = -180.0 + lon_index * lon_width, -90.0 + lat_index * lat_width
+    return west, south, west + lon_width, south + lat_width
+
+def center(geohash: str) -> Tuple[float, float]:
+    """(latitude, longitude) of a cell's center"""
+    west, south, east, north = bounds(geohash)
+    return (south + north) / 2, (west + east) / 2
+
+def intersects(geohash: str, bbox: BBox) -> bool:
+    """True when the cell overlaps the bounding box (edges included)"""
+    west, south, east, north = bounds(geohash)
+    return west <= bbox[2] and east >= bbox[0] and south <= bbox[3] and north >= bbox[1]
+
+def _index_ranges(bbox: BBox, precision: int) -> Tuple[range, range]:
+    lon_bits, lat_bits = _bits(precision)
+    west, south, east, north = bbox
+    return (
+        range(_quantize(west, -180.0, 360.0, lon_bits), _quantize(east, -180.0, 360.0, lon_bits) + 1),
+        range(_quantize(south, -90.0, 180.0, lat_bits), _quantize(north, -90.0, 180.0, lat_bits) + 1),
+    )
+
+def cell_count(bbox: BBox, precision: int) -> int:
+    """Number of cells of the precision covering the bounding box"""
+    lon_range, lat_range = _index_ranges(bbox, precision)
+    return len(lon_range) * len(lat_range)
+
+def cover(bbox: BBox, precision: int) -> Iterator[str]:
+    """The cells of the precision covering the bounding box"""
+    lon_range, lat_range = _index_ranges(bbox, precision)
+    for lon_index in lon_range:
+        for lat_index in lat_range:
+            yield _cell(lon_index, lat_index, precision)
+
+def successor(prefix: str) -> Optional[str]:
+    """The next cell of the same precision in hash order, None after the last one"""
+    chars = list(prefix)
+    for position in range(len(chars) - 1, -1, -1):
+        value = _VALUES[chars[position]]
+        if value < 31:
+            chars[position] = ALPHABET[value + 1]
+            return "".join(chars)
+        chars[position] = ALPHABET[0]
+    return None
+
+def prefix_ranges(prefixes: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """Merge prefixes into sorted [low, high) ranges of hashes; high None means unbounded"""
+    ranges: List[Tuple[str, Optional[str]]] = []
+    for prefix in sorted(set(prefixes)):
+        high = successor(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((prefix, high))
+    return ranges
@@ -0,0 +1,113 @@
+"""
+Location event counts per geohash cell.
+
+Every location event stores the geohash of its coordinates (see
+`fields.extract`), indexed by a partial (geohash, timestamp) index holding
+only location rows. The hashes of one cell are a contiguous run of that
+index, so a heatmap is a skip-scan: a recursive CTE seeks from each cell to
+the first hash past it, and each cell is counted as an index range. Per
+index entry SQLite only compares keys, which is several times faster than
+grouping every entry by substr(geohash, 1, precision), and one row per
+cell reaches Python.
+
+A bounding box becomes a few ranges of hash prefixes: the cells covering it
+at the finest precision that needs at most MAX_SCAN_RANGES of them, merged
+where they are adjacent in hash order. Cells scanned from those ranges that
+fall outside the box are dropped afterwards.
+
+Each event partition overlapping the time range is scanned on its own and
+the counts of a cell found in several are summed.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import String, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import geohash, models, partitions
+
+# Upper bound on the prefix ranges a bounding box is turned into
+MAX_SCAN_RANGES = 256
+
+class TooManyCells(ValueError):
+    """The query would return more cells than allowed"""
+
+def scan_ranges(bbox: geohash.BBox, precision: int) -> List[Tuple[str, Optional[str]]]:
+    """[low, high) geohash ranges covering the bounding box"""
+    coarse = 1
+    for candidate in range(precision, 0, -1):
+        if geohash.cell_count(bbox, candidate) <= MAX_SCAN_RANGES:
+            coarse = candidate
+            break
+    return geohash.prefix_ranges(list(geohash.cover(bbox, coarse)))
+
+def _range_query(
+    precision: int,
+    low: Optional[str],
+    high: Optional[str],
+    start: Optional[datetime],
+    stop: Optional[datetime]
+):
+    """
+    (cell, count) of the cells with hashes in [low, high), in hash order.
+
+    Cells holding events only outside [start, stop) come back with a zero
+    count; filtering them in SQL would evaluate every count twice.
+    """
+    column = models.Event.geohash
+    # Every stored hash of a cell sorts at or below the cell followed by 'z's
+    last_suffix = "z" * (geohash.PRECISION - precision)
+
+    def bounded(query):
+        query = query.where(column >= low) if low is not None else query.where(column.is_not(None))
+        return query.where(column < high) if high is not None else query
+
+    def cell_of(value):
+        return func.substr(value, 1, precision, type_=String)
+
+    cells = bounded(select(cell_of(func.min(column)).label("cell"))).cte("cells", recursive=True)
+    next_cell = bounded(
+        select(cell_of(column)).where(column > cells.c.cell.concat(last_suffix)).order_by(column).limit(1)
+    ).scalar_subquery()
+    cells = cells.union_all(select(next_cell).where(cells.c.cell.is_not(None)))
+
+    count = select(func.count()).where(column >= cells.c.cell, column <= cells.c.cell.concat(last_suffix))
+    if start is not None:
+        count = count.where(models.Event.timestamp >= start)
+    if stop is not None:
+        count = count.where(models.Event.timestamp < stop)
+
+    return select(cells.c.cell, count.scalar_subquery()).where(cells.c.cell.is_not(None))
+
+async def cell_counts(
+    db: AsyncSession,
+    precision: int,
+    bbox: Optional[geohash.BBox] = None,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    max_cells: int = 10000
+) -> List[Tuple[str, int]]:
+    """(geohash, count) of location events per cell of the precision in [start, stop), in hash order"""
+    ranges = scan_ranges(bbox, precision) if bbox is not None else [(None, None)]
+    counts: Dict[str, int] = {}
+    for low, high in ranges:
+        for routed in await partitions.route(db, _range_query(precision, low, high, start, stop), start, stop):
+            # Streamed, so the scan stops as soon as the result is known to be too large
+            result = await db.stream(routed)
+            try:
+                async for chunk in result.partitions(1000):
+                    for cell, count in chunk:
+                        if count:
+                            counts[cell] = counts.get(cell, 0) + int(count)
+                    if len(counts) > max_cells:
+                        raise TooManyCells(
+                            f"More than {max_cells} cells; lower the precision or narrow the bounding box"
+                        )
+            finally:
+                await result.close()
+
+    rows = sorted(counts.items())
+    if bbox is None:
+        return rows
+    return [(cell, count) for cell, count in rows if geohash.intersects(cell, bbox)]
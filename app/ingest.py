@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from . import config, crud
+from .cache import analytics_cache
+from .database import WriterSession
+from .live import live_counts
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue has no room for another event"""
+
+class IngestClosed(Exception):
+    """Raised when an event is submitted after the buffer has been stopped"""
+
+async def write_event_rows(rows: List[Dict[str, Any]]) -> None:
+    """Persist a batch of event rows in one transaction"""
+    async with WriterSession() as db:
+        await crud.insert_event_rows(db, rows)
+    # Cached answers for ranges that include "now" no longer match the database
+    analytics_cache.invalidate_open()
+    live_counts.add_rows(rows)
+
+class IngestBuffer:
+    """
+    Bounded in-process queue drained by a background writer.
+
+    Events are accepted into the queue by the request handlers and written
+    by a single task in batches of up to `batch_size` rows, or whatever has
+    arrived within `flush_interval_ms` of the first queued row. A batch that
+    fails to write is retried `flush_retries` times with backoff before it is
+    dropped; the queue fills up meanwhile and new events get IngestQueueFull.
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[List[Dict[str, Any]]], Awaitable[None]] = write_event_rows,
+        max_queue: int = config.INGEST_QUEUE_SIZE,
+        batch_size: int = config.INGEST_BATCH_SIZE,
+        flush_interval_ms: float = config.INGEST_FLUSH_INTERVAL_MS,
+        enqueue_timeout_ms: float = config.INGEST_ENQUEUE_TIMEOUT_MS,
+        flush_retries: int = config.INGEST_FLUSH_RETRIES
+    ):
+        self.writer = writer
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.flush_retries = flush_retries
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = True
+
+        self.accepted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_events = 0
+        self.failed_events = 0
+        self.flush_retries_total = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    async def start(self) -> None:
+        """Start the background writer task"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop accepting events and flush everything still queued"""
+        if self._closed:
+            return
+        self._closed = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def put(self, row: Dict[str, Any]) -> None:
+        """Queue a row for writing, applying backpressure when the queue is full"""
+        if self._closed:
+            raise IngestClosed("Ingest buffer is not running")
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            if self.enqueue_timeout <= 0:
+                self.rejected += 1
+                raise IngestQueueFull("Ingest queue is full")
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise IngestQueueFull("Ingest queue is full")
+
+        self.accepted += 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and flush latency counters"""
+        return {
+            "running": not self._closed,
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self.max_queue,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events,
+            "failed_events": self.failed_events,
+            "flush_retries": self.flush_retries_total,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                await self.writer(batch)
+                break
+            except Exception as e:
+                if attempt >= self.flush_retries:
+                    self.failed_events += len(batch)
+                    logger.error("Dropping %d events after %d failed flushes: %s", len(batch), attempt + 1, e)
+                    return
+                delay = min(5.0, 0.1 * 2 ** attempt)
+                attempt += 1
+                self.flush_retries_total += 1
+                logger.warning("Failed to flush %d events, retrying in %.1fs: %s", len(batch), delay, e)
+                await asyncio.sleep(delay)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_events += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
@@ -0,0 +1,193 @@
+"""
+Live event counts pushed to dashboards over Server-Sent Events.
+
+Each API process keeps one LiveCounts aggregate: the total events per
+event_type and per-minute counts for the last LIVE_WINDOW_MINUTES. It is
+loaded from the rollup tables at startup and then kept current from every
+commit: the ingest writer, the ingest log materializer and POST /events/batch
+report what they committed, and workers hear about the other workers'
+commits from the writer process (see app/writer.py).
+
+Deltas are gathered for LIVE_PUSH_INTERVAL_MS, encoded once and put on every
+subscriber's queue, so an open dashboard costs one queue put per push and no
+database queries, however many are open. A subscriber that falls too far
+behind is closed; its browser reconnects and starts from a new snapshot.
+
+Events later removed by partition retention still count towards the totals
+until the process restarts.
+"""
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from . import config, models, rollups
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Pushes a subscriber may have waiting before it is closed as too slow
+SUBSCRIBER_QUEUE_SIZE = 64
+
+# (event_type, minute bucket start) -> events committed
+Deltas = Dict[Tuple[str, datetime], int]
+
+class TooManySubscribers(Exception):
+    """Raised when LIVE_MAX_SUBSCRIBERS streams are already open"""
+
+def count_rows(rows: Iterable[Dict[str, Any]]) -> Deltas:
+    deltas: Deltas = defaultdict(int)
+    for row in rows:
+        deltas[(row["event_type"], rollups.bucket_floor(row["timestamp"], "minute"))] += 1
+    return dict(deltas)
+
+def format_message(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+def _bucket_list(buckets: Dict[datetime, Dict[str, int]]) -> List[Dict[str, Any]]:
+    return [
+        {"bucket_start": bucket.isoformat(), "counts": counts}
+        for bucket, counts in sorted(buckets.items())
+    ]
+
+class LiveCounts:
+    """Totals per event_type and recent per-minute counts, fanned out to subscriber queues"""
+
+    def __init__(
+        self,
+        window_minutes: int = config.LIVE_WINDOW_MINUTES,
+        push_interval_ms: int = config.LIVE_PUSH_INTERVAL_MS,
+        max_subscribers: int = config.LIVE_MAX_SUBSCRIBERS
+    ):
+        self.window = timedelta(minutes=window_minutes)
+        self.push_interval = push_interval_ms / 1000
+        self.max_subscribers = max_subscribers
+
+        self.totals: Dict[str, int] = {name: 0 for name in models.EVENT_TYPES}
+        self.buckets: Dict[datetime, Dict[str, int]] = {}
+        self._pending: Deltas = defaultdict(int)
+        self._has_pending = asyncio.Event()
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        self.pushes = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def start(self) -> None:
+        """Load the counts from the rollup tables and start pushing"""
+        now = datetime.utcnow()
+        since = rollups.bucket_floor(now, "minute") - self.window + timedelta(minutes=1)
+        model = models.EventRollupMinute
+        async with SessionLocal() as db:
+            totals = await rollups.count_by_type(db)
+            recent = (await db.execute(
+                select(model.event_type, model.bucket_start, model.count).where(model.bucket_start >= since)
+            )).all()
+        self.totals.update(totals)
+        self.buckets = {}
+        for event_type, bucket, count in recent:
+            self.buckets.setdefault(bucket, {})[event_type] = int(count)
+        self._task = asyncio.create_task(self._push_loop())
+
+    async def stop(self) -> None:
+        """Stop pushing and close every open stream"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        for queue in list(self._subscribers):
+            self._close(queue)
+
+    def add(self, deltas: Deltas) -> None:
+        """Record committed events; they reach subscribers with the next push"""
+        if self._task is None:
+            # Nothing is pushed from this process (e.g. the writer process)
+            return
+        for key, count in deltas.items():
+            self._pending[key] += count
+        self._has_pending.set()
+
+    def add_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        if self._task is not None:
+            self.add(count_rows(rows))
+
+    def subscribe(self) -> asyncio.Queue:
+        """A queue of encoded SSE messages, starting with a snapshot; None marks the end of the stream"""
+        if len(self._subscribers) >= self.max_subscribers:
+            raise TooManySubscribers(f"{self.max_subscribers} live streams are already open")
+        queue: asyncio.Queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        queue.put_nowait(format_message("snapshot", self.snapshot()))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "totals": self.totals,
+            "bucket_seconds": 60,
+            "window_minutes": int(self.window.total_seconds() // 60),
+            "buckets": _bucket_list(self.buckets),
+        }
+
+    def _close(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def _push_loop(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            # Let more commits arrive so they go out together
+            await asyncio.sleep(self.push_interval)
+            self._has_pending.clear()
+            pending, self._pending = self._pending, defaultdict(int)
+            self._push(pending)
+
+    def _push(self, pending: Deltas) -> None:
+        totals: Dict[str, int] = defaultdict(int)
+        buckets: Dict[datetime, Dict[str, int]] = {}
+        oldest = rollups.bucket_floor(datetime.utcnow(), "minute") - self.window + timedelta(minutes=1)
+        for (event_type, bucket), count in pending.items():
+            totals[event_type] += count
+            self.totals[event_type] = self.totals.get(event_type, 0) + count
+            if bucket >= oldest:
+                counts = self.buckets.setdefault(bucket, {})
+                counts[event_type] = counts.get(event_type, 0) + count
+                delta = buckets.setdefault(bucket, {})
+                delta[event_type] = delta.get(event_type, 0) + count
+        for bucket in [bucket for bucket in self.buckets if bucket < oldest]:
+            del self.buckets[bucket]
+
+        message = format_message("delta", {"totals": totals, "buckets": _bucket_list(buckets)})
+        self.pushes += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped_subscribers += 1
+                logger.warning("Closing a live stream that fell behind")
+                self._close(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscribers),
+            "pushes": self.pushes,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+live_counts = LiveCounts()
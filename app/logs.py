@@ -0,0 +1,148 @@
+"""
+Logging setup for the service.
+
+Handlers never run on the event loop: the root logger gets a QueueHandler
+that only enqueues records, and a QueueListener thread formats and writes
+them. Records are enqueued unformatted, so message arguments are only
+rendered if the record is actually written; when the queue is full, records
+are dropped and counted instead of blocking the request.
+
+Per-event logs go through `event_logger`, which samples before a record is
+even created, so at LOG_EVENT_SAMPLE_RATE = 0.01 only one in a hundred
+ingested events pays for logging at all.
+
+Output is one JSON object per line by default (LOG_FORMAT=json), with any
+`extra=` fields as top-level keys; LOG_FORMAT=text gives plain lines with
+the same fields appended as key=value.
+"""
+
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TextIO
+
+from . import config
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """The structured fields attached to a record with extra="""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extra fields and any traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+class TextFormatter(logging.Formatter):
+    """Plain lines with extra fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+FORMATTERS = {
+    "json": JsonFormatter,
+    "text": TextFormatter,
+}
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops records when the queue is full"""
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener lives in this process, so the record can cross the queue as is
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class SampledLogger(logging.LoggerAdapter):
+    """Logger adapter that lets through only a `rate` fraction of calls, decided before any record is built"""
+
+    def __init__(self, logger: logging.Logger, rate: float):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        if self.rate <= 0 or not self.logger.isEnabledFor(level):
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+    def process(self, msg, kwargs):
+        # Keep the call's own extra fields; the base class would replace them with the adapter's
+        return msg, kwargs
+
+# Per-event ingest logs, sampled at LOG_EVENT_SAMPLE_RATE
+event_logger = SampledLogger(logging.getLogger("app.events"), config.LOG_EVENT_SAMPLE_RATE)
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+def configure(
+    level: str = config.LOG_LEVEL,
+    log_format: str = config.LOG_FORMAT,
+    event_sample_rate: float = config.LOG_EVENT_SAMPLE_RATE,
+    queue_size: int = config.LOG_QUEUE_SIZE,
+    stream: Optional[TextIO] = None
+) -> None:
+    """Route the root logger through the queue to a listener thread; replaces any earlier configure()"""
+    global _handler, _listener
+    shutdown()
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(FORMATTERS[log_format]())
+    record_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _handler = DroppingQueueHandler(record_queue)
+    _listener = QueueListener(record_queue, output, respect_handler_level=True)
+
+    # Debug output from libraries (aiosqlite logs every operation) is never wanted; ours may be
+    numeric_level = logging.getLevelName(level.upper())
+    logging.getLogger("app").setLevel(numeric_level)
+    root = logging.getLogger()
+    root.setLevel(max(numeric_level, logging.INFO))
+    root.addHandler(_handler)
+    event_logger.rate = event_sample_rate
+    _listener.start()
+
+def shutdown() -> None:
+    """Write out every queued record and detach the queue handler"""
+    global _handler, _listener
+    if _listener is not None:
+        _listener.stop()
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+    _handler, _listener = None, None
+
+def stats() -> Dict[str, Any]:
+    """Queue depth and records dropped because the queue was full"""
+    if _handler is None:
+        return {"queue_depth": 0, "dropped": 0}
+    return {"queue_depth": _handler.queue.qsize(), "dropped": _handler.dropped}
@@ -1,22 +1,92 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Any, Awaitable, Callable, Dict, Hashable, List
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from . import crud, models, schemas
-from .database import SessionLocal, engine
-
-models.Base.metadata.create_all(bind=engine)
+from . import bulk, config, crud, eventlog, export, geohash, heatmap, live, logs, metrics, partitions, rollups, schemas, sessions, topk, writer
+from .cache import analytics_cache
+from .database import (
+    SQLALCHEMY_DATABASE_URL, SessionLocal, dispose_engines, engine, is_file_sqlite, writer_engine
+)
+from .ingest import IngestBuffer, IngestClosed, IngestQueueFull, write_event_rows
+from .live import live_counts
+from .logs import event_logger
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# With INGEST_WRITER_SOCKET set this process is one of several API workers and the writer process commits
+writer_client = writer.WriterClient() if config.INGEST_WRITER_SOCKET else None
+write_rows = writer_client.write if writer_client is not None else write_event_rows
+ingest_buffer = IngestBuffer(writer=write_rows)
+
+# With the ingest log on, POST /events answers once the event is durable in the log, kept here or by the writer process
+ingest_log_directory = eventlog.log_directory()
+event_log = eventlog.EventLog(ingest_log_directory) if ingest_log_directory and writer_client is None else None
+if not ingest_log_directory:
+    append_rows = None
+elif writer_client is not None:
+    append_rows = writer_client.append
+    analytics_cache.unapplied_since = writer_client.unapplied_since
+else:
+    append_rows = event_log.append
+    analytics_cache.unapplied_since = event_log.unapplied_since
+
+# Series recorded on every ingested event, looked up once
+_validate_event = metrics.VALIDATION_SECONDS.labels("events")
+_validate_batch_event = metrics.VALIDATION_SECONDS.labels("events_batch")
+_events_accepted = metrics.INGESTED_EVENTS.labels("accepted")
+_events_invalid = metrics.INGESTED_EVENTS.labels("invalid")
+_events_rejected = metrics.INGESTED_EVENTS.labels("rejected")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logs.configure()
+    if writer_client is None:
+        await writer.prepare_database()
+        # Before anything is written, so the live counts see every commit after their snapshot
+        await live_counts.start()
+        if event_log is not None:
+            # Replays whatever the last run left unapplied
+            await event_log.start()
+        maintenance = asyncio.create_task(partitions.maintenance_loop())
+    else:
+        # The writer process owns the schema, the backfills and partition maintenance;
+        # it has them ready once it listens, so connect before reading the live snapshot
+        await writer_client.connect()
+        await live_counts.start()
+        maintenance = None
+    await ingest_buffer.start()
+    try:
+        yield
+    finally:
+        await live_counts.stop()
+        if maintenance is not None:
+            maintenance.cancel()
+            with suppress(asyncio.CancelledError):
+                await maintenance
+        if event_log is not None:
+            await event_log.stop()
+        # Flush whatever is still queued before the process exits
+        await ingest_buffer.stop()
+        if writer_client is not None:
+            await writer_client.close()
+        await dispose_engines()
+        logs.shutdown()
+
 app = FastAPI(
     title="Web Analytics Event Service",
     description="A robust backend service to collect, store, and provide aggregated analytics for user interaction events",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -26,47 +96,446 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Added last so it wraps everything, CORS included
+app.add_middleware(metrics.MetricsMiddleware)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-@app.post("/events", status_code=status.HTTP_202_ACCEPTED)
-async def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
+def parse_datetime_param(value: Optional[str], name: str, end_of_day: bool = False) -> Optional[datetime]:
+    """
+    Parse a YYYY-MM-DD date or an ISO-8601 datetime query parameter into naive UTC.
+
+    A bare date used as an end bound covers the whole day.
+    """
+    if value is None:
+        return None
+    try:
+        if len(value) == 10:
+            parsed = datetime.strptime(value, "%Y-%m-%d")
+            if end_of_day:
+                parsed += timedelta(days=1) - timedelta(microseconds=1)
+            return parsed
+
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid {name} format. Use YYYY-MM-DD or an ISO-8601 datetime"
+        )
+
+def parse_bbox_param(value: Optional[str]) -> Optional[geohash.BBox]:
+    """Parse a west,south,east,north bounding box query parameter in degrees"""
+    if value is None:
+        return None
+    try:
+        west, south, east, north = (float(part) for part in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid bbox. Use west,south,east,north in degrees")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid bbox. Longitudes must be within [-180, 180] and latitudes within [-90, 90], with west <= east and south <= north"
+        )
+    return west, south, east, north
+
+def payload_filters(url: Optional[str], element_id: Optional[str]) -> Dict[str, str]:
+    """Filters on extracted payload fields given to an analytics endpoint"""
+    return {field: value for field, value in (("url", url), ("element_id", element_id)) if value is not None}
+
+async def cached_json_response(
+    request: Request,
+    key: Hashable,
+    end: Optional[datetime],
+    compute: Callable[[], Awaitable[Any]]
+) -> Response:
+    """
+    Serve an analytics result from the query cache, computing it on a miss.
+
+    Responses carry an ETag so clients can revalidate with If-None-Match and
+    get a 304. Closed historical ranges are cacheable by the browser for a day;
+    ranges that include "now" must be revalidated on every use.
+
+    `compute` may return already encoded JSON bytes, which skips
+    jsonable_encoder for large results made only of JSON types.
+    """
+    entry = analytics_cache.get(key)
+    if entry is None:
+        result = await compute()
+        with metrics.SERIALIZATION_SECONDS.time():
+            body = result if isinstance(result, bytes) else JSONResponse(content=jsonable_encoder(result)).body
+        entry = analytics_cache.put(key, body, closed=analytics_cache.is_closed(end))
+
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "public, max-age=86400" if entry.expires_at is None else "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@app.post(
+    "/events",
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": schemas.event_create_schema()}},
+    }}
+)
+async def create_event(request: Request):
     """
     Ingest a new user activity event from the client.
 
+    With the ingest log on (the default for a SQLite file database), a 202 means
+    the event has been synced to the log and will be loaded into the database by
+    the background materializer; otherwise it was queued for the background
+    ingest writer. Either way it may not be queryable yet.
+
     - **user_id**: String identifier for the user
     - **event_type**: Type of event (view, click, location)
     - **payload**: Event-specific data based on event_type
     """
+    # Validate the raw body in one pass instead of letting FastAPI decode it to a dict first
+    body = await request.body()
+    try:
+        decompressor = bulk.body_decompressor(request.headers.get("content-encoding"))
+        if decompressor is not None:
+            body = bulk.decompress_body(body, decompressor)
+    except bulk.UnsupportedEncoding as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except bulk.BulkParseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        with _validate_event.time():
+            event = schemas.parse_event_json(body)
+    except ValidationError as e:
+        _events_invalid.inc()
+        raise RequestValidationError([
+            {**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)
+        ])
+
+    try:
+        row = crud.build_event_row(event)
+        if append_rows is not None:
+            await append_rows([row])
+        else:
+            await ingest_buffer.put(row)
+        _events_accepted.inc()
+
+        event_logger.info(
+            "Event queued",
+            extra={"event_id": row["event_id"], "event_type": event.event_type, "user_id": event.user_id}
+        )
+        return {"message": "Event received successfully", "event_id": row["event_id"]}
+
+    except (IngestQueueFull, IngestClosed) as e:
+        _events_rejected.inc()
+        logger.warning("Rejecting event: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest queue is full, retry later",
+            headers={"Retry-After": "1"}
+        )
+    except writer.WriterUnavailable as e:
+        _events_rejected.inc()
+        logger.warning("Rejecting event: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest writer is unavailable, retry later",
+            headers={"Retry-After": "1"}
+        )
+    except ValueError as e:
+        logger.error("Validation error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Internal server error: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.post("/events/batch")
+async def create_events_batch(request: Request):
+    """
+    Ingest many events in one request.
+
+    Accepts a JSON array (`application/json`) or newline-delimited JSON
+    (`application/x-ndjson`), optionally gzip or deflate compressed. The body
+    is decompressed, parsed and validated incrementally, valid events are
+    stored in one transaction per chunk, and every record gets a result in
+    input order: accepted, rejected (invalid, do not resend) or error (could
+    not be stored, resend later). When nothing could be stored the response
+    is a 503 with the same body.
+
+    Like POST /events, with the ingest log on a chunk is accepted once it is
+    synced to the log; otherwise once it is committed.
+    """
     try:
-        logger.info(f"Received event: {event.event_type} for user {event.user_id}")
+        decompressor = bulk.body_decompressor(request.headers.get("content-encoding"))
+    except bulk.UnsupportedEncoding as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    body = request.stream()
+    if decompressor is not None:
+        body = bulk.decompress_stream(body, decompressor)
+
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        records = bulk.iter_ndjson(body)
+    elif content_type == "application/json":
+        records = bulk.iter_json_array(body)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Use application/json (array) or application/x-ndjson"
+        )
 
+    store_rows = append_rows if append_rows is not None else write_rows
+    results: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    accepted = 0
+    failed = 0
+    truncated = False
+    error = None
+
+    async def flush_pending():
+        nonlocal accepted, failed
+        rows = [row for _, row in pending]
+        try:
+            await store_rows(rows)
+        except Exception as e:
+            logger.error("Failed to store batch chunk of %d events: %s", len(rows), e)
+            _events_rejected.inc(len(rows))
+            failed += len(rows)
+            for index, _ in pending:
+                results[index] = {"index": index, "status": "error", "error": "Failed to store event, retry later"}
+        else:
+            accepted += len(rows)
+            _events_accepted.inc(len(rows))
+        pending.clear()
 
-        db_event = crud.create_event(db=db, event=event)
+    try:
+        async for record, parse_error in records:
+            index = len(results)
+            if index >= config.BULK_INGEST_MAX_EVENTS:
+                truncated = True
+                error = f"Batch exceeds {config.BULK_INGEST_MAX_EVENTS} events; remaining records were not read"
+                break
 
-        logger.info(f"Event created with ID: {db_event.event_id}")
-        return {"message": "Event received successfully", "event_id": db_event.event_id}
+            try:
+                if parse_error:
+                    raise ValueError(parse_error)
+                with _validate_batch_event.time():
+                    event = bulk.validate_record(record)
+                row = crud.build_event_row(event)
+            except ValueError as e:
+                _events_invalid.inc()
+                results.append({"index": index, "status": "rejected", "error": str(e)})
+                continue
+
+            results.append({"index": index, "status": "accepted", "event_id": row["event_id"]})
+            pending.append((index, row))
+            if len(pending) >= config.BULK_INGEST_CHUNK_SIZE:
+                await flush_pending()
+
+    except bulk.BulkParseError as e:
+        if not results:
+            raise HTTPException(status_code=400, detail=str(e))
+        truncated = True
+        error = str(e)
+
+    if pending:
+        await flush_pending()
+
+    logger.info("Batch ingest", extra={"received": len(results), "accepted": accepted, "truncated": truncated})
+
+    response = {
+        "received": len(results),
+        "accepted": accepted,
+        "rejected": len(results) - accepted - failed,
+        "failed": failed,
+        "truncated": truncated,
+        "results": results
+    }
+    if error:
+        response["error"] = error
+    if failed and not accepted:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content=response,
+            headers={"Retry-After": "1"}
+        )
+    return response
+
+def to_event_response(db_event) -> schemas.EventResponse:
+    """Convert a stored event into its API representation"""
+    return schemas.EventResponse(
+        event_id=db_event.event_id,
+        user_id=db_event.user_id,
+        event_type=db_event.event_type,
+        timestamp=db_event.timestamp,
+        payload=json.loads(db_event.payload)
+    )
+
+@app.get("/events", response_model=schemas.EventPage)
+async def list_events(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum events per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    user_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List stored events, newest first, with cursor pagination.
 
-    except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
-        raise HTTPException(status_code=400, detail=str(e))
+    - **limit**: Page size (1-1000)
+    - **cursor**: Opaque cursor returned as `next_cursor` by the previous page
+    - **user_id**: Filter by user
+    - **event_type**: Filter by specific event type (view, click, location)
+    """
+    try:
+        if event_type and event_type not in ["view", "click", "location"]:
+            raise HTTPException(status_code=400, detail="Invalid event_type. Must be 'view', 'click', or 'location'")
+
+        try:
+            events, next_cursor = await crud.get_events(
+                db=db,
+                limit=limit,
+                cursor=cursor,
+                user_id=user_id,
+                event_type=event_type
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return schemas.EventPage(items=[to_event_response(e) for e in events], next_cursor=next_cursor)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Internal server error: {str(e)}")
+        logger.error("Error listing events: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/events/export")
+async def export_events(
+    start: Optional[str] = Query(None, description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: Optional[str] = Query(None, description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    format: str = Query("ndjson", description="ndjson or csv"),
+    event_type: Optional[str] = None
+):
+    """
+    Stream stored events in time order as NDJSON or CSV.
+
+    Rows are read through a server-side cursor and written chunk by chunk, so
+    memory stays flat regardless of export size and a slow client slows the
+    database reads down instead of buffering them.
+    """
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'ndjson' or 'csv'")
+
+    if event_type and event_type not in ["view", "click", "location"]:
+        raise HTTPException(status_code=400, detail="Invalid event_type. Must be 'view', 'click', or 'location'")
+
+    start_datetime = parse_datetime_param(start, "start")
+    end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+    async def body():
+        # The session lives as long as the stream, not the request handler
+        async with SessionLocal() as db:
+            first = True
+            async for rows in crud.stream_event_rows(
+                db=db,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                event_type=event_type,
+                chunk_size=config.EXPORT_CHUNK_SIZE
+            ):
+                if format == "csv":
+                    yield export.encode_csv(rows, header=first)
+                else:
+                    yield export.encode_ndjson(rows)
+                first = False
+
+            if first and format == "csv":
+                yield export.encode_csv([], header=True)
+
+    logger.info("Export started", extra={"format": format, "event_type": event_type, "start": start, "end": end})
+
+    return StreamingResponse(
+        body(),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+@app.get("/events/{event_id}", response_model=schemas.EventResponse)
+async def get_event(event_id: str, db: AsyncSession = Depends(get_db)):
+    """Retrieve a single stored event by ID"""
+    db_event = await crud.get_event_by_id(db=db, event_id=event_id)
+    if db_event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return to_event_response(db_event)
+
+@app.get("/users/{user_id}/sessions")
+async def get_user_sessions(
+    user_id: str,
+    gap: float = Query(config.SESSION_GAP_SECONDS, gt=0, description="Inactivity gap in seconds that ends a session"),
+    start: Optional[str] = Query(None, description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: Optional[str] = Query(None, description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Reconstruct a user's sessions from their events, oldest first.
+
+    Consecutive events more than `gap` seconds apart belong to different
+    sessions. Each session reports its start, end, duration, event counts by
+    type and the URLs of its views in order. The response is streamed as the
+    user's events are scanned.
+    """
+    start_datetime = parse_datetime_param(start, "start")
+    end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+    if start_datetime and end_datetime and start_datetime > end_datetime:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    user_key = await crud.get_user_key(db, user_id)
+    if user_key is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    async def body():
+        # The session lives as long as the stream, not the request handler
+        async with SessionLocal() as stream_db:
+            yield f'{{"user_id":{json.dumps(user_id)},"gap_seconds":{json.dumps(gap)},"sessions":['.encode()
+            separator = ""
+            async for session in crud.stream_user_sessions(
+                db=stream_db,
+                user_key=user_key,
+                gap_seconds=gap,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                chunk_size=config.SESSION_CHUNK_SIZE
+            ):
+                yield (separator + sessions.encode_session(session)).encode()
+                separator = ","
+            yield b"]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
 @app.get("/analytics/event-counts")
 async def get_event_counts(
+    request: Request,
     event_type: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    url: Optional[str] = Query(None, description="Only count view events of this page URL"),
+    element_id: Optional[str] = Query(None, description="Only count click events on this element ID"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retrieve the total count of events with optional filtering.
@@ -74,7 +543,10 @@ async def get_event_counts(
     - **event_type**: Filter by specific event type (view, click, location)
     - **start_date**: Filter events on or after this date (YYYY-MM-DD)
     - **end_date**: Filter events on or before this date (YYYY-MM-DD)
+    - **url**: Only count view events of this page URL
+    - **element_id**: Only count click events on this element ID
     """
+    filters = payload_filters(url, element_id)
     try:
 
         if event_type and event_type not in ["view", "click", "location"]:
@@ -99,35 +571,49 @@ async def get_event_counts(
                 raise HTTPException(status_code=400, detail="Invalid end_date format. Use YYYY-MM-DD")
 
 
-        total_count = crud.get_event_count(
-            db=db,
-            event_type=event_type,
-            start_date=start_datetime,
-            end_date=end_datetime
-        )
+        async def compute():
+            total_count = await crud.get_event_count(
+                db=db,
+                event_type=event_type,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                filters=filters
+            )
+
+            logger.debug(
+                "Event count query",
+                extra={"event_type": event_type, "start": start_date, "end": end_date, "filters": filters, "total": total_count}
+            )
 
-        logger.info(f"Event count query: type={event_type}, start={start_date}, end={end_date}, result={total_count}")
+            return {"total_events": total_count}
 
-        return {"total_events": total_count}
+        key = ("event-counts", event_type, start_datetime, end_datetime, tuple(sorted(filters.items())))
+        return await cached_json_response(request, key, end_datetime, compute)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting event counts: {str(e)}")
+        logger.error("Error getting event counts: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/analytics/event-counts-by-type")
 async def get_event_counts_by_type(
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    url: Optional[str] = Query(None, description="Only count view events of this page URL"),
+    element_id: Optional[str] = Query(None, description="Only count click events on this element ID"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retrieve the count of events grouped by event_type with optional filtering.
 
     - **start_date**: Start date for aggregation (YYYY-MM-DD)
     - **end_date**: End date for aggregation (YYYY-MM-DD)
+    - **url**: Only count view events of this page URL
+    - **element_id**: Only count click events on this element ID
     """
+    filters = payload_filters(url, element_id)
     try:
 
         start_datetime = None
@@ -148,22 +634,319 @@ async def get_event_counts_by_type(
                 raise HTTPException(status_code=400, detail="Invalid end_date format. Use YYYY-MM-DD")
 
 
-        counts_by_type = crud.get_event_counts_by_type(
-            db=db,
-            start_date=start_datetime,
-            end_date=end_datetime
-        )
+        async def compute():
+            counts_by_type = await crud.get_event_counts_by_type(
+                db=db,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                filters=filters
+            )
+
+            logger.debug("Event counts by type query", extra={"start": start_date, "end": end_date, "filters": filters})
+
+            return counts_by_type
+
+        key = ("event-counts-by-type", start_datetime, end_datetime, tuple(sorted(filters.items())))
+        return await cached_json_response(request, key, end_datetime, compute)
 
-        logger.info(f"Event counts by type query: start={start_date}, end={end_date}, result={counts_by_type}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting event counts by type: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/analytics/timeseries")
+async def get_timeseries(
+    request: Request,
+    interval: str = Query(..., description="Bucket width: minute, hour or day"),
+    start: str = Query(..., description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: str = Query(..., description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    event_type: Optional[str] = None,
+    url: Optional[str] = Query(None, description="Only count view events of this page URL"),
+    element_id: Optional[str] = Query(None, description="Only count click events on this element ID"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retrieve event counts bucketed by interval, with empty buckets zero-filled.
+
+    - **interval**: minute, hour or day
+    - **start**: Range start; a bare date starts at midnight
+    - **end**: Range end; a bare date covers the whole day
+    - **event_type**: Filter by specific event type (view, click, location)
+    - **url**: Only count view events of this page URL
+    - **element_id**: Only count click events on this element ID
+    """
+    filters = payload_filters(url, element_id)
+    try:
+        if interval not in rollups.BUCKET_WIDTHS:
+            raise HTTPException(status_code=400, detail="Invalid interval. Must be 'minute', 'hour', or 'day'")
+
+        if event_type and event_type not in ["view", "click", "location"]:
+            raise HTTPException(status_code=400, detail="Invalid event_type. Must be 'view', 'click', or 'location'")
+
+        start_datetime = parse_datetime_param(start, "start")
+        end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+        if start_datetime > end_datetime:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+
+        buckets = rollups.bucket_count(interval, start_datetime, rollups.inclusive_stop(end_datetime))
+        if buckets > config.TIMESERIES_MAX_BUCKETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Range spans {buckets} {interval} buckets; the maximum is {config.TIMESERIES_MAX_BUCKETS}"
+            )
+
+        async def compute():
+            series = await crud.get_event_timeseries(
+                db=db,
+                interval=interval,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                event_type=event_type,
+                filters=filters
+            )
+
+            logger.debug(
+                "Timeseries query",
+                extra={"interval": interval, "event_type": event_type, "start": start, "end": end, "filters": filters, "buckets": len(series)}
+            )
+
+            return {
+                "interval": interval,
+                "event_type": event_type,
+                "start": start_datetime,
+                "end": end_datetime,
+                "buckets": [{"bucket_start": bucket, "count": count} for bucket, count in series]
+            }
+
+        key = ("timeseries", interval, event_type, start_datetime, end_datetime, tuple(sorted(filters.items())))
+        return await cached_json_response(request, key, end_datetime, compute)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting timeseries: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/analytics/unique-users")
+async def get_unique_users(
+    request: Request,
+    event_type: Optional[str] = None,
+    start: Optional[str] = Query(None, description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: Optional[str] = Query(None, description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    exact: bool = Query(False, description="Count exactly by scanning events instead of merging sketches"),
+    url: Optional[str] = Query(None, description="Only count view events of this page URL"),
+    element_id: Optional[str] = Query(None, description="Only count click events on this element ID"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retrieve the number of distinct users with events in a range.
+
+    - **event_type**: Filter by specific event type (view, click, location)
+    - **start**: Range start; a bare date starts at midnight
+    - **end**: Range end; a bare date covers the whole day
+    - **exact**: Skip the HyperLogLog estimate and scan the events table
+    - **url**: Only count view events of this page URL
+    - **element_id**: Only count click events on this element ID
+
+    Filtered counts are always exact.
+    """
+    filters = payload_filters(url, element_id)
+    try:
+        if event_type and event_type not in ["view", "click", "location"]:
+            raise HTTPException(status_code=400, detail="Invalid event_type. Must be 'view', 'click', or 'location'")
+
+        start_datetime = parse_datetime_param(start, "start")
+        end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+        if start_datetime and end_datetime and start_datetime > end_datetime:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+
+        async def compute():
+            result = await crud.get_unique_users(
+                db=db,
+                event_type=event_type,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                exact=exact,
+                filters=filters
+            )
+
+            logger.debug(
+                "Unique users query",
+                extra={"event_type": event_type, "start": start, "end": end, "exact": exact, "filters": filters, "unique_users": result["unique_users"]}
+            )
+
+            return result
+
+        key = ("unique-users", event_type, start_datetime, end_datetime, exact, tuple(sorted(filters.items())))
+        return await cached_json_response(request, key, end_datetime, compute)
 
-        return counts_by_type
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting unique users: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/analytics/top")
+async def get_top_values(
+    request: Request,
+    field: str = Query(..., description="url (view events) or element_id (click events)"),
+    n: int = Query(20, ge=1, le=config.TOPK_CAPACITY, description="Number of values to return"),
+    start: Optional[str] = Query(None, description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: Optional[str] = Query(None, description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    exact: bool = Query(False, description="Count exactly by scanning events instead of merging summaries"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retrieve the most frequent page URLs or clicked element IDs in a range.
+
+    - **field**: `url` or `element_id`
+    - **n**: Number of values, most frequent first
+    - **start**: Range start; a bare date starts at midnight
+    - **end**: Range end; a bare date covers the whole day
+    - **exact**: Skip the Space-Saving summaries and scan the events table
+    """
+    try:
+        if field not in topk.FIELDS:
+            raise HTTPException(status_code=400, detail="Invalid field. Must be 'url' or 'element_id'")
+
+        start_datetime = parse_datetime_param(start, "start")
+        end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+        if start_datetime and end_datetime and start_datetime > end_datetime:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+
+        async def compute():
+            result = await crud.get_top_values(
+                db=db,
+                field=field,
+                n=n,
+                start_date=start_datetime,
+                end_date=end_datetime,
+                exact=exact
+            )
+
+            logger.debug("Top values query", extra={"field": field, "n": n, "start": start, "end": end, "exact": exact})
+
+            return result
+
+        key = ("top", field, n, start_datetime, end_datetime, exact)
+        return await cached_json_response(request, key, end_datetime, compute)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting top values: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/analytics/locations/heatmap")
+async def get_location_heatmap(
+    request: Request,
+    precision: int = Query(5, ge=1, le=geohash.PRECISION, description="Geohash length of the cells"),
+    bbox: Optional[str] = Query(None, description="Bounding box as west,south,east,north in degrees"),
+    start: Optional[str] = Query(None, description="Range start (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    end: Optional[str] = Query(None, description="Range end (YYYY-MM-DD or ISO-8601 datetime), inclusive"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retrieve location event counts per geohash cell.
+
+    - **precision**: Geohash length of the cells, 1 (continents) to 9 (a few meters)
+    - **bbox**: Only cells overlapping this box; each cell is counted whole
+    - **start**: Range start; a bare date starts at midnight
+    - **end**: Range end; a bare date covers the whole day
+    """
+    try:
+        bounding_box = parse_bbox_param(bbox)
+        start_datetime = parse_datetime_param(start, "start")
+        end_datetime = parse_datetime_param(end, "end", end_of_day=True)
+
+        if start_datetime and end_datetime and start_datetime > end_datetime:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+
+        async def compute():
+            try:
+                result = await crud.get_location_heatmap(
+                    db=db,
+                    precision=precision,
+                    bbox=bounding_box,
+                    start_date=start_datetime,
+                    end_date=end_datetime,
+                    max_cells=config.HEATMAP_MAX_CELLS
+                )
+            except heatmap.TooManyCells as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            logger.debug(
+                "Heatmap query",
+                extra={"precision": precision, "bbox": bbox, "start": start, "end": end, "cells": len(result["cells"])}
+            )
+
+            # Up to HEATMAP_MAX_CELLS plain dicts: encode directly rather than walking them with jsonable_encoder
+            return json.dumps(result, separators=(",", ":")).encode()
+
+        key = ("heatmap", precision, bounding_box, start_datetime, end_datetime)
+        return await cached_json_response(request, key, end_datetime, compute)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting event counts by type: {str(e)}")
+        logger.error("Error getting location heatmap: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/analytics/stream")
+async def stream_analytics():
+    """
+    Live event counts as Server-Sent Events.
+
+    The stream starts with a `snapshot` event: total events per event_type and
+    per-minute counts for the last LIVE_WINDOW_MINUTES. Each `delta` event
+    then carries the counts committed since the previous one. Every open stream
+    is fed from the same in-memory aggregate, so streams cost no queries.
+    Streams end after LIVE_STREAM_MAX_SECONDS; EventSource reconnects on its
+    own and starts again from a snapshot.
+    """
+    if live_counts.subscriber_count >= live_counts.max_subscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many live streams are open, retry later",
+            headers={"Retry-After": "5"}
+        )
+
+    async def body():
+        try:
+            queue = live_counts.subscribe()
+        except live.TooManySubscribers:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.LIVE_STREAM_MAX_SECONDS
+        try:
+            # Reconnect after one second instead of the browser's default
+            yield b"retry: 1000\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    message = await asyncio.wait_for(queue.get(), min(remaining, config.LIVE_KEEPALIVE_SECONDS))
+                except asyncio.TimeoutError:
+                    # Keeps idle connections from being closed by proxies
+                    yield b": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            live_counts.unsubscribe(queue)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -177,7 +960,29 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "ingest": ingest_buffer.stats(),
+        "ingest_writer": writer_client.stats() if writer_client is not None else None,
+        "ingest_log": event_log.stats() if event_log is not None else None,
+        "live": live_counts.stats(),
+        "cache": analytics_cache.stats(),
+        "logging": logs.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    metrics.INGEST_QUEUE_DEPTH.set(ingest_buffer.queue_depth)
+    metrics.LIVE_SUBSCRIBERS.set(live_counts.subscriber_count)
+    if event_log is not None:
+        metrics.INGEST_LOG_LAG_BYTES.set(event_log.lag_bytes)
+    database_files = metrics.sqlite_files(SQLALCHEMY_DATABASE_URL) if is_file_sqlite(SQLALCHEMY_DATABASE_URL) else None
+    engines = {"reader": engine, "writer": writer_engine} if writer_engine is not engine else {"shared": engine}
+    async with SessionLocal() as db:
+        await metrics.collect_database_gauges(db, engines, database_files)
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
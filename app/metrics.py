@@ -0,0 +1,335 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python numbers updated from the
+event loop thread, so recording needs no locks: a counter increment is one
+addition and a histogram observation one bisect into fixed bucket bounds
+plus two additions. Labeled series are created on first use and cached, and
+hot paths keep a reference to their series instead of looking it up per
+call. Bucket counts are stored per bucket and only made cumulative when
+`/metrics` renders them.
+
+Gauges that need the database (row count, file size) are set by
+`collect_database_gauges` right before rendering, so they cost nothing
+between scrapes.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from . import partitions, rollups
+
+# Seconds; from 100us up to 10s, enough resolution for both parse times and slow queries
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._series[()] = self._new_series()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The series for these label values, created on first use"""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            series = self._series[values] = self._new_series()
+        return series
+
+    def _samples(self, labels: str, series) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in self._series.items():
+            lines.extend(self._samples(_label_text(self.labelnames, values), series))
+        return lines
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+
+    kind = "counter"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._series[()].value += amount
+
+    def _samples(self, labels: str, series: _Value) -> List[str]:
+        return [f"{self.name}{labels} {_format_value(series.value)}"]
+
+class Gauge(_Metric):
+    """Value that can go up and down, set when it is known"""
+
+    kind = "gauge"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._series[()].value = value
+
+    def _samples(self, labels: str, series: _Value) -> List[str]:
+        return [f"{self.name}{labels} {_format_value(series.value)}"]
+
+class _Timer:
+    __slots__ = ("series", "started")
+
+    def __init__(self, series: "_HistogramSeries"):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.series.observe(time.perf_counter() - self.started)
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # counts[i] holds observations in (bounds[i - 1], bounds[i]]; the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager observing the seconds spent in its block"""
+        return _Timer(self)
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._series[()].observe(value)
+
+    def time(self) -> _Timer:
+        return self._series[()].time()
+
+    def _samples(self, labels: str, series: _HistogramSeries) -> List[str]:
+        # Bucket samples add an le label to the series' own labels
+        prefix = labels[:-1] + "," if labels else "{"
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), series.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{prefix}le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum{labels} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    """The metrics exposed together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to respond to HTTP requests", ("method", "route", "status")
+))
+VALIDATION_SECONDS = REGISTRY.register(Histogram(
+    "event_validation_seconds", "Time to validate one ingested event", ("endpoint",)
+))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "db_operation_seconds", "Time spent in crud database calls", ("operation",)
+))
+COMMIT_SECONDS = REGISTRY.register(Histogram(
+    "db_commit_seconds", "Time to commit a write transaction, including the sync to disk"
+))
+SERIALIZATION_SECONDS = REGISTRY.register(Histogram(
+    "json_serialization_seconds", "Time to encode an analytics response as JSON"
+))
+INGESTED_EVENTS = REGISTRY.register(Counter(
+    "ingest_events_total", "Events submitted for ingest, by outcome", ("outcome",)
+))
+INGEST_LOG_SYNC_SECONDS = REGISTRY.register(Histogram(
+    "ingest_log_sync_seconds", "Time to write and fsync one group of ingest log records"
+))
+INGEST_LOG_LAG_BYTES = REGISTRY.register(Gauge(
+    "ingest_log_lag_bytes", "Ingest log bytes not yet applied to the database"
+))
+INGEST_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ingest_queue_depth", "Events accepted but not yet written"
+))
+LIVE_SUBSCRIBERS = REGISTRY.register(Gauge(
+    "live_subscribers", "Open GET /analytics/stream connections"
+))
+DB_POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "db_pool_connections", "Connections per engine pool and state", ("engine", "state")
+))
+EVENT_ROWS = REGISTRY.register(Gauge(
+    "events_rows", "Events stored, across all partitions"
+))
+EVENT_PARTITIONS = REGISTRY.register(Gauge(
+    "event_partitions", "Tables the events are partitioned into"
+))
+DATABASE_BYTES = REGISTRY.register(Gauge(
+    "database_size_bytes", "On-disk size of the SQLite database, by file", ("file",)
+))
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+def timed_db(function: F) -> F:
+    """Record the time of each call of an async crud function under its name"""
+    series = DB_SECONDS.labels(function.__name__)
+
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            series.observe(time.perf_counter() - started)
+
+    return wrapper  # type: ignore[return-value]
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing request latency per method, route template and status.
+
+    The route is the matched path template (e.g. /events/{event_id}), so
+    series stay bounded; requests matching no route share one series. Only
+    the time to the response start is measured, so streamed bodies count
+    until their headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        responded = False
+
+        def observe(status: int) -> None:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not responded:
+                # Failed before a response started
+                observe(500)
+
+def sqlite_files(url: str) -> Dict[str, str]:
+    """The database file and its WAL file, for file-backed SQLite URLs"""
+    database = make_url(url).database
+    return {"main": database, "wal": f"{database}-wal"}
+
+def observe_pools(engines: Dict[str, AsyncEngine]) -> None:
+    """Set the connection pool gauges from each engine's pool"""
+    for name, engine in engines.items():
+        pool = engine.sync_engine.pool
+        checked_out = getattr(pool, "checkedout", None)
+        if checked_out is None:
+            # Pools without a fixed size (SQLite :memory:) have nothing to report
+            continue
+        DB_POOL_CONNECTIONS.labels(name, "checked_out").set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels(name, "idle").set(pool.checkedin())
+        DB_POOL_CONNECTIONS.labels(name, "size").set(pool.size())
+
+async def collect_database_gauges(
+    db: AsyncSession,
+    engines: Dict[str, AsyncEngine],
+    database_files: Optional[Dict[str, str]] = None
+) -> None:
+    """Refresh the gauges that are read from the database"""
+    observe_pools(engines)
+    # The rollups count every stored event, so this is a small aggregate rather than a table scan
+    EVENT_ROWS.set(sum((await rollups.count_by_type(db)).values()))
+    EVENT_PARTITIONS.set(len(await partitions.list_partitions(db)))
+    for name, path in (database_files or {}).items():
+        DATABASE_BYTES.labels(name).set(os.path.getsize(path) if os.path.exists(path) else 0)
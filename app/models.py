@@ -1,22 +1,194 @@
-from sqlalchemy import Column, String, DateTime, Text, Index, CheckConstraint
-from sqlalchemy.sql import func
+from sqlalchemy import Column, String, Integer, BigInteger, SmallInteger, LargeBinary, Float, Text, Index, CheckConstraint, ForeignKey
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import os
+import uuid
+
 from .database import Base
 
+EVENT_TYPES = ("view", "click", "location")
+EVENT_TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+def to_epoch_micros(value: datetime) -> int:
+    """Naive-UTC (or aware) datetime to integer microseconds since the Unix epoch"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _ONE_MICROSECOND
+
+def from_epoch_micros(value: int) -> datetime:
+    """Integer microseconds since the Unix epoch to a naive-UTC datetime"""
+    return _EPOCH + timedelta(microseconds=value)
+
+_LOW_62 = (1 << 62) - 1
+
+def uuid7(timestamp: datetime) -> str:
+    """Time-ordered UUID (version 7) whose first 48 bits are the timestamp in Unix milliseconds"""
+    rand = int.from_bytes(os.urandom(10), "big") >> 6
+    value = (
+        (to_epoch_micros(timestamp) // 1000) << 80 | 0x7 << 76 | (rand >> 62) << 64 | 0b10 << 62 | rand & _LOW_62
+    )
+    return str(uuid.UUID(int=value))
+
+def uuid7_time(value: uuid.UUID) -> Optional[datetime]:
+    """The millisecond a version 7 UUID was made for, None for other versions"""
+    if value.version != 7:
+        return None
+    return from_epoch_micros((value.int >> 80) * 1000)
+
+class EpochMicros(TypeDecorator):
+    """Datetime stored as a 64-bit integer of microseconds since the epoch"""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_micros(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_epoch_micros(value)
+
+class UUIDBytes(TypeDecorator):
+    """UUID string stored as its 16 raw bytes"""
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return uuid.UUID(value).bytes
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else str(uuid.UUID(bytes=value))
+
+class EventTypeCode(TypeDecorator):
+    """Event type name stored as a small integer code"""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return EVENT_TYPE_CODES[value]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else EVENT_TYPES[value]
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False, unique=True)
+
 class Event(Base):
     __tablename__ = "events"
 
-    event_id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, nullable=False, index=True)
-    event_type = Column(String, nullable=False, index=True)
-    timestamp = Column(DateTime(timezone=True), nullable=False, default=func.now(), index=True)
-    payload = Column(Text, nullable=False)  
+    event_id = Column(UUIDBytes, primary_key=True)
+    user_key = Column(Integer, ForeignKey("users.id"), nullable=False)
+    event_type = Column(EventTypeCode, nullable=False)
+    timestamp = Column(EpochMicros, nullable=False)
+    payload = Column(Text, nullable=False)
 
+    # Payload fields extracted on write (see app/fields.py); NULL for other event types
+    url = Column(Text)
+    title = Column(Text)
+    element_id = Column(Text)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    accuracy = Column(Float)
+    # Geohash of (latitude, longitude) at geohash.PRECISION, so points in a cell sort together
+    geohash = Column(String)
 
+    # Single-column indexes on event_type and user_key are covered by the composites' prefixes.
+    # The payload field indexes are partial, so rows of other event types cost nothing in them.
     __table_args__ = (
         CheckConstraint(
-            event_type.in_(['view', 'click', 'location']),
+            f"event_type BETWEEN 0 AND {len(EVENT_TYPES) - 1}",
             name='check_event_type'
         ),
         Index('idx_events_composite', 'event_type', 'timestamp'),
-        Index('idx_events_user_time', 'user_id', 'timestamp'),
+        Index('idx_events_user_time', 'user_key', 'timestamp'),
+        Index('idx_events_timestamp', 'timestamp'),
+        Index(
+            'idx_events_url_time', 'url', 'timestamp',
+            sqlite_where=url.isnot(None), postgresql_where=url.isnot(None)
+        ),
+        Index(
+            'idx_events_element_time', 'element_id', 'timestamp',
+            sqlite_where=element_id.isnot(None), postgresql_where=element_id.isnot(None)
+        ),
+        Index(
+            'idx_events_geohash_time', 'geohash', 'timestamp',
+            sqlite_where=geohash.isnot(None), postgresql_where=geohash.isnot(None)
+        ),
     )
+
+class EventPartition(Base):
+    """A table holding the events of [range_start, range_stop) (see app/partitions.py)"""
+
+    __tablename__ = "event_partitions"
+
+    name = Column(String, primary_key=True)
+    range_start = Column(EpochMicros, nullable=False, unique=True)
+    range_stop = Column(EpochMicros, nullable=False)
+    # When the closed partition was analyzed; NULL while it can still receive events
+    compacted_at = Column(EpochMicros)
+
+class IngestLogCheckpoint(Base):
+    """How far the ingest log has been applied (see app/eventlog.py), committed with the events it covers"""
+
+    __tablename__ = "ingest_log_checkpoints"
+
+    log = Column(String, primary_key=True)
+    # The next record to apply: its segment number and byte offset in that segment
+    segment = Column(BigInteger, nullable=False)
+    segment_offset = Column(BigInteger, nullable=False)
+
+class _EventRollup:
+    """Event counts per (event_type, bucket_start) for one bucket width"""
+
+    event_type = Column(EventTypeCode, primary_key=True)
+    bucket_start = Column(EpochMicros, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class EventRollupMinute(_EventRollup, Base):
+    __tablename__ = "event_rollups_minute"
+
+class EventRollupHour(_EventRollup, Base):
+    __tablename__ = "event_rollups_hour"
+
+class EventRollupDay(_EventRollup, Base):
+    __tablename__ = "event_rollups_day"
+
+class _UserSketch:
+    """HyperLogLog sketch of the distinct users per (event_type, bucket_start) for one bucket width"""
+
+    event_type = Column(EventTypeCode, primary_key=True)
+    bucket_start = Column(EpochMicros, primary_key=True)
+    registers = Column(LargeBinary, nullable=False)
+
+class UserSketchHour(_UserSketch, Base):
+    __tablename__ = "user_sketches_hour"
+
+class UserSketchDay(_UserSketch, Base):
+    __tablename__ = "user_sketches_day"
+
+class _TopKSummary:
+    """Space-Saving summary of the most frequent values of a payload field per bucket_start"""
+
+    field = Column(String, primary_key=True)
+    bucket_start = Column(EpochMicros, primary_key=True)
+    summary = Column(LargeBinary, nullable=False)
+
+class TopKHour(_TopKSummary, Base):
+    __tablename__ = "topk_hour"
+
+class TopKDay(_TopKSummary, Base):
+    __tablename__ = "topk_day"
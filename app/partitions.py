@@ -0,0 +1,337 @@
+"""
+Time-partitioned event storage.
+
+Events are stored in one table per day or month (EVENT_PARTITION_INTERVAL),
+named after the first day it covers (events_20261001) and listed with its
+[start, stop) range in the event_partitions table. Every partition is a
+copy of the events model, indexes included, so a query written against
+models.Event runs on any partition once `retarget` has pointed it there.
+
+Reads go through `route`, which returns the query once per partition
+overlapping the requested range, oldest first: a range query only touches
+the indexes of the days or months it covers. Writes go to the partition
+holding each row's timestamp, created on first use.
+
+Retention drops whole partitions, a DROP TABLE instead of a DELETE over
+millions of rows, together with the rollups, sketches and top-value
+summaries of their range. Partitions that have closed (no more events can
+arrive for their range) are ANALYZEd once so the planner has exact
+statistics for them. SQLite cannot VACUUM a single table, so the pages of
+dropped partitions are given back by an incremental vacuum where the
+database was created with auto_vacuum=INCREMENTAL, and reused by new
+partitions otherwise.
+
+With EVENT_PARTITION_INTERVAL=none events stay in the events table itself,
+which is then the only partition.
+"""
+
+import asyncio
+import logging
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, Table, delete, inspect, select, text, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import visitors
+
+from . import config, models
+from .cache import analytics_cache
+from .database import Base, WriterSession
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = ("day", "month", "none")
+
+# Aggregates dropped with the partitions their buckets were counted from, with their bucket width
+_AGGREGATE_MODELS = (
+    (models.EventRollupMinute, timedelta(minutes=1)),
+    (models.EventRollupHour, timedelta(hours=1)),
+    (models.EventRollupDay, timedelta(days=1)),
+    (models.UserSketchHour, timedelta(hours=1)),
+    (models.UserSketchDay, timedelta(days=1)),
+    (models.TopKHour, timedelta(hours=1)),
+    (models.TopKDay, timedelta(days=1)),
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    # None for the unpartitioned events table, which covers all time
+    start: Optional[datetime]
+    stop: Optional[datetime]
+
+    @property
+    def table(self) -> Table:
+        return partition_table(self.name)
+
+    def overlaps(self, start: Optional[datetime], stop: Optional[datetime]) -> bool:
+        """True when the partition may hold events in [start, stop)"""
+        return (
+            (stop is None or self.start is None or self.start < stop)
+            and (start is None or self.stop is None or start < self.stop)
+        )
+
+_UNPARTITIONED = Partition(models.Event.__tablename__, None, None)
+
+def is_partitioned() -> bool:
+    if config.EVENT_PARTITION_INTERVAL not in INTERVALS:
+        raise ValueError(f"EVENT_PARTITION_INTERVAL must be one of {', '.join(INTERVALS)}")
+    return config.EVENT_PARTITION_INTERVAL != "none"
+
+def interval_bounds(ts: datetime, interval: str) -> Tuple[datetime, datetime]:
+    """[start, stop) of the day or month holding ts"""
+    if interval == "day":
+        start = datetime(ts.year, ts.month, ts.day)
+        return start, start + timedelta(days=1)
+    start = datetime(ts.year, ts.month, 1)
+    return start, datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+def partition_name(start: datetime) -> str:
+    return f"{models.Event.__tablename__}_{start:%Y%m%d}"
+
+def partition_table(name: str) -> Table:
+    """The events table, or a copy of it named `name` with its indexes renamed to match"""
+    base = models.Event.__table__
+    if name == base.name:
+        return base
+    table = Base.metadata.tables.get(name)
+    if table is None:
+        table = base.to_metadata(Base.metadata, name=name)
+        # Index names are unique per database, not per table
+        for index in table.indexes:
+            index.name = index.name.replace(f"idx_{base.name}_", f"idx_{name}_", 1)
+    return table
+
+def covering(start: datetime, stop: datetime, interval: Optional[str] = None) -> List[Partition]:
+    """The partitions of the interval that together cover [start, stop), for bulk loads"""
+    interval = interval or config.EVENT_PARTITION_INTERVAL
+    partitions = []
+    while start < stop:
+        lower, upper = interval_bounds(start, interval)
+        partitions.append(Partition(partition_name(lower), lower, upper))
+        start = upper
+    return partitions
+
+def retarget(statement, table: Table):
+    """A copy of the statement with every reference to the events table pointed at `table`"""
+    base = models.Event.__table__
+    if table is base:
+        return statement
+
+    def replace(element, **kw):
+        if element is base:
+            return table
+        if isinstance(element, Column) and element.table is base:
+            return table.c[element.key]
+        return None
+
+    return visitors.replacement_traverse(statement, {}, replace)
+
+async def list_partitions(db: AsyncSession) -> List[Partition]:
+    """Every partition, oldest first"""
+    if not is_partitioned():
+        return [_UNPARTITIONED]
+    result = await db.execute(
+        select(
+            models.EventPartition.name, models.EventPartition.range_start, models.EventPartition.range_stop
+        ).order_by(models.EventPartition.range_start)
+    )
+    return [Partition(*row) for row in result.all()]
+
+async def overlapping(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    newest_first: bool = False
+) -> List[Partition]:
+    """The partitions that may hold events in [start, stop), oldest first unless newest_first"""
+    partitions = [partition for partition in await list_partitions(db) if partition.overlaps(start, stop)]
+    return partitions[::-1] if newest_first else partitions
+
+async def route(
+    db: AsyncSession,
+    query,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    newest_first: bool = False
+) -> List[Any]:
+    """The query once per partition overlapping [start, stop); the query should bound timestamps itself"""
+    return [retarget(query, partition.table) for partition in await overlapping(db, start, stop, newest_first)]
+
+def combine(queries: Sequence[Any]):
+    """A subquery over the rows of every routed query, for aggregates that cannot be summed per partition"""
+    return (queries[0] if len(queries) == 1 else union_all(*queries)).subquery()
+
+async def has_events(db: AsyncSession, *criteria) -> bool:
+    """True when any partition holds an event matching the criteria"""
+    query = select(models.Event.event_id).where(*criteria).limit(1)
+    for routed in await route(db, query):
+        if (await db.execute(routed)).first() is not None:
+            return True
+    return False
+
+# Partitions known to the writer, oldest first; ingest batches almost always land in the newest
+_known: List[Partition] = []
+
+def forget() -> None:
+    """Drop the writer's view of the partitions, e.g. after a rolled back transaction created one"""
+    _known.clear()
+
+def _find(partitions: List[Partition], ts: datetime) -> Optional[Partition]:
+    index = bisect_right([partition.start for partition in partitions], ts) - 1
+    if index >= 0 and ts < partitions[index].stop:
+        return partitions[index]
+    return None
+
+async def _partition_for(db: AsyncSession, ts: datetime) -> Partition:
+    partition = _find(_known, ts)
+    if partition is not None:
+        return partition
+
+    _known[:] = await list_partitions(db)
+    partition = _find(_known, ts)
+    if partition is not None:
+        return partition
+
+    # A change of EVENT_PARTITION_INTERVAL can leave neighbours with other bounds; never overlap them
+    start, stop = interval_bounds(ts, config.EVENT_PARTITION_INTERVAL)
+    for neighbour in _known:
+        if neighbour.stop <= ts:
+            start = max(start, neighbour.stop)
+        elif neighbour.start > ts:
+            stop = min(stop, neighbour.start)
+    partition = Partition(partition_name(start), start, stop)
+
+    connection = await db.connection()
+    await connection.run_sync(partition.table.create, checkfirst=True)
+    await db.execute(models.EventPartition.__table__.insert().values(
+        name=partition.name, range_start=start, range_stop=stop
+    ))
+    logger.info("Created partition", extra={"partition": partition.name, "start": start, "stop": stop})
+    _known.append(partition)
+    _known.sort(key=lambda known: known.start)
+    return partition
+
+async def assign(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[Tuple[Table, List[Dict[str, Any]]]]:
+    """
+    Group event rows by the partition table they belong to, creating missing partitions.
+
+    Creation happens in the caller's transaction; call forget() if it is rolled back.
+    """
+    if not is_partitioned():
+        return [(models.Event.__table__, rows)]
+
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    current: Optional[Partition] = None
+    for row in rows:
+        ts = row["timestamp"]
+        if current is None or not (current.start <= ts < current.stop):
+            current = await _partition_for(db, ts)
+        groups.setdefault(current.name, []).append(row)
+    return [(partition_table(name), group) for name, group in groups.items()]
+
+async def drop_expired(db: AsyncSession, now: Optional[datetime] = None) -> List[str]:
+    """Drop the partitions that ended more than EVENT_RETENTION_DAYS ago, with their aggregates"""
+    if not is_partitioned() or config.EVENT_RETENTION_DAYS <= 0:
+        return []
+    cutoff = (now or datetime.utcnow()) - timedelta(days=config.EVENT_RETENTION_DAYS)
+    expired = [partition for partition in await list_partitions(db) if partition.stop <= cutoff]
+    if not expired:
+        return []
+
+    connection = await db.connection()
+    for partition in expired:
+        table = partition.table
+        await connection.run_sync(table.drop, checkfirst=True)
+        Base.metadata.remove(table)
+    await db.execute(
+        delete(models.EventPartition).where(models.EventPartition.name.in_([p.name for p in expired]))
+    )
+    for start, stop in _dropped_ranges(expired):
+        for model, width in _AGGREGATE_MODELS:
+            # Only buckets that lie wholly inside the dropped range; one that straddles
+            # into a kept partition still counts that partition's events
+            first = start + (_EPOCH - start) % width
+            end = stop - (stop - _EPOCH) % width
+            await db.execute(delete(model).where(model.bucket_start >= first, model.bucket_start < end))
+    await db.commit()
+    forget()
+
+    if db.bind.dialect.name == "sqlite":
+        auto_vacuum = (await db.execute(text("PRAGMA auto_vacuum"))).scalar()
+        if auto_vacuum == 2:
+            await db.execute(text("PRAGMA incremental_vacuum"))
+            await db.commit()
+    return [partition.name for partition in expired]
+
+def _dropped_ranges(partitions: List[Partition]) -> List[Tuple[datetime, datetime]]:
+    """The [start, stop) ranges covered by the partitions, adjacent ones merged"""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for partition in sorted(partitions, key=lambda partition: partition.start):
+        if ranges and ranges[-1][1] == partition.start:
+            ranges[-1] = (ranges[-1][0], partition.stop)
+        else:
+            ranges.append((partition.start, partition.stop))
+    return ranges
+
+async def compact_closed(db: AsyncSession, now: Optional[datetime] = None) -> List[str]:
+    """ANALYZE each partition that can no longer receive events, once"""
+    if not is_partitioned():
+        return []
+    now = now or datetime.utcnow()
+    closed_before = now - timedelta(seconds=config.ANALYTICS_CACHE_CLOSED_GRACE_SECONDS)
+    names = (await db.execute(
+        select(models.EventPartition.name).where(
+            models.EventPartition.compacted_at.is_(None),
+            models.EventPartition.range_stop <= closed_before
+        ).order_by(models.EventPartition.range_start)
+    )).scalars().all()
+
+    for name in names:
+        # Names come from partition_name, never from input
+        await db.execute(text(f'ANALYZE "{name}"'))
+        await db.execute(
+            update(models.EventPartition).where(models.EventPartition.name == name).values(compacted_at=now)
+        )
+        await db.commit()
+    return list(names)
+
+async def maintain(db: AsyncSession, now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """Apply the retention policy, then compact closed partitions"""
+    dropped = await drop_expired(db, now)
+    if dropped:
+        analytics_cache.clear()
+    return {"dropped": dropped, "compacted": await compact_closed(db, now)}
+
+async def maintenance_loop(
+    interval_seconds: float = config.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+    on_dropped: Optional[Callable[[List[str]], None]] = None
+) -> None:
+    """Run maintain() every interval until cancelled; on_dropped is told which partitions retention dropped"""
+    while True:
+        try:
+            async with WriterSession() as db:
+                result = await maintain(db)
+            if result["dropped"] or result["compacted"]:
+                logger.info("Partition maintenance", extra=result)
+            if result["dropped"] and on_dropped is not None:
+                on_dropped(result["dropped"])
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(interval_seconds)
+
+def layout_error(sync_conn) -> Optional[str]:
+    """Why the stored events do not match EVENT_PARTITION_INTERVAL, or None when they do"""
+    inspector = inspect(sync_conn)
+    if is_partitioned():
+        if inspector.has_table(models.Event.__tablename__):
+            if sync_conn.execute(select(models.Event.event_id).limit(1)).first() is not None:
+                return "The events table holds unpartitioned events; run scripts/migrate_partitions.py first"
+    elif inspector.has_table(models.EventPartition.__tablename__):
+        if sync_conn.execute(select(models.EventPartition.name).limit(1)).first() is not None:
+            return "Events are stored in partitions but EVENT_PARTITION_INTERVAL is none"
+    return None
@@ -0,0 +1,252 @@
+"""
+Pre-aggregated event counts at minute, hour and day granularity.
+
+Every batch written through `crud.insert_event_rows` adds its counts to the
+three rollup tables in the same transaction. Range counts are answered from
+the coarsest buckets that fit entirely inside the range, falling back to finer
+buckets and finally to raw rows only for the partial edges, so the number of
+queries per range is bounded no matter how wide it is.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, partitions
+from .database import dialect_insert
+
+EVENT_TYPES = models.EVENT_TYPES
+
+# Coarsest first; the planner walks down this list
+GRANULARITIES = ("day", "hour", "minute")
+
+ROLLUP_MODELS = {
+    "minute": models.EventRollupMinute,
+    "hour": models.EventRollupHour,
+    "day": models.EventRollupDay,
+}
+
+BUCKET_WIDTHS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+RAW = "raw"
+
+Segment = Tuple[str, Optional[datetime], Optional[datetime]]
+
+def bucket_floor(ts: datetime, granularity: str) -> datetime:
+    """Start of the bucket containing ts"""
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+def bucket_ceil(ts: datetime, granularity: str) -> datetime:
+    """Start of the first bucket at or after ts"""
+    floor = bucket_floor(ts, granularity)
+    return floor if floor == ts else floor + BUCKET_WIDTHS[granularity]
+
+def plan_range(start: Optional[datetime], stop: Optional[datetime], levels: Iterable[str] = GRANULARITIES) -> List[Segment]:
+    """
+    Split the half-open range [start, stop) into rollup and raw segments.
+
+    Returns (source, lo, hi) tuples where source is a granularity or RAW and
+    None bounds are open. Each level contributes at most one run of whole
+    buckets plus two partial edges handed to the next finer level.
+    """
+    levels = list(levels)
+    if start is not None and stop is not None and start >= stop:
+        return []
+    if not levels:
+        return [(RAW, start, stop)]
+
+    granularity, finer = levels[0], levels[1:]
+    inner_lo = bucket_ceil(start, granularity) if start is not None else None
+    inner_hi = bucket_floor(stop, granularity) if stop is not None else None
+
+    if inner_lo is not None and inner_hi is not None and inner_lo >= inner_hi:
+        return plan_range(start, stop, finer)
+
+    segments = [(granularity, inner_lo, inner_hi)]
+    if start is not None and start < inner_lo:
+        segments += plan_range(start, inner_lo, finer)
+    if stop is not None and inner_hi < stop:
+        segments += plan_range(inner_hi, stop, finer)
+    return segments
+
+def inclusive_stop(end_date: Optional[datetime]) -> Optional[datetime]:
+    """Convert an inclusive end bound into the exclusive stop used by the planner"""
+    return end_date + timedelta(microseconds=1) if end_date is not None else None
+
+async def count_by_type(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    event_type: Optional[str] = None
+) -> Dict[str, int]:
+    """Count events per event_type in [start, stop) using the rollup tables"""
+    counts = {name: 0 for name in EVENT_TYPES}
+
+    for source, lo, hi in plan_range(start, stop):
+        if source == RAW:
+            column_type, column_ts = models.Event.event_type, models.Event.timestamp
+            query = select(column_type, func.count())
+        else:
+            model = ROLLUP_MODELS[source]
+            column_type, column_ts = model.event_type, model.bucket_start
+            query = select(column_type, func.sum(model.count))
+
+        if event_type:
+            query = query.where(column_type == event_type)
+        if lo is not None:
+            query = query.where(column_ts >= lo)
+        if hi is not None:
+            query = query.where(column_ts < hi)
+
+        query = query.group_by(column_type)
+        queries = await partitions.route(db, query, lo, hi) if source == RAW else [query]
+        for routed in queries:
+            for name, count in (await db.execute(routed)).all():
+                counts[name] = counts.get(name, 0) + int(count or 0)
+
+    return counts
+
+def _bucket_counts(pairs: Iterable[Tuple[str, datetime]], granularity: str) -> Dict[Tuple[str, datetime], int]:
+    counts: Dict[Tuple[str, datetime], int] = defaultdict(int)
+    for event_type, ts in pairs:
+        counts[(event_type, bucket_floor(ts, granularity))] += 1
+    return counts
+
+def _upsert_statement(db: AsyncSession, model):
+    """INSERT ... ON CONFLICT DO UPDATE that adds to the existing count"""
+    statement = dialect_insert(db)(model)
+    return statement.on_conflict_do_update(
+        index_elements=[model.event_type, model.bucket_start],
+        set_={"count": model.count + statement.excluded.count}
+    )
+
+async def apply_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Add a batch of event rows to every rollup table (the caller commits)"""
+    if not rows:
+        return
+
+    pairs = [(row["event_type"], row["timestamp"]) for row in rows]
+    for granularity, model in ROLLUP_MODELS.items():
+        deltas = _bucket_counts(pairs, granularity)
+        await db.execute(
+            _upsert_statement(db, model),
+            [
+                {"event_type": event_type, "bucket_start": bucket, "count": count}
+                for (event_type, bucket), count in deltas.items()
+            ]
+        )
+
+async def rebuild(db: AsyncSession, chunk_size: int = 50000) -> int:
+    """Recompute every rollup table from the events table and return the number of events scanned"""
+    minute_counts: Dict[Tuple[str, datetime], int] = defaultdict(int)
+    scanned = 0
+
+    query = select(models.Event.event_type, models.Event.timestamp).execution_options(yield_per=chunk_size)
+    for routed in await partitions.route(db, query):
+        result = await db.stream(routed)
+        async for chunk in result.partitions():
+            for event_type, ts in chunk:
+                minute_counts[(event_type, bucket_floor(ts, "minute"))] += 1
+            scanned += len(chunk)
+
+    bucket_counts = {"minute": minute_counts}
+    for granularity in ("hour", "day"):
+        coarse: Dict[Tuple[str, datetime], int] = defaultdict(int)
+        for (event_type, bucket), count in minute_counts.items():
+            coarse[(event_type, bucket_floor(bucket, granularity))] += count
+        bucket_counts[granularity] = coarse
+
+    for granularity, model in ROLLUP_MODELS.items():
+        await db.execute(delete(model))
+        rows = [
+            {"event_type": event_type, "bucket_start": bucket, "count": count}
+            for (event_type, bucket), count in bucket_counts[granularity].items()
+        ]
+        for i in range(0, len(rows), chunk_size):
+            await db.execute(model.__table__.insert(), rows[i:i + chunk_size])
+
+    await db.commit()
+    return scanned
+
+async def needs_backfill(db: AsyncSession) -> bool:
+    """True when events exist but the rollup tables have never been populated"""
+    has_rollups = (await db.execute(select(models.EventRollupMinute.bucket_start).limit(1))).first()
+    if has_rollups:
+        return False
+    return await partitions.has_events(db)
+
+async def timeseries(
+    db: AsyncSession,
+    granularity: str,
+    start: datetime,
+    stop: datetime,
+    event_type: Optional[str] = None
+) -> List[Tuple[datetime, int]]:
+    """
+    Event counts per bucket for [start, stop), zero-filled.
+
+    Whole buckets come straight from the matching rollup table in one grouped
+    query; a partially covered first or last bucket is counted through the
+    planner so it only includes events inside the range.
+    """
+    model = ROLLUP_MODELS[granularity]
+    first = bucket_floor(start, granularity)
+    counts: Dict[datetime, int] = {}
+
+    inner_lo = bucket_ceil(start, granularity)
+    inner_hi = bucket_floor(stop, granularity)
+
+    if inner_lo < inner_hi:
+        query = select(model.bucket_start, func.sum(model.count)).where(
+            model.bucket_start >= inner_lo,
+            model.bucket_start < inner_hi
+        )
+        if event_type:
+            query = query.where(model.event_type == event_type)
+        for bucket, count in (await db.execute(query.group_by(model.bucket_start))).all():
+            counts[bucket] = int(count or 0)
+
+    edges = []
+    if inner_lo >= inner_hi:
+        # The whole range sits inside a single bucket
+        edges.append((first, start, stop))
+    else:
+        if start < inner_lo:
+            edges.append((first, start, inner_lo))
+        if inner_hi < stop:
+            edges.append((inner_hi, inner_hi, stop))
+
+    for bucket, lo, hi in edges:
+        partial = await count_by_type(db, start=lo, stop=hi, event_type=event_type)
+        counts[bucket] = counts.get(bucket, 0) + sum(partial.values())
+
+    return zero_fill(counts, granularity, start, stop)
+
+def zero_fill(counts: Dict[datetime, int], granularity: str, start: datetime, stop: datetime) -> List[Tuple[datetime, int]]:
+    """(bucket_start, count) for every bucket overlapping [start, stop), 0 where counts has none"""
+    width = BUCKET_WIDTHS[granularity]
+    series = []
+    bucket = bucket_floor(start, granularity)
+    while bucket < stop:
+        series.append((bucket, counts.get(bucket, 0)))
+        bucket += width
+    return series
+
+def bucket_count(granularity: str, start: datetime, stop: datetime) -> int:
+    """Number of buckets a timeseries over [start, stop) would return"""
+    span = stop - bucket_floor(start, granularity)
+    width = BUCKET_WIDTHS[granularity]
+    return max(0, -(-span // width))
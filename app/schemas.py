@@ -1,51 +1,81 @@
-from pydantic import BaseModel, validator, Field
-from typing import  Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing import  Annotated, Literal, Optional, Dict, Any, List, Union
 from datetime import datetime
 
+# Payload keys beyond the declared fields are kept and stored with the event
+
 class ViewPayload(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     url: str = Field(..., min_length=1, description="The URL of the page viewed")
     title: Optional[str] = Field(None, description="The title of the page")
 
 class ClickPayload(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     element_id: Optional[str] = Field(None, description="The ID of the clicked HTML element")
     text: Optional[str] = Field(None, description="The text content of the clicked element")
     xpath: Optional[str] = Field(None, description="XPath or CSS selector to locate the element")
 
 class LocationPayload(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     latitude: float = Field(..., ge=-90, le=90, description="User's latitude")
     longitude: float = Field(..., ge=-180, le=180, description="User's longitude")
     accuracy: Optional[float] = Field(None, ge=0, description="Accuracy of the location in meters")
 
 
-class EventCreate(BaseModel):
+class _EventBase(BaseModel):
     user_id: str = Field(..., min_length=1, description="String identifier for the user")
-    event_type: str = Field(..., description="Type of event: view, click, or location")
-    payload: Dict[str, Any] = Field(..., description="Event-specific data")
 
-    @validator('event_type')
-    def validate_event_type(cls, v):
-        if v not in ['view', 'click', 'location']:
-            raise ValueError('event_type must be one of: view, click, location')
-        return v
+class ViewEvent(_EventBase):
+    event_type: Literal["view"]
+    payload: ViewPayload
+
+class ClickEvent(_EventBase):
+    event_type: Literal["click"]
+    payload: ClickPayload
+
+class LocationEvent(_EventBase):
+    event_type: Literal["location"]
+    payload: LocationPayload
 
-    @validator('payload')
-    def validate_payload(cls, v, values):
-        if 'event_type' not in values:
-            return v
+# An incoming event. The event_type tag selects the payload model, so the payload
+# is validated once, against its own type only.
+EventCreate = Annotated[
+    Union[ViewEvent, ClickEvent, LocationEvent],
+    Field(discriminator="event_type", description="Type of event: view, click, or location")
+]
 
-        event_type = values['event_type']
+EVENT_TYPE_TAGS = ("view", "click", "location")
 
-        try:
-            if event_type == 'view':
-                ViewPayload(**v)
-            elif event_type == 'click':
-                ClickPayload(**v)
-            elif event_type == 'location':
-                LocationPayload(**v)
-        except Exception as e:
-            raise ValueError(f'Invalid payload for event_type "{event_type}": {str(e)}')
+event_create_adapter = TypeAdapter(EventCreate)
 
-        return v
+def parse_event(data: Any) -> Union[ViewEvent, ClickEvent, LocationEvent]:
+    """Validate an already decoded event; raises pydantic.ValidationError"""
+    return event_create_adapter.validate_python(data)
+
+def parse_event_json(data: Union[bytes, str]) -> Union[ViewEvent, ClickEvent, LocationEvent]:
+    """Validate an event straight from its JSON text, without building an intermediate dict"""
+    return event_create_adapter.validate_json(data)
+
+def event_create_schema() -> Dict[str, Any]:
+    """Self-contained JSON schema of EventCreate, for documenting raw request bodies"""
+    schema = event_create_adapter.json_schema()
+    definitions = schema.pop("$defs", {})
+    # The mapping points at $defs entries that are inlined below
+    schema["discriminator"].pop("mapping", None)
+
+    def inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(item) for item in node]
+        return node
+
+    return inline(schema)
 
 
 class EventResponse(BaseModel):
@@ -59,6 +89,11 @@ class EventResponse(BaseModel):
         from_attributes = True
 
 
+class EventPage(BaseModel):
+    items: List[EventResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as `cursor` to fetch the next page; null on the last page")
+
+
 class EventCountResponse(BaseModel):
     total_events: int
 
@@ -0,0 +1,80 @@
+"""
+Run the API in several worker processes with one ingest writer process.
+
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+
+Starts `python -m app.writer` on a Unix socket in a private temporary
+directory (or --socket), waits until it listens, then runs uvicorn with
+--workers N, each worker sending its writes to that socket (see
+app/writer.py). On shutdown the workers stop first, flushing their queued
+events to the writer, and the writer then commits them and exits.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m app.serve", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="API worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket", default=None, help="Writer socket path (default: in a private temp directory)")
+    parser.add_argument("--log-level", default="info", help="uvicorn log level")
+    parser.add_argument("--no-access-log", action="store_true", help="Disable uvicorn's access log")
+    return parser.parse_args()
+
+def wait_for_writer(path: str, process: subprocess.Popen, timeout: float) -> None:
+    """Block until the writer accepts connections; the schema and backfills are done by then"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None:
+            sys.exit(f"Ingest writer exited with status {process.returncode}")
+        try:
+            with socket.socket(socket.AF_UNIX) as probe:
+                probe.connect(path)
+            return
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                process.terminate()
+                sys.exit(f"Ingest writer did not listen on {path} within {timeout:.0f}s")
+            time.sleep(0.1)
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp(prefix="analytics-writer-")
+    path = args.socket or os.path.join(directory, "writer.sock")
+    # Read by app.config in the writer and in every worker uvicorn spawns
+    os.environ["INGEST_WRITER_SOCKET"] = path
+
+    # Its own session keeps Ctrl-C away from the writer until the workers have flushed to it
+    writer = subprocess.Popen([sys.executable, "-m", "app.writer", "--socket", path], start_new_session=True)
+    try:
+        # Backfilling a large database can take a while before the writer listens
+        wait_for_writer(path, writer, timeout=3600)
+
+        import uvicorn
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level=args.log_level,
+            access_log=not args.no_access_log,
+        )
+    finally:
+        writer.terminate()
+        try:
+            writer.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            writer.kill()
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-user session reconstruction.
+
+A user's events are read in time order as a range scan of the
+(user_key, timestamp) index and split into sessions wherever two
+consecutive events are more than the inactivity gap apart. Rows are
+fetched as plain tuples of raw column values (integer microseconds, event
+type codes and the extracted url column), so a user with hundreds of
+thousands of events costs one streamed scan and no JSON parsing.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import BigInteger, SmallInteger, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, partitions
+
+_VIEW_CODE = models.EVENT_TYPE_CODES["view"]
+
+class _Session:
+    __slots__ = ("start", "end", "counts", "path")
+
+    def __init__(self, ts: int):
+        self.start = ts
+        self.end = ts
+        self.counts = [0] * len(models.EVENT_TYPES)
+        self.path: List[str] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "start": models.from_epoch_micros(self.start),
+            "end": models.from_epoch_micros(self.end),
+            "duration_seconds": (self.end - self.start) / 1_000_000,
+            "event_count": sum(self.counts),
+            "event_counts": dict(zip(models.EVENT_TYPES, self.counts)),
+            "path": self.path,
+        }
+
+async def user_sessions(
+    db: AsyncSession,
+    user_key: int,
+    gap_seconds: float,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    chunk_size: int = 10000
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield the user's sessions with events in [start, stop), oldest first.
+
+    Each session is yielded as soon as the scan passes its last event, so
+    memory is bounded by the largest session's view path.
+    """
+    # Bypass the column types: raw integers are compared here and only session bounds become datetimes
+    timestamp = type_coerce(models.Event.timestamp, BigInteger)
+    query = select(
+        timestamp,
+        type_coerce(models.Event.event_type, SmallInteger),
+        models.Event.url
+    ).where(models.Event.user_key == user_key)
+
+    if start is not None:
+        query = query.where(models.Event.timestamp >= start)
+    if stop is not None:
+        query = query.where(models.Event.timestamp < stop)
+
+    query = query.order_by(models.Event.timestamp).execution_options(yield_per=chunk_size)
+
+    gap = int(gap_seconds * 1_000_000)
+    session: Optional[_Session] = None
+
+    # Partitions come oldest first, so a session running across their boundary simply continues
+    for routed in await partitions.route(db, query, start, stop):
+        result = await db.stream(routed)
+        async for chunk in result.partitions():
+            for ts, code, url in chunk:
+                if session is None or ts - session.end > gap:
+                    if session is not None:
+                        yield session.to_dict()
+                    session = _Session(ts)
+                session.end = ts
+                session.counts[code] += 1
+                if code == _VIEW_CODE and url is not None:
+                    session.path.append(url)
+
+    if session is not None:
+        yield session.to_dict()
+
+def encode_session(session: Dict[str, Any]) -> str:
+    """One session as compact JSON text"""
+    return json.dumps({
+        **session,
+        "start": session["start"].isoformat(),
+        "end": session["end"].isoformat(),
+    }, separators=(",", ":"))
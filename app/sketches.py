@@ -0,0 +1,180 @@
+"""
+Unique-user HyperLogLog sketches per hour and per day.
+
+Every batch written through `crud.insert_event_rows` folds its users into
+the sketches of the (event_type, hour) and (event_type, day) buckets it
+touches, in the same transaction. A range query merges the day sketches
+that fit inside the range, then hour sketches, and adds the users of the
+partial hours at either edge straight from the events table, reusing the
+rollup planner. Users are hashed by their `users.id` key.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import config, models, partitions
+from .database import dialect_insert
+from .hll import HyperLogLog, hash64
+from .rollups import RAW, bucket_floor, plan_range
+
+GRANULARITIES = ("day", "hour")
+
+SKETCH_MODELS = {
+    "hour": models.UserSketchHour,
+    "day": models.UserSketchDay,
+}
+
+def user_hash(user_key: int) -> int:
+    return hash64(str(user_key))
+
+def _upsert_statement(db: AsyncSession, model):
+    statement = dialect_insert(db)(model)
+    return statement.on_conflict_do_update(
+        index_elements=[model.event_type, model.bucket_start],
+        set_={"registers": statement.excluded.registers}
+    )
+
+async def apply_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Add a batch of event rows (with user_key) to the hour and day sketches.
+
+    Read-modify-write: relies on a single writer, which the ingest buffer
+    and the tuned SQLite profile both provide. The caller commits.
+    """
+    if not rows:
+        return
+
+    for granularity, model in SKETCH_MODELS.items():
+        users: Dict[Tuple[str, datetime], Set[int]] = defaultdict(set)
+        for row in rows:
+            users[(row["event_type"], bucket_floor(row["timestamp"], granularity))].add(row["user_key"])
+
+        existing = await db.execute(
+            select(model.event_type, model.bucket_start, model.registers).where(
+                model.event_type.in_({event_type for event_type, _ in users}),
+                model.bucket_start.in_({bucket for _, bucket in users})
+            )
+        )
+        sketches = {
+            (event_type, bucket): HyperLogLog.from_bytes(registers)
+            for event_type, bucket, registers in existing.all()
+        }
+
+        updated = []
+        for key, user_keys in users.items():
+            sketch = sketches.get(key) or HyperLogLog(config.HLL_PRECISION)
+            for user_key in user_keys:
+                sketch.add_hash(user_hash(user_key))
+            updated.append({"event_type": key[0], "bucket_start": key[1], "registers": sketch.to_bytes()})
+
+        await db.execute(_upsert_statement(db, model), updated)
+
+async def unique_users(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    event_type: Optional[str] = None
+) -> HyperLogLog:
+    """Merged sketch of the users with events in [start, stop)"""
+    merged = HyperLogLog(config.HLL_PRECISION)
+
+    for source, lo, hi in plan_range(start, stop, GRANULARITIES):
+        if source == RAW:
+            query = select(models.Event.user_key).distinct()
+            column_type, column_ts = models.Event.event_type, models.Event.timestamp
+        else:
+            model = SKETCH_MODELS[source]
+            query = select(model.registers)
+            column_type, column_ts = model.event_type, model.bucket_start
+
+        if event_type:
+            query = query.where(column_type == event_type)
+        if lo is not None:
+            query = query.where(column_ts >= lo)
+        if hi is not None:
+            query = query.where(column_ts < hi)
+
+        if source == RAW:
+            for routed in await partitions.route(db, query, lo, hi):
+                for user_key in (await db.execute(routed)).scalars():
+                    merged.add_hash(user_hash(user_key))
+        else:
+            values = (await db.execute(query)).scalars().all()
+            merged.merge(*(HyperLogLog.from_bytes(registers) for registers in values))
+
+    return merged
+
+async def exact_unique_users(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None,
+    event_type: Optional[str] = None
+) -> int:
+    """COUNT(DISTINCT user_key) over the events of [start, stop), across partitions"""
+    query = select(models.Event.user_key)
+    if event_type:
+        query = query.where(models.Event.event_type == event_type)
+    if start is not None:
+        query = query.where(models.Event.timestamp >= start)
+    if stop is not None:
+        query = query.where(models.Event.timestamp < stop)
+    queries = await partitions.route(db, query, start, stop)
+    if not queries:
+        return 0
+    user_keys = partitions.combine(queries)
+    return int((await db.execute(select(func.count(distinct(user_keys.c.user_key))))).scalar() or 0)
+
+async def rebuild(db: AsyncSession, chunk_size: int = 50000) -> int:
+    """Recompute every sketch table from the events table and return the number of events scanned"""
+    for model in SKETCH_MODELS.values():
+        await db.execute(delete(model))
+
+    open_sketches: Dict[str, Dict[Tuple[str, datetime], HyperLogLog]] = {name: {} for name in SKETCH_MODELS}
+    current: Dict[str, Optional[datetime]] = {name: None for name in SKETCH_MODELS}
+    scanned = 0
+
+    async def flush(granularity: str) -> None:
+        sketches = open_sketches[granularity]
+        if sketches:
+            await db.execute(SKETCH_MODELS[granularity].__table__.insert(), [
+                {"event_type": event_type, "bucket_start": bucket, "registers": sketch.to_bytes()}
+                for (event_type, bucket), sketch in sketches.items()
+            ])
+        open_sketches[granularity] = {}
+
+    # Time order lets each bucket be written as soon as the scan moves past it
+    query = select(
+        models.Event.event_type, models.Event.timestamp, models.Event.user_key
+    ).order_by(models.Event.timestamp).execution_options(yield_per=chunk_size)
+    for routed in await partitions.route(db, query):
+        result = await db.stream(routed)
+        async for chunk in result.partitions():
+            for event_type, ts, user_key in chunk:
+                hashed = user_hash(user_key)
+                for granularity in SKETCH_MODELS:
+                    bucket = bucket_floor(ts, granularity)
+                    if bucket != current[granularity]:
+                        await flush(granularity)
+                        current[granularity] = bucket
+                    sketch = open_sketches[granularity].get((event_type, bucket))
+                    if sketch is None:
+                        sketch = open_sketches[granularity][(event_type, bucket)] = HyperLogLog(config.HLL_PRECISION)
+                    sketch.add_hash(hashed)
+            scanned += len(chunk)
+
+    for granularity in SKETCH_MODELS:
+        await flush(granularity)
+
+    await db.commit()
+    return scanned
+
+async def needs_backfill(db: AsyncSession) -> bool:
+    """True when events exist but the sketch tables have never been populated"""
+    has_sketches = (await db.execute(select(models.UserSketchDay.bucket_start).limit(1))).first()
+    if has_sketches:
+        return False
+    return await partitions.has_events(db)
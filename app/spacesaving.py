@@ -0,0 +1,119 @@
+"""
+Space-Saving heavy-hitter summaries.
+
+A summary keeps at most `capacity` (item, count, error) counters. While it
+has room every item is counted exactly; once full, an unseen item evicts the
+item with the smallest count and inherits that count as its error. Every
+reported count is an upper bound on the true count and `count - error` a
+lower bound, and any item whose true count exceeds N / capacity (N being the
+total added) is guaranteed to be in the summary.
+
+Summaries merge by adding counters: an item missing from a full summary may
+still have occurred up to that summary's smallest count times, so that much
+is added to both its count and its error, which keeps the bounds valid for
+any union of buckets.
+"""
+
+import json
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+class SpaceSaving:
+    """Mergeable top-k summary"""
+
+    __slots__ = ("capacity", "counts", "errors")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    @classmethod
+    def from_counts(cls, counts: Mapping[str, int], capacity: int) -> "SpaceSaving":
+        """
+        Summary of exactly known counts: the `capacity` largest, with no error.
+
+        Items left out have counts no larger than the smallest one kept, which
+        is the same bound a full summary gives.
+        """
+        summary = cls(capacity)
+        for item, count in sorted(counts.items(), key=lambda pair: pair[1], reverse=True)[:capacity]:
+            summary.counts[item] = count
+            summary.errors[item] = 0
+        return summary
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        """Inverse of to_bytes"""
+        capacity, items = json.loads(data)
+        summary = cls(capacity)
+        for item, count, error in items:
+            summary.counts[item] = count
+            summary.errors[item] = error
+        return summary
+
+    def to_bytes(self) -> bytes:
+        items = [[item, count, self.errors[item]] for item, count in self.counts.items()]
+        return json.dumps([self.capacity, items], separators=(",", ":")).encode()
+
+    @property
+    def full(self) -> bool:
+        return len(self.counts) >= self.capacity
+
+    @property
+    def min_count(self) -> int:
+        """Upper bound on the count of any item not in the summary"""
+        return min(self.counts.values()) if self.full else 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            evicted = min(counts, key=counts.__getitem__)
+            floor = counts.pop(evicted)
+            del self.errors[evicted]
+            counts[item] = floor + count
+            self.errors[item] = floor
+
+    def update(self, counts: Mapping[str, int]) -> None:
+        """Add pre-aggregated counts, largest first so the eviction floor stays low"""
+        for item, count in sorted(counts.items(), key=lambda pair: pair[1], reverse=True):
+            self.add(item, count)
+
+    def merge(self, *others: "SpaceSaving") -> "SpaceSaving":
+        """Union in place, keeping the largest `capacity` counters"""
+        summaries = (self, *others)
+        floors = [summary.min_count for summary in summaries]
+        total_floor = sum(floors)
+
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for summary, floor in zip(summaries, floors):
+            for item, count in summary.counts.items():
+                if item not in counts:
+                    # Start from every summary's floor, then swap in the real counter where there is one
+                    counts[item] = total_floor
+                    errors[item] = total_floor
+                counts[item] += count - floor
+                errors[item] += summary.errors[item] - floor
+
+        kept = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        return self
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """The n largest (item, count, error) counters, largest first"""
+        items = sorted(self.counts.items(), key=lambda pair: (-pair[1], pair[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in items]
+
+def exact(counts: Iterable[Tuple[str, int]]) -> SpaceSaving:
+    """An error-free summary of every given count"""
+    counts = dict(counts)
+    # The spare slot keeps it from counting as full: nothing was left out, so its floor is 0
+    return SpaceSaving.from_counts(counts, len(counts) + 1)
@@ -0,0 +1,210 @@
+"""
+Most frequent payload values per hour and per day.
+
+Every batch written through `crud.insert_event_rows` adds the `url` of its
+view events and the `element_id` of its click events to the Space-Saving
+summaries of the hour and day buckets they fall in, in the same
+transaction. A range query merges the day and hour summaries inside the
+range, reusing the rollup planner, and counts the partial hours at either
+edge exactly from the field's extracted, indexed column.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import config, models, partitions
+from .database import dialect_insert
+from .rollups import BUCKET_WIDTHS, RAW, bucket_floor, plan_range
+from .spacesaving import SpaceSaving, exact
+
+# Summarized payload field -> the event type it belongs to
+FIELDS = {
+    "url": "view",
+    "element_id": "click",
+}
+
+GRANULARITIES = ("day", "hour")
+
+TOPK_MODELS = {
+    "hour": models.TopKHour,
+    "day": models.TopKDay,
+}
+
+_FIELD_BY_TYPE = {event_type: field for field, event_type in FIELDS.items()}
+_FIELD_INDEX = {field: index for index, field in enumerate(FIELDS)}
+
+def _upsert_statement(db: AsyncSession, model):
+    statement = dialect_insert(db)(model)
+    return statement.on_conflict_do_update(
+        index_elements=[model.field, model.bucket_start],
+        set_={"summary": statement.excluded.summary}
+    )
+
+def _row_values(rows: List[Dict[str, Any]]) -> List[Tuple[str, datetime, str]]:
+    """(field, timestamp, value) for every row carrying a summarized field"""
+    values = []
+    for row in rows:
+        field = _FIELD_BY_TYPE.get(row["event_type"])
+        if field is not None and row[field] is not None:
+            values.append((field, row["timestamp"], row[field]))
+    return values
+
+async def apply_rows(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Add a batch of event rows to the hour and day summaries.
+
+    Read-modify-write like the unique-user sketches, so it relies on the
+    same single writer. The caller commits.
+    """
+    values = _row_values(rows)
+    if not values:
+        return
+
+    for granularity, model in TOPK_MODELS.items():
+        counts: Dict[Tuple[str, datetime], Counter] = defaultdict(Counter)
+        for field, ts, value in values:
+            counts[(field, bucket_floor(ts, granularity))][value] += 1
+
+        existing = await db.execute(
+            select(model.field, model.bucket_start, model.summary).where(
+                model.field.in_({field for field, _ in counts}),
+                model.bucket_start.in_({bucket for _, bucket in counts})
+            )
+        )
+        summaries = {
+            (field, bucket): SpaceSaving.from_bytes(summary)
+            for field, bucket, summary in existing.all()
+        }
+
+        updated = []
+        for key, value_counts in counts.items():
+            summary = summaries.get(key) or SpaceSaving(config.TOPK_CAPACITY)
+            summary.update(value_counts)
+            updated.append({"field": key[0], "bucket_start": key[1], "summary": summary.to_bytes()})
+
+        await db.execute(_upsert_statement(db, model), updated)
+
+def _exact_counts_query(field: str, start: Optional[datetime], stop: Optional[datetime]):
+    """
+    Exact value counts from the extracted column.
+
+    Wide ranges are a covering scan of the field's partial (field, timestamp)
+    index, which only holds rows of the field's event type. Ranges shorter
+    than a day (such as the edges of a summary query) add an event_type term
+    so they can seek (event_type, timestamp) instead.
+    """
+    value = getattr(models.Event, field)
+    query = select(value, func.count().label("count")).where(value.is_not(None))
+    if start is not None and stop is not None and stop - start < BUCKET_WIDTHS["day"]:
+        query = query.where(models.Event.event_type == FIELDS[field])
+    if start is not None:
+        query = query.where(models.Event.timestamp >= start)
+    if stop is not None:
+        query = query.where(models.Event.timestamp < stop)
+    return query.group_by(value)
+
+async def top(
+    db: AsyncSession,
+    field: str,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None
+) -> SpaceSaving:
+    """Merged summary of the field's values in [start, stop)"""
+    merged = SpaceSaving(config.TOPK_CAPACITY)
+    summaries = []
+
+    for source, lo, hi in plan_range(start, stop, GRANULARITIES):
+        if source == RAW:
+            for routed in await partitions.route(db, _exact_counts_query(field, lo, hi), lo, hi):
+                summaries.append(exact((await db.execute(routed)).all()))
+            continue
+
+        model = TOPK_MODELS[source]
+        query = select(model.summary).where(model.field == field)
+        if lo is not None:
+            query = query.where(model.bucket_start >= lo)
+        if hi is not None:
+            query = query.where(model.bucket_start < hi)
+        summaries.extend(SpaceSaving.from_bytes(summary) for summary in (await db.execute(query)).scalars())
+
+    return merged.merge(*summaries)
+
+async def exact_top(
+    db: AsyncSession,
+    field: str,
+    n: int,
+    start: Optional[datetime] = None,
+    stop: Optional[datetime] = None
+) -> List[Tuple[str, int]]:
+    """The n most frequent values of the field in [start, stop), counted from the events table"""
+    queries = await partitions.route(db, _exact_counts_query(field, start, stop), start, stop)
+    if not queries:
+        return []
+    if len(queries) == 1:
+        query = queries[0].order_by(func.count().desc(), queries[0].selected_columns[0])
+    else:
+        # Each partition is counted through its own index, then the per-partition counts are summed
+        counts = partitions.combine(queries)
+        value, count = counts.c[field], func.sum(counts.c["count"])
+        query = select(value, count).group_by(value).order_by(count.desc(), value)
+    return [(value, int(count)) for value, count in (await db.execute(query.limit(n))).all()]
+
+async def rebuild(db: AsyncSession, chunk_size: int = 50000) -> int:
+    """Recompute every summary table from the events table and return the number of events scanned"""
+    for model in TOPK_MODELS.values():
+        await db.execute(delete(model))
+
+    open_counts: Dict[str, Dict[Tuple[str, datetime], Counter]] = {name: defaultdict(Counter) for name in TOPK_MODELS}
+    current: Dict[str, Optional[datetime]] = {name: None for name in TOPK_MODELS}
+    scanned = 0
+
+    async def flush(granularity: str) -> None:
+        counts = open_counts[granularity]
+        if counts:
+            await db.execute(TOPK_MODELS[granularity].__table__.insert(), [
+                {
+                    "field": field,
+                    "bucket_start": bucket,
+                    "summary": SpaceSaving.from_counts(value_counts, config.TOPK_CAPACITY).to_bytes(),
+                }
+                for (field, bucket), value_counts in counts.items()
+            ])
+        open_counts[granularity] = defaultdict(Counter)
+
+    # Time order lets each bucket be written as soon as the scan moves past it
+    columns = [getattr(models.Event, field) for field in FIELDS]
+    query = select(models.Event.event_type, models.Event.timestamp, *columns).where(
+        models.Event.event_type.in_(list(FIELDS.values()))
+    ).order_by(models.Event.timestamp).execution_options(yield_per=chunk_size)
+    for routed in await partitions.route(db, query):
+        result = await db.stream(routed)
+        async for chunk in result.partitions():
+            for event_type, ts, *values in chunk:
+                field = _FIELD_BY_TYPE[event_type]
+                field_text = values[_FIELD_INDEX[field]]
+                if field_text is None:
+                    continue
+                for granularity in TOPK_MODELS:
+                    bucket = bucket_floor(ts, granularity)
+                    if bucket != current[granularity]:
+                        await flush(granularity)
+                        current[granularity] = bucket
+                    open_counts[granularity][(field, bucket)][field_text] += 1
+            scanned += len(chunk)
+
+    for granularity in TOPK_MODELS:
+        await flush(granularity)
+
+    await db.commit()
+    return scanned
+
+async def needs_backfill(db: AsyncSession) -> bool:
+    """True when view or click events exist but the summary tables have never been populated"""
+    has_summaries = (await db.execute(select(models.TopKDay.bucket_start).limit(1))).first()
+    if has_summaries:
+        return False
+    return await partitions.has_events(db, models.Event.event_type.in_(list(FIELDS.values())))
@@ -0,0 +1,464 @@
+"""
+Single writer process for multi-worker deployments.
+
+With `uvicorn --workers N` each worker would commit its own batches, and the
+N processes would take turns on SQLite's write lock. Instead one writer
+process owns every write: it creates the schema, runs the backfills and
+partition maintenance, and listens on a Unix socket (INGEST_WRITER_SOCKET).
+API workers still validate requests and batch events in their IngestBuffer,
+then send each batch over the socket instead of committing it. Reads never
+go through the writer; every worker keeps its own reader pool.
+
+The writer commits in groups: batches that arrive while a transaction is
+being written queue up and are committed together by the next one, so the
+commit rate follows the load without a fixed delay. A batch is acknowledged
+once its transaction has committed, and every other connected worker is told
+about the commit so it drops open-range entries from its analytics cache and
+pushes the new counts to its live streams (see app/live.py).
+The writer's queue needs no bound of its own: each worker has at most one
+IngestBuffer flush and its /events/batch chunks in flight.
+
+When the ingest log is on (see app/eventlog.py) the writer owns it too:
+workers send each POST /events row as an append, acknowledged as soon as it
+is synced to the log, and every worker hears about each batch the
+materializer commits and about the timestamp of the oldest event still
+waiting in the log, which bounds what their caches may treat as closed.
+
+Partition maintenance runs in the writer only, so it tells every worker when
+retention drops partitions and each worker clears its analytics cache: closed
+ranges are cached without expiry and would otherwise keep counting the
+dropped events. A worker that reconnects clears its cache too, in case it
+missed that message.
+
+Frames are a 4-byte big-endian length followed by a pickled message. Pickle
+trusts its input, so the socket is created with mode 0600, only reachable by
+the service's own user.
+
+    python -m app.serve --workers 4
+    python -m app.writer --socket /run/analytics/writer.sock
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import pickle
+import signal
+import struct
+import time
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import config, eventlog, logs, partitions, rollups, sketches, topk
+from .cache import analytics_cache
+from .database import WriterSession, dispose_engines, init_db
+from .ingest import IngestClosed, IngestQueueFull, write_event_rows
+from .live import count_rows, live_counts
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+_STOP = object()
+
+class WriterUnavailable(Exception):
+    """Raised when the writer process cannot be reached"""
+
+class WriteFailed(Exception):
+    """Raised when the writer process could not commit a batch"""
+
+# Errors are acknowledged as (kind, message) and raised again on the worker's side
+_ERROR_KINDS = {IngestQueueFull: "full", IngestClosed: "closed"}
+_ERRORS = {kind: error for error, kind in _ERROR_KINDS.items()}
+
+def _error(e: Exception) -> Tuple[str, str]:
+    return _ERROR_KINDS.get(type(e), "failed"), str(e)
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    header = await reader.readexactly(_HEADER.size)
+    return pickle.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+
+def write_frame(writer: asyncio.StreamWriter, message: Any) -> None:
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(data)) + data)
+
+async def prepare_database() -> None:
+    """Create missing tables and backfill empty rollups, sketches and summaries"""
+    await init_db()
+    async with WriterSession() as db:
+        if await rollups.needs_backfill(db):
+            logger.info("Rollup tables are empty, backfilling from existing events")
+            scanned = await rollups.rebuild(db)
+            logger.info("Rollup backfill complete: %d events", scanned)
+        if await sketches.needs_backfill(db):
+            logger.info("Unique-user sketches are empty, backfilling from existing events")
+            scanned = await sketches.rebuild(db)
+            logger.info("Sketch backfill complete: %d events", scanned)
+        if await topk.needs_backfill(db):
+            logger.info("Top-value summaries are empty, backfilling from existing events")
+            scanned = await topk.rebuild(db)
+            logger.info("Top-value backfill complete: %d events", scanned)
+
+class WriterClient:
+    """
+    An API worker's connection to the writer process.
+
+    `write` has the signature IngestBuffer expects of its writer. Batches are
+    pipelined over one connection and matched to their acknowledgements by
+    request ID. A lost connection fails the batches in flight and is
+    reopened by the next write.
+    """
+
+    def __init__(
+        self,
+        path: str = config.INGEST_WRITER_SOCKET,
+        connect_timeout: float = config.INGEST_WRITER_CONNECT_TIMEOUT_SECONDS
+    ):
+        self.path = path
+        self.connect_timeout = connect_timeout
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+        self._connecting = asyncio.Lock()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count()
+        self._unapplied_since: Optional[datetime] = None
+
+        self.sent_batches = 0
+        self.failed_batches = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        """Connect, retrying until the writer listens or connect_timeout has passed"""
+        async with self._connecting:
+            if self.connected:
+                return
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError) as e:
+                    if time.monotonic() >= deadline:
+                        raise WriterUnavailable(f"No ingest writer listening on {self.path}") from e
+                    await asyncio.sleep(0.1)
+            if self._receiver is not None:
+                # Partitions may have been dropped while this worker was not listening
+                analytics_cache.clear()
+            self._receiver = asyncio.create_task(self._receive(self._reader, self._writer))
+
+    async def close(self) -> None:
+        if self._receiver is not None:
+            self._receiver.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._receiver
+            self._receiver = None
+
+    async def write(self, rows: List[Dict[str, Any]]) -> None:
+        """Send a batch and wait until the writer has committed it"""
+        await self._request("commit", rows)
+        analytics_cache.invalidate_open()
+        live_counts.add_rows(rows)
+
+    async def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Send rows to the writer's ingest log and wait until they are durable there"""
+        await self._request("append", rows)
+
+    async def _request(self, op: str, rows: List[Dict[str, Any]]) -> None:
+        if not self.connected:
+            if self._receiver is not None:
+                self.reconnects += 1
+            await self.connect()
+
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            write_frame(self._writer, (request_id, op, rows))
+            self.sent_batches += 1
+            await self._writer.drain()
+            error = await future
+        except ConnectionError as e:
+            self.failed_batches += 1
+            raise WriterUnavailable(f"Lost connection to the ingest writer: {e}") from e
+        except WriterUnavailable:
+            self.failed_batches += 1
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+        if error is not None:
+            self.failed_batches += 1
+            kind, message = error
+            raise _ERRORS.get(kind, WriteFailed)(message)
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message[0] == "ack":
+                    _, request_id, error = message
+                    future = self._pending.get(request_id)
+                    if future is not None and not future.done():
+                        future.set_result(error)
+                elif message[0] == "horizon":
+                    _, self._unapplied_since = message
+                elif message[0] == "dropped":
+                    # Retention dropped partitions; cached closed ranges may still count their events
+                    analytics_cache.clear()
+                else:
+                    # Another worker's events were committed
+                    _, deltas = message
+                    analytics_cache.invalidate_open()
+                    live_counts.add(deltas)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("Lost connection to the ingest writer")
+        finally:
+            writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(WriterUnavailable("Lost connection to the ingest writer"))
+
+    def unapplied_since(self) -> Optional[datetime]:
+        """Timestamp of the oldest event waiting in the writer's ingest log, as last reported"""
+        return self._unapplied_since
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "socket": self.path,
+            "connected": self.connected,
+            "in_flight": len(self._pending),
+            "sent_batches": self.sent_batches,
+            "failed_batches": self.failed_batches,
+            "reconnects": self.reconnects,
+        }
+
+# A batch waiting for the group commit: its rows, the connection it came from and its request ID
+_Batch = Tuple[List[Dict[str, Any]], asyncio.StreamWriter, int]
+
+class WriterServer:
+    """Accepts batches from the API workers and commits them in groups"""
+
+    def __init__(
+        self,
+        path: str,
+        store=write_event_rows,
+        max_group_rows: int = config.INGEST_WRITER_MAX_GROUP_ROWS,
+        log_directory: Optional[str] = None
+    ):
+        self.path = path
+        self.store = store
+        self.max_group_rows = max_group_rows
+        self.event_log = eventlog.EventLog(log_directory, on_apply=self._broadcast_rows) if log_directory else None
+        self._appends: Set[asyncio.Task] = set()
+        self._horizon: Optional[datetime] = None
+
+        self._server: Optional[asyncio.Server] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+        self.groups = 0
+        self.batches = 0
+        self.events = 0
+        self.failed_batches = 0
+
+    async def start(self) -> None:
+        # A socket file left by a writer that did not shut down cleanly would make bind fail
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self.event_log is not None:
+            await self.event_log.start()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+        os.chmod(self.path, 0o600)
+
+    async def stop(self) -> None:
+        """Stop accepting connections, commit every queued batch, then disconnect the workers"""
+        self._server.close()
+        await self._queue.put(_STOP)
+        await self._task
+        if self.event_log is not None:
+            # Syncs the appends already received, so their acknowledgements can still go out
+            await self.event_log.stop()
+            await asyncio.gather(*self._appends)
+        for connection in list(self._connections):
+            connection.close()
+        await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        if self._horizon is not None:
+            write_frame(writer, ("horizon", self._horizon))
+        try:
+            while True:
+                request_id, op, rows = await read_frame(reader)
+                if op == "append":
+                    task = asyncio.create_task(self._append(rows, writer, request_id))
+                    self._appends.add(task)
+                    task.add_done_callback(self._appends.discard)
+                else:
+                    self._queue.put_nowait((rows, writer, request_id))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _append(self, rows: List[Dict[str, Any]], connection: asyncio.StreamWriter, request_id: int) -> None:
+        error = None
+        try:
+            if self.event_log is None:
+                raise WriteFailed("The ingest writer has no ingest log")
+            await self.event_log.append(rows)
+            self._publish_horizon()
+        except Exception as e:
+            error = _error(e)
+        if not connection.is_closing():
+            write_frame(connection, ("ack", request_id, error))
+
+    def _broadcast_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """Tell every worker that the ingest log's rows were committed, with their counts per event_type and minute"""
+        deltas = count_rows(rows)
+        for connection in self._connections:
+            if not connection.is_closing():
+                write_frame(connection, ("committed", deltas))
+        self._publish_horizon()
+
+    def partitions_dropped(self, names: List[str]) -> None:
+        """Tell every worker that retention dropped partitions"""
+        for connection in self._connections:
+            if not connection.is_closing():
+                write_frame(connection, ("dropped", names))
+
+    def _publish_horizon(self) -> None:
+        """Tell every worker when the oldest event waiting in the ingest log changes"""
+        horizon = self.event_log.unapplied_since()
+        if horizon == self._horizon:
+            return
+        self._horizon = horizon
+        for connection in self._connections:
+            if not connection.is_closing():
+                write_frame(connection, ("horizon", horizon))
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            # Whatever queued up during the previous commit goes into this one
+            group = [item]
+            rows = len(item[0])
+            while rows < self.max_group_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+                rows += len(item[0])
+
+            await self._commit(group)
+
+    async def _commit(self, group: List[_Batch]) -> None:
+        try:
+            await self.store([row for rows, _, _ in group for row in rows])
+            errors: List[Optional[Tuple[str, str]]] = [None] * len(group)
+        except Exception as e:
+            if len(group) == 1:
+                errors = [_error(e)]
+            else:
+                # Retry the batches one by one so a bad batch does not fail its neighbours
+                errors = []
+                for rows, _, _ in group:
+                    try:
+                        await self.store(rows)
+                        errors.append(None)
+                    except Exception as batch_error:
+                        errors.append(_error(batch_error))
+
+        for (rows, connection, request_id), error in zip(group, errors):
+            if error is None:
+                self.events += len(rows)
+            else:
+                self.failed_batches += 1
+                logger.error("Failed to commit %d events: %s", len(rows), error[1])
+            if not connection.is_closing():
+                write_frame(connection, ("ack", request_id, error))
+        self.groups += 1
+        self.batches += len(group)
+
+        # Each worker hears about the committed batches other than its own, which it counted on the ack
+        committed = [
+            (connection, count_rows(rows))
+            for (rows, connection, _), error in zip(group, errors) if error is None
+        ]
+        for connection in self._connections:
+            deltas: Dict[Any, int] = {}
+            for source, batch_deltas in committed:
+                if source is not connection:
+                    for key, count in batch_deltas.items():
+                        deltas[key] = deltas.get(key, 0) + count
+            if deltas and not connection.is_closing():
+                write_frame(connection, ("committed", deltas))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._connections),
+            "ingest_log": self.event_log.stats() if self.event_log is not None else None,
+            "queued_batches": self._queue.qsize() if self._queue is not None else 0,
+            "groups": self.groups,
+            "batches": self.batches,
+            "events": self.events,
+            "failed_batches": self.failed_batches,
+            "avg_batches_per_group": round(self.batches / self.groups, 2) if self.groups else 0.0,
+        }
+
+async def serve(path: str) -> None:
+    """Prepare the database, then commit the workers' batches until SIGTERM or SIGINT"""
+    logs.configure()
+    await prepare_database()
+    server = WriterServer(path, log_directory=eventlog.log_directory())
+    await server.start()
+    maintenance = asyncio.create_task(partitions.maintenance_loop(on_dropped=server.partitions_dropped))
+    logger.info("Ingest writer listening", extra={"socket": path})
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        maintenance.cancel()
+        with suppress(asyncio.CancelledError):
+            await maintenance
+        await server.stop()
+        logger.info("Ingest writer stopped", extra=server.stats())
+        await dispose_engines()
+        logs.shutdown()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.writer", description="Run the single ingest writer process")
+    parser.add_argument(
+        "--socket", default=config.INGEST_WRITER_SOCKET, required=not config.INGEST_WRITER_SOCKET,
+        help="Unix socket to listen on (default: INGEST_WRITER_SOCKET)"
+    )
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""
+Load-testing and benchmark suite for the analytics service.
+
+Seeds datasets with the sample-data generator's event mix, drives the real
+FastAPI app in-process (httpx ASGI transport) and over a local uvicorn
+socket, and writes throughput and latency percentiles per endpoint as JSON.
+
+    python -m bench run --sizes 10k,1m,10m --output results.json
+    python -m bench compare before.json after.json
+"""
@@ -0,0 +1,151 @@
+"""
+Command line entry point.
+
+    python -m bench run [--sizes 10k,1m,10m] [--modes inprocess,socket]
+                        [--scenarios ingest,event-counts,...] [--concurrency 32]
+                        [--duration 10] [--output bench-results.json]
+    python -m bench compare BASE.json HEAD.json [--threshold 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from . import compare, dataset, runner, workload
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Seed datasets and measure every scenario")
+    run.add_argument("--sizes", default="10k,1m,10m", help="Comma-separated dataset sizes (e.g. 10k,1m,10m)")
+    run.add_argument("--modes", default=",".join(runner.MODES), help="inprocess, socket or both")
+    run.add_argument("--scenarios", default=",".join(workload.SCENARIOS), help="Comma-separated scenarios")
+    run.add_argument("--concurrency", type=int, default=32, help="Concurrent closed-loop clients")
+    run.add_argument("--duration", type=float, default=10.0, help="Measured seconds per scenario")
+    run.add_argument("--warmup", type=float, default=2.0, help="Unrecorded seconds before each scenario")
+    run.add_argument("--seed", type=int, default=42, help="Random seed for datasets and request parameters")
+    run.add_argument("--data-dir", default=".bench-data", help="Where generated datasets are cached")
+    run.add_argument("--cache", action="store_true",
+                     help="Keep the analytics response cache on (off by default so queries reach the database)")
+    run.add_argument("--output", default="bench-results.json", help="JSON results file")
+
+    cell = commands.add_parser("cell", help=argparse.SUPPRESS)
+    cell.add_argument("--mode", choices=runner.MODES, required=True)
+    cell.add_argument("--rows", type=int, required=True)
+    cell.add_argument("--scenarios", required=True)
+    cell.add_argument("--concurrency", type=int, required=True)
+    cell.add_argument("--duration", type=float, required=True)
+    cell.add_argument("--warmup", type=float, required=True)
+    cell.add_argument("--seed", type=int, required=True)
+    cell.add_argument("--output", required=True)
+
+    diff = commands.add_parser("compare", help="Diff two result files")
+    diff.add_argument("base")
+    diff.add_argument("head")
+    diff.add_argument("--threshold", type=float, default=10.0,
+                      help="Percent throughput drop or p99 growth reported as a regression")
+    return parser.parse_args()
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_cell(args):
+    results = asyncio.run(runner.run_cell(
+        mode=args.mode,
+        rows=args.rows,
+        scenarios=args.scenarios.split(","),
+        concurrency=args.concurrency,
+        duration=args.duration,
+        warmup=args.warmup,
+        seed=args.seed,
+    ))
+    with open(args.output, "w") as f:
+        json.dump(results, f)
+
+def run(args):
+    sizes = [dataset.parse_size(size) for size in args.sizes.split(",")]
+    modes = args.modes.split(",")
+    scenarios = args.scenarios.split(",")
+    for name in modes:
+        if name not in runner.MODES:
+            sys.exit(f"Unknown mode: {name}")
+    for name in scenarios:
+        if name not in workload.SCENARIOS:
+            sys.exit(f"Unknown scenario: {name} (choose from {', '.join(workload.SCENARIOS)})")
+
+    from app import config
+
+    output = {
+        "meta": {
+            "git_commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sqlite_profile": config.SQLITE_PROFILE,
+            "analytics_cache": args.cache,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+
+    for rows in sizes:
+        source = dataset.ensure_dataset(args.data_dir, rows, args.seed)
+        for mode in modes:
+            with tempfile.TemporaryDirectory(prefix="bench-") as tmpdir:
+                database = dataset.working_copy(source, tmpdir)
+                env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{database}")
+                if not args.cache:
+                    env["ANALYTICS_CACHE_MAX_BYTES"] = "0"
+                cell_output = os.path.join(tmpdir, "cell.json")
+                print(f"\n{dataset.format_size(rows)} rows, {mode}", flush=True)
+                subprocess.run([
+                    sys.executable, "-m", "bench", "cell",
+                    "--mode", mode,
+                    "--rows", str(rows),
+                    "--scenarios", ",".join(scenarios),
+                    "--concurrency", str(args.concurrency),
+                    "--duration", str(args.duration),
+                    "--warmup", str(args.warmup),
+                    "--seed", str(args.seed),
+                    "--output", cell_output,
+                ], env=env, check=True)
+                with open(cell_output) as f:
+                    output["results"].extend(json.load(f))
+
+        # Written after every size so a long 10M run still leaves partial results
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+    print(f"\nResults written to {args.output}")
+
+def main():
+    args = parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "cell":
+        run_cell(args)
+    else:
+        regressions = compare.compare(compare.load(args.base), compare.load(args.head), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Diff two benchmark result files and flag regressions"""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+Key = Tuple[str, int, str]
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def index(results: Dict[str, Any]) -> Dict[Key, Dict[str, Any]]:
+    return {(r["mode"], r["rows"], r["scenario"]): r for r in results["results"]}
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+def compare(base: Dict[str, Any], head: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Print throughput and p99 changes for every cell present in both files.
+
+    Returns the cells whose throughput dropped or whose p99 grew by more
+    than `threshold` percent.
+    """
+    base_cells, head_cells = index(base), index(head)
+    regressions = []
+    print(f"base: {base['meta'].get('git_commit')}  head: {head['meta'].get('git_commit')}\n")
+    print(f"{'mode':<10}{'rows':>10}  {'scenario':<22}{'req/s':>12}{'change':>9}{'p99 ms':>12}{'change':>9}")
+    for key in sorted(base_cells.keys() & head_cells.keys()):
+        old, new = base_cells[key], head_cells[key]
+        rps_change = change(old["throughput_rps"], new["throughput_rps"])
+        p99_change = change(old["latency_ms"]["p99"], new["latency_ms"]["p99"])
+        regressed = rps_change < -threshold or p99_change > threshold
+        mode, rows, scenario = key
+        print(
+            f"{mode:<10}{rows:>10}  {scenario:<22}{new['throughput_rps']:>12.1f}{rps_change:>+8.1f}%"
+            f"{new['latency_ms']['p99']:>12.2f}{p99_change:>+8.1f}%{'  <-- regression' if regressed else ''}"
+        )
+        if regressed:
+            regressions.append(f"{mode}/{rows}/{scenario}")
+
+    for key in sorted(base_cells.keys() ^ head_cells.keys()):
+        print(f"only in {'base' if key in base_cells else 'head'}: {'/'.join(map(str, key))}")
+    return regressions
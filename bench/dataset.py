@@ -0,0 +1,65 @@
+"""Seeded SQLite datasets of a given size, built once and reused across runs"""
+
+import os
+import shutil
+import time
+
+from . import workload
+from .workload import generator
+
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+def parse_size(value: str) -> int:
+    """'10k' -> 10000, '1m' -> 1000000, '2500' -> 2500"""
+    value = value.strip().lower()
+    if value and value[-1] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(value)
+
+def format_size(rows: int) -> str:
+    for suffix, scale in (("m", 1_000_000), ("k", 1_000)):
+        if rows >= scale and rows % scale == 0:
+            return f"{rows // scale}{suffix}"
+    return str(rows)
+
+def users_for(rows: int) -> int:
+    """Roughly 100 events per user, like a busy site with mostly short visits"""
+    return min(100_000, max(50, rows // 100))
+
+def dataset_path(data_dir: str, rows: int, seed: int) -> str:
+    return os.path.join(data_dir, f"events-{format_size(rows)}-seed{seed}.db")
+
+def ensure_dataset(data_dir: str, rows: int, seed: int, chunk_size: int = generator.CHUNK_SIZE) -> str:
+    """
+    Path to a database holding `rows` generated events, building it if needed.
+
+    Datasets are keyed by size and seed and built under a temporary name, so
+    an interrupted build is never mistaken for a finished one.
+    """
+    path = dataset_path(data_dir, rows, seed)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(data_dir, exist_ok=True)
+    building = path + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+
+    print(f"Building {format_size(rows)}-row dataset at {path}", flush=True)
+    started = time.perf_counter()
+    generator.generate_dataset(
+        building,
+        num_events=rows,
+        seed=seed,
+        chunk_size=chunk_size,
+        user_ids=workload.user_ids(users_for(rows)),
+    )
+    os.replace(building, path)
+    print(f"Built in {time.perf_counter() - started:.1f}s", flush=True)
+    return path
+
+def working_copy(path: str, directory: str) -> str:
+    """Copy a dataset so ingest load never alters the cached original"""
+    target = os.path.join(directory, os.path.basename(path))
+    shutil.copyfile(path, target)
+    return target
@@ -0,0 +1,194 @@
+"""
+Drive one target (in-process app or uvicorn socket) through the scenarios.
+
+Each (dataset size, mode) cell runs in its own process: the app reads its
+configuration when app.main is imported, so a fresh interpreter is the only
+clean way to point it at another database.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+import httpx
+
+from . import workload
+
+MODES = ("inprocess", "socket")
+PERCENTILES = (50, 95, 99)
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(seconds * 1000 for seconds in latencies)
+    latency = {f"p{pct}": round(percentile(ordered, pct), 3) for pct in PERCENTILES}
+    latency["mean"] = round(sum(ordered) / len(ordered), 3) if ordered else 0.0
+    latency["max"] = round(ordered[-1], 3) if ordered else 0.0
+    return {
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency,
+    }
+
+async def drive(
+    client: httpx.AsyncClient,
+    make_request: Callable[[List[str]], workload.Request],
+    users: List[str],
+    concurrency: int,
+    duration: float,
+    warmup: float
+) -> Dict[str, Any]:
+    """Run `concurrency` closed-loop clients for warmup + duration seconds; only the latter is recorded"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    recording = False
+
+    async def client_loop(stop_at: float):
+        while time.perf_counter() < stop_at:
+            method, path, kwargs = make_request(users)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if recording:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status.startswith("2"):
+                    latencies.append(elapsed)
+            # The ASGI transport never suspends on its own, so yield like a socket would
+            await asyncio.sleep(0)
+
+    if warmup > 0:
+        await asyncio.gather(*[client_loop(time.perf_counter() + warmup) for _ in range(concurrency)])
+
+    recording = True
+    started = time.perf_counter()
+    await asyncio.gather(*[client_loop(started + duration) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed)
+    result["duration_s"] = round(elapsed, 3)
+    result["statuses"] = statuses
+    result["errors"] = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return result
+
+async def drain_ingest(client: httpx.AsyncClient, timeout: float = 120.0) -> Dict[str, Any]:
+    """Wait for the ingest log or write-behind queue to empty and return the health report"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        health = (await client.get("/health")).json()
+        log = health["ingest_log"]
+        pending = log["lag_bytes"] if log is not None else health["ingest"]["queue_depth"]
+        if pending == 0 or time.perf_counter() > deadline:
+            return health
+        await asyncio.sleep(0.05)
+
+def committed_events(health: Dict[str, Any]) -> int:
+    log = health["ingest_log"]
+    return log["applied_events"] if log is not None else health["ingest"]["flushed_events"]
+
+@asynccontextmanager
+async def inprocess_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    # Per-event INFO logs would flood the terminal and dominate the profile
+    logging.disable(logging.INFO)
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@asynccontextmanager
+async def socket_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        env=os.environ.copy(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            deadline = time.perf_counter() + 120
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("uvicorn did not become healthy within 120s")
+                await asyncio.sleep(0.1)
+            yield client
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+TARGETS = {"inprocess": inprocess_client, "socket": socket_client}
+
+async def run_cell(
+    mode: str,
+    rows: int,
+    scenarios: List[str],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int
+) -> List[Dict[str, Any]]:
+    """All scenarios against one target; DATABASE_URL must already point at the dataset copy"""
+    from .dataset import users_for
+
+    random.seed(seed)
+    users = workload.user_ids(users_for(rows))
+    results = []
+    async with TARGETS[mode](concurrency) as client:
+        for scenario in scenarios:
+            method, path, _ = workload.SCENARIOS[scenario](users)
+            print(f"  {mode:<9} {scenario:<22} ({concurrency} clients, {duration}s)", flush=True)
+            before = (await client.get("/health")).json()
+            result = await drive(client, workload.SCENARIOS[scenario], users, concurrency, duration, warmup)
+            result.update({"mode": mode, "rows": rows, "scenario": scenario, "endpoint": f"{method} {path}",
+                           "concurrency": concurrency})
+
+            if scenario == "ingest":
+                # 202 only means logged or queued; report what actually reached the database too
+                after = await drain_ingest(client)
+                result["committed_events"] = committed_events(after) - committed_events(before)
+                result["failed_events"] = after["ingest"]["failed_events"] - before["ingest"]["failed_events"]
+
+            latency = result["latency_ms"]
+            print(
+                f"    {result['throughput_rps']:>10.1f} req/s  p50={latency['p50']:.2f}ms  "
+                f"p95={latency['p95']:.2f}ms  p99={latency['p99']:.2f}ms  errors={result['errors']}",
+                flush=True
+            )
+            results.append(result)
+    return results
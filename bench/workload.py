@@ -0,0 +1,65 @@
+"""Request generators built on the sample-data generator's event mix"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from scripts import generate_events as generator
+
+START_DATE = generator.START_DATE
+END_DATE = generator.END_DATE
+
+# (method, path, httpx request kwargs)
+Request = Tuple[str, str, Dict[str, Any]]
+
+def user_ids(count: int) -> List[str]:
+    """Deterministic user IDs, shared by the seeded dataset and the ingest load"""
+    return [f"user_{i:08d}" for i in range(count)]
+
+def event_body(users: List[str]) -> Dict[str, Any]:
+    """A POST /events body with the generator's 60/30/10 view/click/location mix"""
+    event = generator.generate_event(random.choice(users))
+    return {"user_id": event["user_id"], "event_type": event["event_type"], "payload": json.loads(event["payload"])}
+
+def random_range(min_span: timedelta, max_span: timedelta) -> Tuple[datetime, datetime]:
+    """A random [start, end] window inside the dataset's date range"""
+    span = min(END_DATE - START_DATE, min_span + (max_span - min_span) * random.random())
+    start = START_DATE + (END_DATE - START_DATE - span) * random.random()
+    return start, start + span
+
+def random_event_type() -> Dict[str, str]:
+    """No filter half the time, otherwise one event type drawn from the mix"""
+    if random.random() < 0.5:
+        return {}
+    return {"event_type": random.choices(generator.EVENT_TYPES, weights=generator.EVENT_WEIGHTS)[0]}
+
+def ingest(users: List[str]) -> Request:
+    return "POST", "/events", {"json": event_body(users)}
+
+def event_counts(users: List[str]) -> Request:
+    start, end = random_range(timedelta(days=1), timedelta(days=28))
+    params = {"start_date": start.strftime("%Y-%m-%d"), "end_date": end.strftime("%Y-%m-%d"), **random_event_type()}
+    return "GET", "/analytics/event-counts", {"params": params}
+
+def event_counts_by_type(users: List[str]) -> Request:
+    start, end = random_range(timedelta(days=1), timedelta(days=28))
+    params = {"start_date": start.strftime("%Y-%m-%d"), "end_date": end.strftime("%Y-%m-%d")}
+    return "GET", "/analytics/event-counts-by-type", {"params": params}
+
+def timeseries(users: List[str]) -> Request:
+    interval, max_span = random.choice([
+        ("minute", timedelta(hours=6)),
+        ("hour", timedelta(days=7)),
+        ("day", timedelta(days=28)),
+    ])
+    start, end = random_range(max_span / 4, max_span)
+    params = {"interval": interval, "start": start.isoformat(), "end": end.isoformat(), **random_event_type()}
+    return "GET", "/analytics/timeseries", {"params": params}
+
+SCENARIOS: Dict[str, Callable[[List[str]], Request]] = {
+    "ingest": ingest,
+    "event-counts": event_counts,
+    "event-counts-by-type": event_counts_by_type,
+    "timeseries": timeseries,
+}
@@ -0,0 +1,142 @@
+"""
+Concurrency benchmark for the ingest path.
+
+Measures POST /events latency on its own and again while analytics queries
+run concurrently against the same database, using the app in-process through
+httpx's ASGI transport. With the async data layer the analytics queries no
+longer block the event loop, so ingest p99 should stay flat between the two
+phases.
+
+Usage:
+    python scripts/bench_concurrency.py --rows 200000 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows to seed before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per phase")
+    parser.add_argument("--ingest-clients", type=int, default=20, help="Concurrent POST /events clients")
+    parser.add_argument("--analytics-clients", type=int, default=4, help="Concurrent analytics clients in phase 2")
+    parser.add_argument("--database-url", default=None, help="Database URL (default: a temporary SQLite file)")
+    return parser.parse_args()
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name, samples, elapsed):
+    ms = [s * 1000 for s in samples]
+    print(
+        f"  {name:<34} n={len(ms):>7}  rps={len(ms) / elapsed:>9.1f}  "
+        f"p50={percentile(ms, 50):>7.2f}ms  p95={percentile(ms, 95):>7.2f}ms  p99={percentile(ms, 99):>7.2f}ms"
+    )
+
+async def seed(crud, WriterSession, rows):
+    """Bulk-load synthetic rows spread over the last 30 days"""
+    import json
+    import uuid
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    chunk = []
+    for i in range(rows):
+        chunk.append({
+            "event_id": str(uuid.uuid4()),
+            "user_id": f"user_{random.randrange(5000)}",
+            "event_type": random.choice(["view"] * 6 + ["click"] * 3 + ["location"]),
+            "payload": json.dumps({"url": "https://example.com/"}),
+            "timestamp": now - timedelta(seconds=random.uniform(0, 30 * 86400)),
+        })
+        if len(chunk) == 5000 or i == rows - 1:
+            async with WriterSession() as db:
+                await crud.insert_event_rows(db, chunk)
+            chunk = []
+
+async def ingest_client(client, stop_at, samples):
+    body = {"user_id": "bench_user", "event_type": "view", "payload": {"url": "https://example.com/bench"}}
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.post("/events", json=body)
+        samples.append(time.perf_counter() - started)
+        if response.status_code != 202:
+            raise RuntimeError(f"Unexpected ingest status {response.status_code}: {response.text}")
+        # The ASGI transport never suspends on its own, so yield like a socket would
+        await asyncio.sleep(0)
+
+async def analytics_client(client, stop_at, samples):
+    paths = [
+        "/analytics/event-counts",
+        "/analytics/event-counts?event_type=click",
+        "/analytics/event-counts-by-type",
+    ]
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await client.get(random.choice(paths))
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+
+async def run_phase(client, args, with_analytics):
+    stop_at = time.perf_counter() + args.duration
+    ingest_samples, analytics_samples = [], []
+    tasks = [ingest_client(client, stop_at, ingest_samples) for _ in range(args.ingest_clients)]
+    if with_analytics:
+        tasks += [analytics_client(client, stop_at, analytics_samples) for _ in range(args.analytics_clients)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    summarize("POST /events", ingest_samples, elapsed)
+    if with_analytics:
+        summarize("GET /analytics/* (concurrent)", analytics_samples, elapsed)
+    return percentile(ingest_samples, 99) * 1000
+
+async def main():
+    args = parse_args()
+
+    tmpdir = None
+    if args.database_url is None:
+        tmpdir = tempfile.mkdtemp(prefix="analytics-bench-")
+        args.database_url = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+
+    import logging
+    logging.disable(logging.INFO)
+
+    import httpx
+    from app import crud
+    from app.database import WriterSession, init_db
+    from app.main import app
+
+    print(f"Database: {args.database_url}")
+    await init_db()
+    print(f"Seeding {args.rows} rows...")
+    await seed(crud, WriterSession, args.rows)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"\nPhase 1: ingest only ({args.ingest_clients} clients, {args.duration}s)")
+            baseline_p99 = await run_phase(client, args, with_analytics=False)
+
+            print(f"\nPhase 2: ingest + analytics ({args.analytics_clients} analytics clients)")
+            loaded_p99 = await run_phase(client, args, with_analytics=True)
+
+    print(f"\nIngest p99: {baseline_p99:.2f}ms alone, {loaded_p99:.2f}ms with concurrent analytics "
+          f"({loaded_p99 / baseline_p99 if baseline_p99 else 0:.2f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""
+Measure what logging costs POST /events.
+
+Each mode runs in a fresh process against a fresh database, driving the app
+in-process (httpx ASGI transport) with concurrent clients for --duration
+seconds. Log output goes to a file in the temp directory, as it would to a
+log collector, so terminal speed does not skew the numbers.
+
+- off:      logging disabled
+- sync:     a StreamHandler on the root logger writing every event's record
+            on the event loop, as the service did before app/logs.py
+- queued:   the queue handler and listener thread, every event logged
+- sampled:  the queue handler with LOG_EVENT_SAMPLE_RATE=0.01 (the default)
+
+Usage:
+    python scripts/bench_logging.py --duration 10 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+sys.path.append(SCRIPTS_DIR)
+
+from bench_concurrency import percentile
+from generate_events import generate_event
+
+MODES = ("off", "sync", "queued", "sampled")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of ingest per mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--directory", default=None, help="Where to create the databases (default: a temp dir)")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--log-file", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def make_bodies(count):
+    bodies = []
+    for index in range(count):
+        # The generator stores payloads pre-serialized
+        event = generate_event(f"user_{index % 1000}")
+        body = {"user_id": event["user_id"], "event_type": event["event_type"], "payload": json.loads(event["payload"])}
+        bodies.append(json.dumps(body).encode())
+    return bodies
+
+def install_mode(mode, log_file):
+    """Replace logs.configure so the app's lifespan sets up logging for the mode"""
+    import logging
+
+    from app import logs
+
+    stream = open(log_file, "a")
+    # The benchmark's own client logs every request at INFO; only the service's records count
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if mode == "off":
+        logs.configure = lambda: logging.disable(logging.CRITICAL)
+    elif mode == "sync":
+        def configure():
+            logging.basicConfig(level=logging.INFO, stream=stream, force=True)
+            logs.event_logger.rate = 1.0
+        logs.configure = configure
+    else:
+        rate = 1.0 if mode == "queued" else 0.01
+        original = logs.configure
+        logs.configure = lambda: original(event_sample_rate=rate, stream=stream)
+
+async def run_mode(args):
+    """Measure one mode in this process"""
+    import httpx
+
+    install_mode(args.run_mode, args.log_file)
+    from app import logs
+    from app.main import app
+
+    bodies = make_bodies(5000)
+    samples, errors = [], []
+
+    async def client(http, stop_at):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            response = await http.post(
+                "/events", content=random.choice(bodies), headers={"Content-Type": "application/json"}
+            )
+            if response.status_code >= 300:
+                errors.append(response.status_code)
+                continue
+            samples.append(time.perf_counter() - started)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            started = time.perf_counter()
+            stop_at = started + args.duration
+            await asyncio.gather(*[client(http, stop_at) for _ in range(args.concurrency)])
+            elapsed = time.perf_counter() - started
+            dropped = logs.stats()["dropped"]
+
+    ms = [s * 1000 for s in samples]
+    result = {
+        "mode": args.run_mode,
+        "per_s": len(ms) / elapsed,
+        "p50_ms": percentile(ms, 50),
+        "p99_ms": percentile(ms, 99),
+        "errors": len(errors),
+        "dropped": dropped,
+        "log_bytes": os.path.getsize(args.log_file),
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f)
+
+def launch(mode, args, directory):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(directory, f'{mode}.db')}"
+    output = os.path.join(directory, f"{mode}.json")
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--run-mode", mode,
+        "--log-file", os.path.join(directory, f"{mode}.log"),
+        "--output", output,
+        "--duration", str(args.duration),
+        "--concurrency", str(args.concurrency),
+    ]
+    print(f"Running {mode}...", flush=True)
+    subprocess.run(command, env=env, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+def main():
+    args = parse_args()
+    if args.run_mode:
+        asyncio.run(run_mode(args))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="analytics-logging-", dir=args.directory) as directory:
+        results = {mode: launch(mode, args, directory) for mode in MODES}
+
+    print(f"\nPOST /events, {args.concurrency} clients, {args.duration}s per mode\n")
+    rows = [
+        ("requests/s", lambda r: r["per_s"]),
+        ("p50 ms", lambda r: r["p50_ms"]),
+        ("p99 ms", lambda r: r["p99_ms"]),
+        ("errors", lambda r: r["errors"]),
+        ("records dropped", lambda r: r["dropped"]),
+        ("log KiB", lambda r: r["log_bytes"] / 1024),
+    ]
+    print(f"{'':<18}" + "".join(f"{mode:>12}" for mode in MODES))
+    for name, value in rows:
+        print(f"{name:<18}" + "".join(f"{value(results[mode]):>12.1f}" for mode in MODES))
+
+if __name__ == "__main__":
+    main()
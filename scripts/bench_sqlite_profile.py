@@ -0,0 +1,178 @@
+"""
+Compare the "default" and "tuned" SQLite engine profiles.
+
+Each profile runs in a fresh process against a fresh database file. After
+seeding, writer tasks commit small event batches through WriterSession while
+reader tasks run analytics queries through SessionLocal, the way the ingest
+buffer and the /analytics/* handlers share the database. Commits/s, read
+queries/s, latency percentiles and lock errors are printed side by side.
+
+Usage:
+    python scripts/bench_sqlite_profile.py --rows 200000 --duration 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+sys.path.append(SCRIPTS_DIR)
+
+from bench_concurrency import percentile, seed
+
+PROFILES = ("default", "tuned")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows to seed before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of mixed load per profile")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writer tasks")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent reader tasks")
+    parser.add_argument("--batch-size", type=int, default=50, help="Events per write transaction")
+    parser.add_argument("--synchronous", default=None, help="SQLITE_SYNCHRONOUS for the tuned run")
+    parser.add_argument("--directory", default=None, help="Where to create the databases (default: a temp dir)")
+    parser.add_argument("--run-profile", choices=PROFILES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def make_rows(count, now):
+    return [
+        {
+            "event_id": str(uuid.uuid4()),
+            "user_id": f"user_{random.randrange(5000)}",
+            "event_type": random.choice(["view"] * 6 + ["click"] * 3 + ["location"]),
+            "payload": json.dumps({"url": "https://example.com/"}),
+            "timestamp": now,
+        }
+        for _ in range(count)
+    ]
+
+async def writer(WriterSession, crud, args, stop_at, samples, errors):
+    while time.perf_counter() < stop_at:
+        rows = make_rows(args.batch_size, datetime.now(timezone.utc).replace(tzinfo=None))
+        started = time.perf_counter()
+        try:
+            async with WriterSession() as db:
+                await crud.insert_event_rows(db, rows)
+        except Exception as e:
+            errors.append(type(e).__name__)
+            continue
+        samples.append(time.perf_counter() - started)
+
+async def reader(SessionLocal, crud, stop_at, samples, errors):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        try:
+            async with SessionLocal() as db:
+                if random.random() < 0.5:
+                    # Arbitrary second-aligned bounds exercise the raw-event edges as well as the rollups
+                    start = now - timedelta(seconds=random.uniform(3600, 30 * 86400))
+                    await crud.get_event_counts_by_type(db, start_date=start, end_date=now)
+                else:
+                    await crud.get_events(db, limit=100, user_id=f"user_{random.randrange(5000)}")
+        except Exception as e:
+            errors.append(type(e).__name__)
+            continue
+        samples.append(time.perf_counter() - started)
+
+def summary(samples, elapsed):
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "per_s": len(ms) / elapsed,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
+
+async def run_profile(args):
+    """Measure one profile in this process; SQLITE_PROFILE is read when app.database is imported"""
+    from app import config, crud
+    from app.database import SessionLocal, WriterSession, dispose_engines, init_db
+
+    await init_db()
+    await seed(crud, WriterSession, args.rows)
+
+    stop_at = time.perf_counter() + args.duration
+    write_samples, read_samples, write_errors, read_errors = [], [], [], []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[writer(WriterSession, crud, args, stop_at, write_samples, write_errors) for _ in range(args.writers)],
+        *[reader(SessionLocal, crud, stop_at, read_samples, read_errors) for _ in range(args.readers)],
+    )
+    elapsed = time.perf_counter() - started
+    await dispose_engines()
+
+    result = {
+        "profile": config.SQLITE_PROFILE,
+        "synchronous": config.SQLITE_SYNCHRONOUS,
+        "writes": summary(write_samples, elapsed),
+        "reads": summary(read_samples, elapsed),
+        "write_errors": len(write_errors),
+        "read_errors": len(read_errors),
+    }
+    result["events_per_s"] = result["writes"]["per_s"] * args.batch_size
+    with open(args.output, "w") as f:
+        json.dump(result, f)
+
+def launch(profile, args, directory):
+    env = dict(os.environ, SQLITE_PROFILE=profile)
+    env["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(directory, f'{profile}.db')}"
+    if args.synchronous:
+        env["SQLITE_SYNCHRONOUS"] = args.synchronous
+    output = os.path.join(directory, f"{profile}.json")
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--run-profile", profile,
+        "--output", output,
+        "--rows", str(args.rows),
+        "--duration", str(args.duration),
+        "--writers", str(args.writers),
+        "--readers", str(args.readers),
+        "--batch-size", str(args.batch_size),
+    ]
+    print(f"Running SQLITE_PROFILE={profile}...", flush=True)
+    subprocess.run(command, env=env, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+def main():
+    args = parse_args()
+    if args.run_profile:
+        asyncio.run(run_profile(args))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="analytics-profile-", dir=args.directory) as directory:
+        results = {profile: launch(profile, args, directory) for profile in PROFILES}
+
+    print(
+        f"\n{args.rows} seeded rows, {args.writers} writers x {args.batch_size} events/commit, "
+        f"{args.readers} readers, {args.duration}s\n"
+    )
+    rows = [
+        ("commits/s", lambda r: r["writes"]["per_s"]),
+        ("events/s", lambda r: r["events_per_s"]),
+        ("commit p50 ms", lambda r: r["writes"]["p50_ms"]),
+        ("commit p99 ms", lambda r: r["writes"]["p99_ms"]),
+        ("write errors", lambda r: r["write_errors"]),
+        ("read queries/s", lambda r: r["reads"]["per_s"]),
+        ("read p50 ms", lambda r: r["reads"]["p50_ms"]),
+        ("read p99 ms", lambda r: r["reads"]["p99_ms"]),
+        ("read errors", lambda r: r["read_errors"]),
+    ]
+    print(f"{'':<18}" + "".join(f"{profile:>12}" for profile in PROFILES))
+    for name, value in rows:
+        print(f"{name:<18}" + "".join(f"{value(results[profile]):>12.1f}" for profile in PROFILES))
+
+if __name__ == "__main__":
+    main()
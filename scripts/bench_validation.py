@@ -0,0 +1,125 @@
+"""
+Measure the CPU cost of validating and serializing ingested events.
+
+Runs the generator's event mix through three paths, each ending with the
+stored payload JSON and extracted columns of crud.build_event_row:
+
+- legacy:  the previous EventCreate (v1-style validators on a free-form
+           payload dict, re-validated through a throwaway payload model)
+           followed by json.dumps of the raw payload
+- python:  the discriminated-union EventCreate validating a decoded dict,
+           serialized from the validated payload model
+- json:    the same union validating the raw request bytes directly
+
+The legacy and python paths include json.loads of the body, as FastAPI
+would decode it before validation. Results are CPU microseconds per event
+(time.process_time), best of --repeat runs.
+
+Usage:
+    python scripts/bench_validation.py --events 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+sys.path.append(SCRIPTS_DIR)
+
+from pydantic import BaseModel, Field, validator
+
+from app import fields, schemas
+from generate_events import generate_event
+
+class LegacyEventCreate(BaseModel):
+    """EventCreate as it was before the discriminated union"""
+
+    user_id: str = Field(..., min_length=1)
+    event_type: str
+    payload: Dict[str, Any]
+
+    @validator("event_type")
+    def validate_event_type(cls, v):
+        if v not in ["view", "click", "location"]:
+            raise ValueError("event_type must be one of: view, click, location")
+        return v
+
+    @validator("payload")
+    def validate_payload(cls, v, values):
+        if "event_type" not in values:
+            return v
+        event_type = values["event_type"]
+        try:
+            if event_type == "view":
+                schemas.ViewPayload(**v)
+            elif event_type == "click":
+                schemas.ClickPayload(**v)
+            elif event_type == "location":
+                schemas.LocationPayload(**v)
+        except Exception as e:
+            raise ValueError(f'Invalid payload for event_type "{event_type}": {str(e)}')
+        return v
+
+def legacy(body: bytes):
+    event = LegacyEventCreate(**json.loads(body))
+    return json.dumps(event.payload), fields.extract(event.event_type, event.payload)
+
+def python(body: bytes):
+    event = schemas.parse_event(json.loads(body))
+    return event.payload.model_dump_json(exclude_unset=True), fields.extract(event.event_type, vars(event.payload))
+
+def raw_json(body: bytes):
+    event = schemas.parse_event_json(body)
+    return event.payload.model_dump_json(exclude_unset=True), fields.extract(event.event_type, vars(event.payload))
+
+PATHS = {"legacy": legacy, "python": python, "json": raw_json}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20_000, help="Events per run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the event mix")
+    return parser.parse_args()
+
+def measure(bodies, repeat):
+    """Best CPU microseconds per event of each path; runs alternate between paths so drift hits all alike"""
+    best = dict.fromkeys(PATHS, float("inf"))
+    for _ in range(repeat):
+        for name, path in PATHS.items():
+            started = time.process_time()
+            for body in bodies:
+                path(body)
+            best[name] = min(best[name], time.process_time() - started)
+    return {name: seconds / len(bodies) * 1_000_000 for name, seconds in best.items()}
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    bodies = []
+    for index in range(args.events):
+        # The generator stores payloads pre-serialized
+        event = generate_event(f"user_{index % 1000}")
+        body = {"user_id": event["user_id"], "event_type": event["event_type"], "payload": json.loads(event["payload"])}
+        bodies.append(json.dumps(body).encode())
+
+    # Every path must agree on what gets stored
+    for body in bodies[:1000]:
+        stored = {name: path(body) for name, path in PATHS.items()}
+        expected = json.loads(stored["legacy"][0]), stored["legacy"][1]
+        for name in ("python", "json"):
+            assert (json.loads(stored[name][0]), stored[name][1]) == expected, (name, body)
+
+    results = measure(bodies, args.repeat)
+
+    print(f"\n{args.events} events, best of {args.repeat} runs\n")
+    print(f"{'path':<10}{'us/event':>10}{'vs legacy':>12}")
+    for name, micros in results.items():
+        print(f"{name:<10}{micros:>10.2f}{results['legacy'] / micros:>11.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Measure POST /events throughput with several uvicorn workers.
+
+For each worker count, two deployments run against a fresh database:
+
+- direct:  `uvicorn app.main:app --workers N`, every worker committing its
+           own batches and competing for SQLite's write lock
+- writer:  `python -m app.serve --workers N`, the workers sending batches
+           to one writer process that commits them in groups
+
+Load comes from --client-processes processes, each running closed-loop
+HTTP clients for --duration seconds. Besides accepted requests/s, the
+events actually committed are counted from the rollup tables after the
+server has shut down, since a 202 only means an event was queued.
+
+Usage:
+    python scripts/bench_workers.py --workers 1,2,4 --duration 10 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(SCRIPTS_DIR)
+
+from bench_concurrency import percentile
+from generate_events import generate_event
+
+DEPLOYMENTS = ("direct", "writer")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per run")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients in total")
+    parser.add_argument("--client-processes", type=int, default=os.cpu_count() or 1,
+                        help="Processes the clients are spread over")
+    parser.add_argument("--directory", default=None, help="Where to create the databases (default: a temp dir)")
+    return parser.parse_args()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_bodies(count):
+    bodies = []
+    for index in range(count):
+        event = generate_event(f"user_{index % 1000}")
+        body = {"user_id": event["user_id"], "event_type": event["event_type"], "payload": json.loads(event["payload"])}
+        bodies.append(json.dumps(body).encode())
+    return bodies
+
+def client_process(task):
+    """Closed-loop clients in one process; returns (latencies of 202s, other statuses)"""
+    import httpx
+
+    port, clients, duration = task
+    bodies = make_bodies(1000)
+    latencies, failures = [], {}
+
+    async def client(http, stop_at):
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = await http.post("/events", content=random.choice(bodies),
+                                           headers={"Content-Type": "application/json"})
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if status == "202":
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures[status] = failures.get(status, 0) + 1
+
+    async def run():
+        limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as http:
+            stop_at = time.perf_counter() + duration
+            await asyncio.gather(*[client(http, stop_at) for _ in range(clients)])
+
+    asyncio.run(run())
+    return latencies, failures
+
+def start_server(deployment, workers, port, env):
+    if deployment == "direct":
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers)]
+    else:
+        command = [sys.executable, "-m", "app.serve", "--workers", str(workers)]
+    command += ["--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_healthy(port, server, timeout=120):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not become healthy")
+        time.sleep(0.1)
+
+def committed_events(database):
+    conn = sqlite3.connect(database)
+    total = conn.execute("SELECT COALESCE(SUM(count), 0) FROM event_rollups_day").fetchone()[0]
+    conn.close()
+    return total
+
+def run(deployment, workers, args, directory):
+    database = os.path.join(directory, f"{deployment}-{workers}.db")
+    # Both deployments queue POST /events in memory: direct workers cannot share one ingest log
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{database}", LOG_LEVEL="WARNING", INGEST_LOG_DIR="none")
+    # Create the schema once, so N direct workers do not race to create it at startup
+    subprocess.run(
+        [sys.executable, "-c", "import asyncio; from app import writer; asyncio.run(writer.prepare_database())"],
+        cwd=ROOT_DIR, env=env, check=True
+    )
+
+    port = free_port()
+    server = start_server(deployment, workers, port, env)
+    try:
+        wait_healthy(port, server)
+        processes = max(1, min(args.client_processes, args.concurrency))
+        tasks = [
+            (port, args.concurrency * (i + 1) // processes - args.concurrency * i // processes, args.duration)
+            for i in range(processes)
+        ]
+        started = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(client_process, tasks)
+        elapsed = time.perf_counter() - started
+    finally:
+        # SIGTERM lets the workers flush their queues before the counts are read
+        server.terminate()
+        try:
+            server.wait(timeout=120)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    latencies = sorted(s * 1000 for result in results for s in result[0])
+    failures = {}
+    for _, result_failures in results:
+        for status, count in result_failures.items():
+            failures[status] = failures.get(status, 0) + count
+    committed = committed_events(database)
+    return {
+        "accepted_per_s": len(latencies) / elapsed,
+        "committed_per_s": committed / elapsed,
+        "lost": len(latencies) - committed,
+        "failed_requests": sum(failures.values()),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+def main():
+    args = parse_args()
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="analytics-workers-", dir=args.directory) as directory:
+        for workers in worker_counts:
+            for deployment in DEPLOYMENTS:
+                print(f"Running {deployment} with {workers} workers...", flush=True)
+                results[(deployment, workers)] = run(deployment, workers, args, directory)
+
+    print(f"\nPOST /events, {args.concurrency} clients, {args.duration}s per run, {os.cpu_count()} CPUs\n")
+    columns = [(deployment, workers) for workers in worker_counts for deployment in DEPLOYMENTS]
+    print(f"{'':<18}" + "".join(f"{f'{deployment} x{workers}':>14}" for deployment, workers in columns))
+    rows = [
+        ("accepted/s", "accepted_per_s"),
+        ("committed/s", "committed_per_s"),
+        ("lost events", "lost"),
+        ("failed requests", "failed_requests"),
+        ("p50 ms", "p50_ms"),
+        ("p99 ms", "p99_ms"),
+    ]
+    for name, key in rows:
+        print(f"{name:<18}" + "".join(f"{results[column][key]:>14.1f}" for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Export events to a compact columnar file (see app/columnar.py).
+
+Usage:
+    python scripts/export_columnar.py events.evc --start 2025-05-01 --end 2025-05-02
+    python scripts/export_columnar.py events.evc --verify
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import columnar, crud
+from app.database import SQLALCHEMY_DATABASE_URL, SessionLocal, dispose_engines
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="Path of the .evc file to write")
+    parser.add_argument("--start", help="Range start (YYYY-MM-DD or ISO-8601), inclusive")
+    parser.add_argument("--end", help="Range end (YYYY-MM-DD or ISO-8601), inclusive; a bare date covers the whole day")
+    parser.add_argument("--event-type", choices=columnar.EVENT_TYPES, help="Only export one event type")
+    parser.add_argument("--row-group-size", type=int, default=100_000, help="Rows per row group")
+    parser.add_argument("--verify", action="store_true", help="Reload the file afterwards and report read speed")
+    return parser.parse_args()
+
+def parse_bound(value, end_of_day=False):
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1) - timedelta(microseconds=1)
+    return parsed
+
+async def export(args):
+    started = time.perf_counter()
+    with open(args.output, "wb") as fileobj:
+        writer = columnar.ColumnarWriter(fileobj)
+        pending = []
+        async with SessionLocal() as db:
+            async for rows in crud.stream_event_rows(
+                db=db,
+                start_date=parse_bound(args.start),
+                end_date=parse_bound(args.end, end_of_day=True),
+                event_type=args.event_type,
+                chunk_size=min(args.row_group_size, 50_000)
+            ):
+                pending.extend(rows)
+                if len(pending) >= args.row_group_size:
+                    writer.write_row_group(pending[:args.row_group_size])
+                    pending = pending[args.row_group_size:]
+        writer.write_row_group(pending)
+        writer.close()
+    await dispose_engines()
+    return writer.rows_written, time.perf_counter() - started
+
+def verify(path):
+    started = time.perf_counter()
+    rows = 0
+    with open(path, "rb") as fileobj:
+        for group in columnar.read_row_groups(fileobj):
+            rows += len(group["event_id"])
+    return rows, time.perf_counter() - started
+
+def main():
+    args = parse_args()
+    print(f"Database: {SQLALCHEMY_DATABASE_URL}")
+
+    rows, elapsed = asyncio.run(export(args))
+    size = os.path.getsize(args.output)
+    print(f"Wrote {rows} events to {args.output} in {elapsed:.2f}s")
+    print(f"File size: {size / 1024:.1f} KiB ({size / rows if rows else 0:.1f} bytes/event)")
+
+    if args.verify:
+        reloaded, elapsed = verify(args.output)
+        print(f"Reloaded {reloaded} events in {elapsed:.2f}s ({reloaded / elapsed if elapsed else 0:,.0f} events/s)")
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,48 @@
 """
 Sample data generator for the analytics service.
 Generates realistic events for testing the API endpoints.
+
+Events are generated in chunks by a process pool. Each chunk covers its own
+slice of the date range and draws from its own seed, so the output depends
+only on --seed, never on the number of workers. Workers sample payloads
+from pools built once per process, write their chunk to a scratch SQLite
+file, and the parent copies each one into the events table, or into the
+partitions it overlaps, with INSERT ... SELECT. Secondary indexes are built
+after loading.
+
+Usage:
+    python scripts/generate_events.py --events 50000000 --users 1000000 --seed 7
 """
 
 import sys
 import os
 import json
 import random
-from datetime import datetime, timedelta
-from faker import Faker
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 import sqlite3
-import uuid
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-fake = Faker()
+from sqlalchemy import create_engine
+
+from app import config, fields, models, partitions, sketches, topk
+from app.database import (
+    Base, is_legacy_schema, missing_event_columns, sqlite_create_index, sqlite_create_table
+)
+from app.hll import HyperLogLog
+from app.spacesaving import SpaceSaving
 
 
 NUM_EVENTS = 3000
 NUM_USERS = 50
 DATABASE_PATH = "analytics.db"
+CHUNK_SIZE = 250_000
 
 START_DATE = datetime(2025, 5, 1)
 END_DATE = datetime(2025, 5, 29)
@@ -97,16 +120,16 @@ SAMPLE_CLICK_TEXTS = [
     "Cancel",
 ]
 
-def generate_user_ids(num_users):
-    """Generate realistic user IDs"""
-    user_ids = []
-    for i in range(num_users):
+def generate_user_ids(num_users, rng=random):
+    """Generate realistic, unique user IDs"""
+    user_ids = set()
+    while len(user_ids) < num_users:
 
-        if random.random() < 0.3:
-            user_ids.append(f"user_{fake.uuid4()[:8]}")
+        if rng.random() < 0.3:
+            user_ids.add(f"user_{rng.getrandbits(32):08x}")
         else:
-            user_ids.append(f"session_{fake.uuid4()[:12]}")
-    return user_ids
+            user_ids.add(f"session_{rng.getrandbits(48):012x}")
+    return sorted(user_ids)
 
 def generate_view_event(user_id):
     """Generate a view event"""
@@ -181,104 +204,359 @@ def generate_location_event(user_id):
         "payload": json.dumps(payload)
     }
 
-def generate_random_timestamp():
-    """Generate a random timestamp between START_DATE and END_DATE"""
-    time_delta = END_DATE - START_DATE
-    random_days = random.uniform(0, time_delta.total_seconds())
-    return START_DATE + timedelta(seconds=random_days)
-
-def generate_events(num_events, user_ids):
-    """Generate all events"""
-    events = []
-
-
-    event_types = ['view'] * 60 + ['click'] * 30 + ['location'] * 10
-
-    for i in range(num_events):
-        user_id = random.choice(user_ids)
-        event_type = random.choice(event_types)
-        timestamp = generate_random_timestamp()
-
-        if event_type == 'view':
-            event_data = generate_view_event(user_id)
-        elif event_type == 'click':
-            event_data = generate_click_event(user_id)
-        else:  # location
-            event_data = generate_location_event(user_id)
-
-        event = {
-            "event_id": str(uuid.uuid4()),
-            "user_id": event_data["user_id"],
-            "event_type": event_data["event_type"],
-            "timestamp": timestamp.isoformat(),
-            "payload": event_data["payload"]
-        }
-
-        events.append(event)
-
-        if (i + 1) % 500 == 0:
-            print(f"Generated {i + 1}/{num_events} events...")
-
-    return events
+# Share of each event type, in percent
+EVENT_TYPE_WEIGHTS = {"view": 60, "click": 30, "location": 10}
+EVENT_TYPES = list(EVENT_TYPE_WEIGHTS)
+EVENT_WEIGHTS = list(EVENT_TYPE_WEIGHTS.values())
+EVENT_GENERATORS = {
+    "view": generate_view_event,
+    "click": generate_click_event,
+    "location": generate_location_event,
+}
+
+def generate_event(user_id):
+    """Generate one event of a type drawn from the EVENT_TYPE_WEIGHTS mix"""
+    event_type = random.choices(EVENT_TYPES, weights=EVENT_WEIGHTS)[0]
+    return EVENT_GENERATORS[event_type](user_id)
+
+EVENT_COLUMNS = ", ".join(("event_id", "user_key", "event_type", "timestamp", "payload") + fields.COLUMNS)
+
+MINUTE_MICROS = 60_000_000
+HOUR_MICROS = 3_600_000_000
+DAY_MICROS = 86_400_000_000
+_LOW_62 = (1 << 62) - 1
+EVENT_WEIGHTS_BY_CODE = [EVENT_TYPE_WEIGHTS[name] for name in models.EVENT_TYPES]
+
+def chunk_seed(seed, index):
+    """Seed for one chunk, independent of which worker generates it"""
+    return seed * 1_000_003 + index
+
+def build_payload_pools(seed, view_size=4096, click_size=4096, location_size=65536):
+    """Pre-serialized payloads per event type code, drawn with the per-type generators above"""
+    random.seed(seed)
+    sizes = {"view": view_size, "click": click_size, "location": location_size}
+    return [
+        [EVENT_GENERATORS[name]("")["payload"] for _ in range(sizes[name])]
+        for name in models.EVENT_TYPES
+    ]
 
-def create_database_schema():
-    """Create the database schema if it doesn't exist"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def payload_pool_columns(pools):
+    """Extracted column values (in fields.COLUMNS order) of each pooled payload"""
+    return [
+        [tuple(fields.extract_json(name, payload).values()) for payload in pool]
+        for name, pool in zip(models.EVENT_TYPES, pools)
+    ]
 
+# Position in fields.COLUMNS of the top-value field per event type code, None for types without one
+TOPK_COLUMN_BY_CODE = [
+    next(((field, fields.COLUMNS.index(field)) for field, event_type in topk.FIELDS.items() if event_type == name), None)
+    for name in models.EVENT_TYPES
+]
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            event_id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            event_type TEXT NOT NULL CHECK (event_type IN ('view', 'click', 'location')),
-            timestamp TIMESTAMP NOT NULL,
-            payload TEXT NOT NULL
+_payload_pools = None
+_payload_columns = None
+
+def _init_worker(seed):
+    global _payload_pools, _payload_columns
+    _payload_pools = build_payload_pools(seed)
+    _payload_columns = payload_pool_columns(_payload_pools)
+
+def generate_chunk(task):
+    """
+    Generate one chunk of events into a scratch SQLite file.
+
+    Timestamps are sorted within the chunk's slice of the date range and event
+    IDs are UUIDv7s derived from them, so chunks appended in order keep both
+    the primary key and the timestamp index append-only. Returns the scratch
+    path, the chunk's per-minute counts for the rollup tables, its per-hour
+    unique-user sketches and its per-hour counts of each top-value field.
+    """
+    index, count, start_micros, stop_micros, num_users, seed, scratch_dir = task
+    rng = random.Random(chunk_seed(seed, index))
+    uniform = rng.random
+    getrandbits = rng.getrandbits
+
+    width = stop_micros - start_micros
+    timestamps = sorted([start_micros + int(width * uniform()) for _ in range(count)])
+    type_codes = rng.choices(range(len(models.EVENT_TYPES)), weights=EVENT_WEIGHTS_BY_CODE, k=count)
+    user_keys = rng.choices(range(1, num_users + 1), k=count)
+    pools = [(pool, len(pool)) for pool in _payload_pools]
+    payloads = []
+    columns = []
+    for code in type_codes:
+        pool, size = pools[code]
+        pick = int(uniform() * size)
+        payloads.append(pool[pick])
+        columns.append(_payload_columns[code][pick])
+
+    event_ids = []
+    for micros in timestamps:
+        rand = getrandbits(74)
+        value = ((micros // 1000) << 80) | (0x7 << 76) | ((rand >> 62) << 64) | (0b10 << 62) | (rand & _LOW_62)
+        event_ids.append(value.to_bytes(16, "big"))
+
+    path = os.path.join(scratch_dir, f"chunk-{index:06d}.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(
+        "CREATE TABLE events (event_id BLOB, user_key INTEGER, event_type INTEGER, timestamp INTEGER, payload TEXT, "
+        + ", ".join(fields.COLUMNS) + ")"
+    )
+    conn.executemany(
+        f"INSERT INTO events VALUES (?, ?, ?, ?, ?{', ?' * len(fields.COLUMNS)})",
+        (
+            (event_id, user_key, code, micros, payload, *values)
+            for event_id, user_key, code, micros, payload, values
+            in zip(event_ids, user_keys, type_codes, timestamps, payloads, columns)
         )
-    ''')
-
-
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_id ON events(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_event_type ON events(event_type)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_composite ON events(event_type, timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_time ON events(user_id, timestamp)')
-
+    )
     conn.commit()
     conn.close()
+
+    minute_counts = Counter(zip(type_codes, [micros // MINUTE_MICROS for micros in timestamps]))
+
+    hour_users = defaultdict(set)
+    for code, micros, user_key in zip(type_codes, timestamps, user_keys):
+        hour_users[(code, micros // HOUR_MICROS * HOUR_MICROS)].add(user_key)
+    hour_sketches = {}
+    hashes = {}
+    for bucket, keys in hour_users.items():
+        sketch = HyperLogLog(config.HLL_PRECISION)
+        for user_key in keys:
+            hashed = hashes.get(user_key)
+            if hashed is None:
+                hashed = hashes[user_key] = sketches.user_hash(user_key)
+            sketch.add_hash(hashed)
+        hour_sketches[bucket] = sketch
+
+    hour_values = defaultdict(Counter)
+    for code, micros, values in zip(type_codes, timestamps, columns):
+        topk_column = TOPK_COLUMN_BY_CODE[code]
+        if topk_column is not None and values[topk_column[1]] is not None:
+            hour_values[(topk_column[0], micros // HOUR_MICROS * HOUR_MICROS)][values[topk_column[1]]] += 1
+    return path, count, minute_counts, hour_sketches, hour_values
+
+def create_database_schema(database_path):
+    """Create the database schema if it doesn't exist"""
+    engine = create_engine(f"sqlite:///{database_path}")
+    with engine.begin() as conn:
+        if is_legacy_schema(conn):
+            raise RuntimeError("Database uses the legacy schema; run scripts/migrate_compact_storage.py or delete it")
+        if missing_event_columns(conn):
+            raise RuntimeError("Database lacks the payload columns; run scripts/migrate_payload_columns.py or delete it")
+        Base.metadata.create_all(conn)
+    engine.dispose()
     print("Database schema created successfully!")
 
-def insert_events_to_database(events):
-    """Insert events into the SQLite database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def plan_chunks(num_events, start_date, end_date, chunk_size):
+    """(count, start_micros, stop_micros) per chunk, splitting events and time evenly"""
+    chunks = max(1, -(-num_events // chunk_size))
+    start = models.to_epoch_micros(start_date)
+    width = models.to_epoch_micros(end_date) - start
+    return [
+        (
+            num_events * (i + 1) // chunks - num_events * i // chunks,
+            start + width * i // chunks,
+            start + width * (i + 1) // chunks,
+        )
+        for i in range(chunks)
+    ]
 
+def write_rollups(conn, minute_counts):
+    """Fill the minute/hour/day rollup tables from per-minute counts"""
+    levels = {
+        "event_rollups_minute": Counter(),
+        "event_rollups_hour": Counter(),
+        "event_rollups_day": Counter(),
+    }
+    for (code, minute), count in minute_counts.items():
+        micros = minute * MINUTE_MICROS
+        levels["event_rollups_minute"][(code, micros)] += count
+        levels["event_rollups_hour"][(code, micros // HOUR_MICROS * HOUR_MICROS)] += count
+        levels["event_rollups_day"][(code, micros // DAY_MICROS * DAY_MICROS)] += count
+
+    for table, counts in levels.items():
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT INTO {table} (event_type, bucket_start, count) VALUES (?, ?, ?)",
+            [(code, bucket, count) for (code, bucket), count in counts.items()]
+        )
 
-    cursor.execute('DELETE FROM events')
-    print("Cleared existing events from database")
+def write_sketches(conn, hour_sketches):
+    """Fill the hour/day unique-user sketch tables from merged per-hour sketches"""
+    day_sketches = {}
+    for (code, hour), sketch in hour_sketches.items():
+        day = (code, hour // DAY_MICROS * DAY_MICROS)
+        if day in day_sketches:
+            day_sketches[day].merge(sketch)
+        else:
+            day_sketches[day] = HyperLogLog(sketch.precision, bytearray(sketch.registers))
 
+    for table, levels in (("user_sketches_hour", hour_sketches), ("user_sketches_day", day_sketches)):
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT INTO {table} (event_type, bucket_start, registers) VALUES (?, ?, ?)",
+            [(code, bucket, sketch.to_bytes()) for (code, bucket), sketch in levels.items()]
+        )
 
-    for event in events:
-        cursor.execute('''
-            INSERT INTO events (event_id, user_id, event_type, timestamp, payload)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            event['event_id'],
-            event['user_id'],
-            event['event_type'],
-            event['timestamp'],
-            event['payload']
-        ))
+def write_top_values(conn, hour_values):
+    """Fill the hour/day top-value summary tables from exact per-hour value counts"""
+    day_values = defaultdict(Counter)
+    for (field, hour), counts in hour_values.items():
+        day_values[(field, hour // DAY_MICROS * DAY_MICROS)].update(counts)
+
+    for table, levels in (("topk_hour", hour_values), ("topk_day", day_values)):
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            f"INSERT INTO {table} (field, bucket_start, summary) VALUES (?, ?, ?)",
+            [
+                (field, bucket, SpaceSaving.from_counts(counts, config.TOPK_CAPACITY).to_bytes())
+                for (field, bucket), counts in levels.items()
+            ]
+        )
 
-    conn.commit()
+def copy_chunk(conn, target):
+    """Append the attached chunk's events that fall in the target partition"""
+    statement = f"INSERT INTO \"{target.name}\" ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM chunk.events"
+    if target.start is None:
+        conn.execute(statement)
+        return
+    conn.execute(
+        f"{statement} WHERE timestamp >= ? AND timestamp < ?",
+        (models.to_epoch_micros(target.start), models.to_epoch_micros(target.stop))
+    )
+
+def generate_dataset(
+    database_path,
+    num_events,
+    num_users=None,
+    start_date=START_DATE,
+    end_date=END_DATE,
+    seed=0,
+    workers=None,
+    chunk_size=CHUNK_SIZE,
+    user_ids=None,
+):
+    """
+    Replace the events in `database_path` with `num_events` generated ones.
+
+    Pass `user_ids` to use a known set of users instead of generated IDs.
+    Returns the number of events written.
+    """
+    create_database_schema(database_path)
+    if user_ids is None:
+        user_ids = generate_user_ids(num_users, random.Random(seed))
+    workers = workers or os.cpu_count() or 1
+
+    conn = sqlite3.connect(database_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    # Lets CREATE INDEX sort with helper threads
+    conn.execute(f"PRAGMA threads = {min(workers, 8)}")
+
+    if partitions.is_partitioned():
+        targets = partitions.covering(start_date, end_date)
+    else:
+        targets = [partitions.Partition(models.Event.__tablename__, None, None)]
+
+    # Secondary indexes are cheaper to build once than to maintain per row
+    conn.execute("BEGIN")
+    for index in models.Event.__table__.indexes:
+        conn.execute(f'DROP INDEX IF EXISTS "{index.name}"')
+    conn.execute("DELETE FROM events")
+    for (name,) in conn.execute("SELECT name FROM event_partitions").fetchall():
+        conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.execute("DELETE FROM event_partitions")
+    for target in targets:
+        if target.start is not None:
+            conn.execute(sqlite_create_table(target.table))
+            conn.execute(
+                "INSERT INTO event_partitions (name, range_start, range_stop) VALUES (?, ?, ?)",
+                (target.name, models.to_epoch_micros(target.start), models.to_epoch_micros(target.stop))
+            )
+    conn.execute("DELETE FROM users")
+    conn.executemany("INSERT INTO users (id, user_id) VALUES (?, ?)", enumerate(user_ids, start=1))
+    conn.execute("COMMIT")
+    print(f"Cleared existing events and stored {len(user_ids)} users")
+
+    scratch_dir = tempfile.mkdtemp(prefix="generate-", dir=os.path.dirname(os.path.abspath(database_path)))
+    tasks = [
+        (i, count, start, stop, len(user_ids), seed, scratch_dir)
+        for i, (count, start, stop) in enumerate(plan_chunks(num_events, start_date, end_date, chunk_size))
+    ]
+    minute_counts = Counter()
+    hour_sketches = {}
+    hour_values = defaultdict(Counter)
+    written = 0
+    started = time.perf_counter()
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(seed,)) as pool:
+            # imap keeps chunk order, so rows are appended in timestamp order
+            results = pool.imap(generate_chunk, tasks)
+            for task, (path, count, counts, chunk_sketches, chunk_values) in zip(tasks, results):
+                chunk_start, chunk_stop = (models.from_epoch_micros(micros) for micros in task[2:4])
+                conn.execute("ATTACH DATABASE ? AS chunk", (path,))
+                conn.execute("BEGIN")
+                for target in targets:
+                    if target.overlaps(chunk_start, chunk_stop):
+                        copy_chunk(conn, target)
+                conn.execute("COMMIT")
+                conn.execute("DETACH DATABASE chunk")
+                os.remove(path)
+                minute_counts.update(counts)
+                # Neighbouring chunks can share the hour at their boundary
+                for bucket, sketch in chunk_sketches.items():
+                    if bucket in hour_sketches:
+                        hour_sketches[bucket].merge(sketch)
+                    else:
+                        hour_sketches[bucket] = sketch
+                for bucket, values in chunk_values.items():
+                    hour_values[bucket].update(values)
+                written += count
+                elapsed = time.perf_counter() - started
+                print(f"Loaded {written}/{num_events} events ({written / elapsed:,.0f} events/s)")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print("Building indexes, rollups, sketches and top-value summaries...")
+    conn.execute("BEGIN")
+    for target in targets:
+        for index in target.table.indexes:
+            conn.execute(sqlite_create_index(index))
+    write_rollups(conn, minute_counts)
+    write_sketches(conn, hour_sketches)
+    write_top_values(conn, hour_values)
+    conn.execute("COMMIT")
+    # Sampled statistics are enough for the planner and keep ANALYZE flat as the table grows
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    # Partitions that have already closed need no further ANALYZE from the service
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    closed_before = now - timedelta(seconds=config.ANALYTICS_CACHE_CLOSED_GRACE_SECONDS)
+    conn.execute(
+        "UPDATE event_partitions SET compacted_at = ? WHERE range_stop <= ?",
+        (models.to_epoch_micros(now), models.to_epoch_micros(closed_before))
+    )
+    conn.execute("PRAGMA journal_mode = WAL")
     conn.close()
-    print(f"Inserted {len(events)} events into database!")
 
-def verify_data():
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} events in {elapsed:.1f}s ({written / elapsed if elapsed else 0:,.0f} events/s)")
+    return written
+
+def verify_data(database_path):
     """Verify the generated data"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(database_path)
     cursor = conn.cursor()
 
+    # The queries below read every partition through one view
+    names = [name for (name,) in cursor.execute("SELECT name FROM event_partitions ORDER BY range_start")]
+    if names:
+        cursor.execute(
+            "CREATE TEMP VIEW events AS " + " UNION ALL ".join(f'SELECT * FROM main."{name}"' for name in names)
+        )
 
     cursor.execute('SELECT COUNT(*) FROM events')
     total_count = cursor.fetchone()[0]
@@ -294,55 +572,77 @@ def verify_data():
 
     print("\nEvents by type:")
     for event_type, count in cursor.fetchall():
-        print(f"  {event_type}: {count}")
+        print(f"  {models.EVENT_TYPES[event_type]}: {count}")
 
 
     cursor.execute('SELECT MIN(timestamp), MAX(timestamp) FROM events')
-    min_date, max_date = cursor.fetchone()
+    min_date, max_date = (models.from_epoch_micros(value) for value in cursor.fetchone())
     print(f"\nDate range: {min_date} to {max_date}")
 
 
-    cursor.execute('SELECT COUNT(DISTINCT user_id) FROM events')
+    cursor.execute('SELECT COUNT(DISTINCT user_key) FROM events')
     unique_users = cursor.fetchone()[0]
     print(f"Unique users: {unique_users}")
 
 
-    cursor.execute('SELECT * FROM events LIMIT 3')
+    cursor.execute('''
+        SELECT e.event_type, u.user_id, e.timestamp, e.payload
+        FROM events e JOIN users u ON u.id = e.user_key
+        LIMIT 3
+    ''')
     print("\nSample events:")
-    for row in cursor.fetchall():
-        event_id, user_id, event_type, timestamp, payload = row
-        print(f"  {event_type} | {user_id} | {timestamp} | {payload[:50]}...")
+    for event_type, user_id, timestamp, payload in cursor.fetchall():
+        print(f"  {models.EVENT_TYPES[event_type]} | {user_id} | {models.from_epoch_micros(timestamp)} | {payload[:50]}...")
 
     conn.close()
 
+def parse_date(value):
+    return datetime.fromisoformat(value)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=NUM_EVENTS, help="Number of events to generate")
+    parser.add_argument("--users", type=int, default=NUM_USERS, help="Number of distinct users")
+    parser.add_argument("--start", type=parse_date, default=START_DATE, help="Range start (YYYY-MM-DD or ISO datetime)")
+    parser.add_argument("--end", type=parse_date, default=END_DATE, help="Range end (YYYY-MM-DD or ISO datetime), exclusive")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed (default: random, printed for reruns)")
+    parser.add_argument("--database", default=DATABASE_PATH, help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Events per chunk and per load transaction")
+    args = parser.parse_args()
+    if args.end <= args.start:
+        parser.error("--end must be after --start")
+    if args.seed is None:
+        args.seed = random.randrange(2 ** 32)
+    return args
+
 def main():
     """Main function to generate sample data"""
+    args = parse_args()
     print("Starting Analytics Data Generation")
-    print(f"Generating {NUM_EVENTS} events for {NUM_USERS} users...")
-    print(f"Date range: {START_DATE.date()} to {END_DATE.date()}")
-    print(f"Database: {DATABASE_PATH}")
+    print(f"Generating {args.events} events for {args.users} users...")
+    print(f"Date range: {args.start} to {args.end}")
+    print(f"Database: {args.database}")
+    print(f"Seed: {args.seed}")
     print("-" * 50)
 
     try:
 
-        print("1. Creating database schema...")
-        create_database_schema()
-
-
-        print("2. Generating user IDs...")
-        user_ids = generate_user_ids(NUM_USERS)
-
-
-        print("3. Generating events...")
-        events = generate_events(NUM_EVENTS, user_ids)
-
-
-        print("4. Inserting events into database...")
-        insert_events_to_database(events)
+        print("1. Generating and loading events...")
+        generate_dataset(
+            args.database,
+            num_events=args.events,
+            num_users=args.users,
+            start_date=args.start,
+            end_date=args.end,
+            seed=args.seed,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
 
 
-        print("5. Verifying generated data...")
-        verify_data()
+        print("2. Verifying generated data...")
+        verify_data(args.database)
 
         print("\n Data generation completed successfully!")
         print("\n Next steps:")
@@ -0,0 +1,271 @@
+"""
+Migrate an analytics SQLite database from the legacy events schema to the
+compact one.
+
+Legacy rows store the event_id as a 36-character UUID string, repeat the
+user_id and event_type text on every row, keep timestamps as text and carry
+five secondary indexes. The compact schema stores 16-byte binary UUIDs, an
+integer key into a users lookup table, a small-int event type and integer
+epoch-microsecond timestamps, plus the extracted payload columns.
+
+The rollups, unique-user sketches and top-value summaries are rebuilt from
+the copied events. The events stay in the events table itself; to use
+partitions (EVENT_PARTITION_INTERVAL, month by default) run
+scripts/migrate_partitions.py next, which keeps these aggregates as they are.
+
+The script reports database size and the latency of a few representative
+queries before and after migrating.
+
+Usage:
+    python scripts/migrate_compact_storage.py --database analytics.db
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import config, fields, models, rollups, sketches, topk
+from app.database import Base, sqlite_create_index
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="analytics.db", help="Path to the SQLite database")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Rows copied per executemany")
+    parser.add_argument("--no-backup", action="store_true", help="Skip copying the database to <database>.bak first")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per latency measurement")
+    return parser.parse_args()
+
+def is_legacy(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    return "user_id" in columns
+
+def database_size(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+def object_sizes(conn):
+    """Bytes per table/index, if SQLite was built with the dbstat virtual table"""
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    except sqlite3.OperationalError:
+        return {}
+
+def pick_samples(conn):
+    """Choose a user, an event and a 7-day window present in the data"""
+    legacy = is_legacy(conn)
+    if legacy:
+        user_id, event_id, min_ts = conn.execute(
+            "SELECT user_id, event_id, timestamp FROM events ORDER BY timestamp LIMIT 1"
+        ).fetchone()
+        start = datetime.fromisoformat(min_ts).replace(tzinfo=None)
+        separator = "T" if "T" in min_ts else " "
+    else:
+        user_id, event_id, min_ts = conn.execute(
+            "SELECT u.user_id, e.event_id, e.timestamp FROM events e JOIN users u ON u.id = e.user_key "
+            "ORDER BY e.timestamp LIMIT 1"
+        ).fetchone()
+        event_id = str(uuid.UUID(bytes=event_id))
+        start = models.from_epoch_micros(min_ts)
+        separator = None
+    return {
+        "user_id": user_id,
+        "event_id": event_id,
+        "start": start,
+        "stop": start + timedelta(days=7),
+        # Legacy timestamps compare as text, so bounds must use the stored format
+        "separator": separator,
+    }
+
+def representative_queries(legacy, samples):
+    """(name, sql, params) for equivalent queries against either schema"""
+    start, stop = samples["start"], samples["stop"]
+    if legacy:
+        fmt = f"%Y-%m-%d{samples['separator']}%H:%M:%S.%f"
+        return [
+            ("count all events", "SELECT COUNT(*) FROM events", ()),
+            ("count by type, 7 days",
+             "SELECT event_type, COUNT(*) FROM events WHERE timestamp >= ? AND timestamp < ? GROUP BY event_type",
+             (start.strftime(fmt), stop.strftime(fmt))),
+            ("user timeline, 100 rows",
+             "SELECT * FROM events WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100",
+             (samples["user_id"],)),
+            ("event by id", "SELECT * FROM events WHERE event_id = ?", (samples["event_id"],)),
+        ]
+    return [
+        ("count all events", "SELECT COUNT(*) FROM events", ()),
+        ("count by type, 7 days",
+         "SELECT event_type, COUNT(*) FROM events WHERE timestamp >= ? AND timestamp < ? GROUP BY event_type",
+         (models.to_epoch_micros(start), models.to_epoch_micros(stop))),
+        ("user timeline, 100 rows",
+         "SELECT e.*, u.user_id FROM events e JOIN users u ON u.id = e.user_key "
+         "WHERE e.user_key = (SELECT id FROM users WHERE user_id = ?) ORDER BY e.timestamp DESC LIMIT 100",
+         (samples["user_id"],)),
+        ("event by id",
+         "SELECT e.*, u.user_id FROM events e JOIN users u ON u.id = e.user_key WHERE e.event_id = ?",
+         (uuid.UUID(samples["event_id"]).bytes,)),
+    ]
+
+def measure(conn, samples, repeat):
+    """Median latency in ms per representative query"""
+    results = {}
+    for name, sql, params in representative_queries(is_legacy(conn), samples):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+def migrate(path, chunk_size):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = OFF")
+
+    # Index names are global in SQLite, so the legacy ones must go before the new schema is created
+    legacy_indexes = [row[1] for row in conn.execute("PRAGMA index_list(events)") if row[3] == "c"]
+    for name in legacy_indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    conn.execute("ALTER TABLE events RENAME TO events_legacy")
+    for model in rollups.ROLLUP_MODELS.values():
+        conn.execute(f'DROP TABLE IF EXISTS "{model.__tablename__}"')
+    conn.commit()
+
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as sync_conn:
+        Base.metadata.create_all(sync_conn)
+    engine.dispose()
+
+    # Load without secondary indexes and build them once at the end
+    event_indexes = list(models.Event.__table__.indexes)
+    for index in event_indexes:
+        conn.execute(f'DROP INDEX "{index.name}"')
+
+    conn.execute("INSERT OR IGNORE INTO users (user_id) SELECT DISTINCT user_id FROM events_legacy")
+    user_keys = dict(conn.execute("SELECT user_id, id FROM users"))
+
+    total = conn.execute("SELECT COUNT(*) FROM events_legacy").fetchone()[0]
+    reader = conn.cursor()
+    reader.execute("SELECT event_id, user_id, event_type, timestamp, payload FROM events_legacy")
+    copied = 0
+    while True:
+        chunk = reader.fetchmany(chunk_size)
+        if not chunk:
+            break
+        conn.executemany(
+            f"INSERT INTO events (event_id, user_key, event_type, timestamp, payload, {', '.join(fields.COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, ?{', ?' * len(fields.COLUMNS)})",
+            [
+                (
+                    uuid.UUID(event_id).bytes,
+                    user_keys[user_id],
+                    models.EVENT_TYPE_CODES[event_type],
+                    models.to_epoch_micros(datetime.fromisoformat(timestamp)),
+                    payload,
+                    *fields.extract_json(event_type, payload).values(),
+                )
+                for event_id, user_id, event_type, timestamp, payload in chunk
+            ]
+        )
+        copied += len(chunk)
+        print(f"  copied {copied}/{total} events")
+
+    for index in event_indexes:
+        conn.execute(sqlite_create_index(index))
+
+    conn.execute("DROP TABLE events_legacy")
+    conn.commit()
+    conn.close()
+
+async def rebuild_aggregates(path):
+    """Rebuild what scripts/rebuild_rollups.py rebuilds; returns the number of events scanned"""
+    # The copied events are in the events table, not in partitions, whatever EVENT_PARTITION_INTERVAL says
+    interval, config.EVENT_PARTITION_INTERVAL = config.EVENT_PARTITION_INTERVAL, "none"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    try:
+        async with AsyncSession(engine) as db:
+            scanned = await rollups.rebuild(db)
+            print(f"  rollups from {scanned} events")
+            print(f"  unique-user sketches from {await sketches.rebuild(db)} events")
+            print(f"  top-value summaries from {await topk.rebuild(db)} view/click events")
+    finally:
+        config.EVENT_PARTITION_INTERVAL = interval
+        await engine.dispose()
+    return scanned
+
+def compact(path):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.execute("ANALYZE")
+    conn.close()
+
+def print_report(before, after):
+    """Side-by-side table; sizes missing on one side (dropped or new objects) count as zero"""
+    names = list(before) + [name for name in after if name not in before]
+    print(f"\n{'':<44}{'before':>14}{'after':>14}{'change':>10}")
+    for name in names:
+        old, new = before.get(name, 0), after.get(name, 0)
+        unit = "MiB" if name.startswith("size") else "ms"
+        scale = 1024 * 1024 if unit == "MiB" else 1
+        change = f"{new / old:.2f}x" if old else "-"
+        print(f"{name:<44}{old / scale:>10.2f} {unit:<3}{new / scale:>10.2f} {unit:<3}{change:>10}")
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"Database not found: {args.database}")
+
+    conn = sqlite3.connect(args.database)
+    if not is_legacy(conn):
+        conn.close()
+        print(f"{args.database} already uses the compact schema")
+        return
+
+    samples = pick_samples(conn)
+    before = {"size: database": database_size(conn)}
+    before.update({f"size: {name}": size for name, size in object_sizes(conn).items()})
+    before.update(measure(conn, samples, args.repeat))
+    conn.close()
+
+    if not args.no_backup:
+        backup = f"{args.database}.bak"
+        print(f"Backing up to {backup}")
+        shutil.copy2(args.database, backup)
+
+    started = time.perf_counter()
+    print("Copying events into the compact schema...")
+    migrate(args.database, args.chunk_size)
+    print("Rebuilding rollups, sketches and top-value summaries...")
+    if asyncio.run(rebuild_aggregates(args.database)) == 0:
+        print("WARNING: no events were scanned; the rollups, sketches and top-value summaries are empty")
+    print("Vacuuming...")
+    compact(args.database)
+    print(f"Migration finished in {time.perf_counter() - started:.1f}s")
+
+    conn = sqlite3.connect(args.database)
+    after = {"size: database": database_size(conn)}
+    after.update({f"size: {name}": size for name, size in object_sizes(conn).items()})
+    after.update(measure(conn, samples, args.repeat))
+    conn.close()
+
+    print_report(before, after)
+    if config.EVENT_PARTITION_INTERVAL != "none":
+        print(
+            "\nThe events are in the events table; run scripts/migrate_partitions.py "
+            "before starting the service with partitions"
+        )
+
+if __name__ == "__main__":
+    main()
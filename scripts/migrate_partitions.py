@@ -0,0 +1,162 @@
+"""
+Move the events of an existing analytics SQLite database out of the events
+table into day or month partitions (see app/partitions.py).
+
+Each partition is filled and the same rows deleted from the events table in
+one transaction, so the migration can be interrupted and rerun: rows already
+moved are simply gone from the events table. Partition indexes are built
+after their rows are in place, partitions that have closed are ANALYZEd and
+recorded as compacted, and rollups, sketches and top-value summaries are
+kept as they are since the events they count do not change.
+
+The emptied events table keeps its pages until the database is vacuumed;
+pass --vacuum to switch the database to auto_vacuum=INCREMENTAL and VACUUM
+it once, after which retention gives the pages of dropped partitions back
+to the filesystem.
+
+Start the service with the same EVENT_PARTITION_INTERVAL afterwards.
+
+Usage:
+    python scripts/migrate_partitions.py --database analytics.db --interval month
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+sys.path.append(SCRIPTS_DIR)
+
+from app import config, fields, models, partitions
+from app.database import sqlite_create_index, sqlite_create_table
+from migrate_compact_storage import database_size, is_legacy
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="analytics.db", help="Path to the SQLite database")
+    parser.add_argument(
+        "--interval", choices=("day", "month"),
+        default=config.EVENT_PARTITION_INTERVAL if config.EVENT_PARTITION_INTERVAL != "none" else "month",
+        help="Range of each partition (default: EVENT_PARTITION_INTERVAL, or month)"
+    )
+    parser.add_argument("--no-backup", action="store_true", help="Skip copying the database to <database>.bak first")
+    parser.add_argument("--vacuum", action="store_true", help="Enable incremental auto-vacuum and VACUUM afterwards")
+    return parser.parse_args()
+
+def registered(conn):
+    """(name, start, stop) of the partitions already listed in event_partitions"""
+    return [
+        partitions.Partition(name, models.from_epoch_micros(start), models.from_epoch_micros(stop))
+        for name, start, stop in conn.execute(
+            "SELECT name, range_start, range_stop FROM event_partitions ORDER BY range_start"
+        )
+    ]
+
+def migrate(path, interval):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA cache_size = -262144")
+    conn.execute(sqlite_create_table(models.EventPartition.__table__, if_not_exists=True))
+
+    low, high = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM events").fetchone()
+    if low is None:
+        print("  the events table is empty")
+        targets = []
+    else:
+        targets = partitions.covering(
+            models.from_epoch_micros(low), models.from_epoch_micros(high + 1), interval
+        )
+
+    existing = {partition.name: partition for partition in registered(conn)}
+    for target in targets:
+        known = existing.get(target.name)
+        if known is None and any(other.overlaps(target.start, target.stop) for other in existing.values()):
+            conn.close()
+            sys.exit(f"{target.name} overlaps an existing partition with other bounds; migrate with its interval")
+        if known is not None and known != target:
+            conn.close()
+            sys.exit(f"{target.name} is registered with other bounds; migrate with its interval")
+
+    # By name: migrated tables may have added the payload columns in another order
+    columns = ", ".join(f'"{column.name}"' for column in models.Event.__table__.columns)
+    for target in targets:
+        started = time.perf_counter()
+        bounds = (models.to_epoch_micros(target.start), models.to_epoch_micros(target.stop))
+        conn.execute("BEGIN")
+        conn.execute(sqlite_create_table(target.table, if_not_exists=True))
+        conn.execute(
+            "INSERT OR IGNORE INTO event_partitions (name, range_start, range_stop) VALUES (?, ?, ?)",
+            (target.name,) + bounds
+        )
+        moved = conn.execute(
+            f'INSERT INTO "{target.name}" ({columns}) SELECT {columns} FROM events '
+            "WHERE timestamp >= ? AND timestamp < ?", bounds
+        ).rowcount
+        conn.execute("DELETE FROM events WHERE timestamp >= ? AND timestamp < ?", bounds)
+        conn.execute("COMMIT")
+
+        built = {row[1] for row in conn.execute(f'PRAGMA index_list("{target.name}")')}
+        for index in target.table.indexes:
+            if index.name not in built:
+                conn.execute(sqlite_create_index(index))
+        print(f"  moved {moved} events to {target.name} in {time.perf_counter() - started:.1f}s")
+
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    closed_before = now - timedelta(seconds=config.ANALYTICS_CACHE_CLOSED_GRACE_SECONDS)
+    conn.execute(
+        "UPDATE event_partitions SET compacted_at = ? WHERE compacted_at IS NULL AND range_stop <= ?",
+        (models.to_epoch_micros(now), models.to_epoch_micros(closed_before))
+    )
+    conn.close()
+
+def vacuum(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"Database not found: {args.database}")
+
+    conn = sqlite3.connect(args.database)
+    if is_legacy(conn):
+        conn.close()
+        sys.exit(f"{args.database} uses the legacy schema; run scripts/migrate_compact_storage.py first")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+    if not columns >= set(fields.COLUMNS):
+        conn.close()
+        sys.exit(f"{args.database} lacks the payload columns; run scripts/migrate_payload_columns.py first")
+    size_before = database_size(conn)
+    conn.close()
+
+    if not args.no_backup:
+        backup = f"{args.database}.bak"
+        print(f"Backing up to {backup}")
+        shutil.copy2(args.database, backup)
+
+    started = time.perf_counter()
+    print(f"Moving events into {args.interval} partitions...")
+    migrate(args.database, args.interval)
+    if args.vacuum:
+        print("Vacuuming...")
+        vacuum(args.database)
+    print(f"Migration finished in {time.perf_counter() - started:.1f}s")
+
+    conn = sqlite3.connect(args.database)
+    size_after = database_size(conn)
+    conn.close()
+    print(f"Database size: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+    print(f"Start the service with EVENT_PARTITION_INTERVAL={args.interval}")
+
+if __name__ == "__main__":
+    main()
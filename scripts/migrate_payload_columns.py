@@ -0,0 +1,194 @@
+"""
+Add the extracted payload columns (url, title, element_id, latitude,
+longitude, accuracy and the location geohash) to an existing analytics
+SQLite database and backfill them from the stored JSON payloads.
+
+Rows are updated in rowid ranges of --batch-size, one transaction each, so
+the migration can be interrupted and rerun: columns that already exist are
+kept and rows are simply extracted again. The indexes on the new columns
+are built after the backfill. Payloads are left unchanged.
+
+The script reports database size and the latency of a few payload queries,
+answered from the JSON before and from the new columns after.
+
+Usage:
+    python scripts/migrate_payload_columns.py --database analytics.db
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPTS_DIR))
+sys.path.append(SCRIPTS_DIR)
+
+from sqlalchemy.dialects import sqlite
+
+from app import fields, models
+from app.database import sqlite_create_index
+from migrate_compact_storage import database_size, is_legacy, object_sizes, print_report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="analytics.db", help="Path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="Rowids updated per transaction")
+    parser.add_argument("--no-backup", action="store_true", help="Skip copying the database to <database>.bak first")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per latency measurement")
+    return parser.parse_args()
+
+def event_columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+
+def connect(path, **kwargs):
+    """sqlite3 connection with fields.location_geohash available to SQL as location_geohash()"""
+    conn = sqlite3.connect(path, **kwargs)
+    conn.create_function("location_geohash", 2, fields.location_geohash, deterministic=True)
+    return conn
+
+def extract_sql(field):
+    """SQL for one column, matching fields.extract: wrong JSON types and other event types give NULL"""
+    if field == "geohash":
+        return f"location_geohash({extract_sql('latitude')}, {extract_sql('longitude')})"
+    code = next(
+        models.EVENT_TYPE_CODES[event_type]
+        for event_type, names in fields.EVENT_FIELDS.items() if field in names
+    )
+    json_types = "('integer', 'real')" if field in fields.NUMERIC_FIELDS else "('text')"
+    path = f"'$.{field}'"
+    # CASE evaluates its branches in order, so the JSON functions never see malformed payloads
+    return (
+        f"CASE WHEN event_type != {code} OR NOT json_valid(payload) THEN NULL "
+        f"WHEN json_type(payload, {path}) IN {json_types} THEN json_extract(payload, {path}) END"
+    )
+
+def pick_samples(conn):
+    """A URL and an element ID present in the data"""
+    view, click = models.EVENT_TYPE_CODES["view"], models.EVENT_TYPE_CODES["click"]
+    url = conn.execute(
+        f"SELECT json_extract(payload, '$.url') FROM events WHERE event_type = {view} LIMIT 1"
+    ).fetchone()
+    element_id = conn.execute(
+        f"SELECT json_extract(payload, '$.element_id') FROM events "
+        f"WHERE event_type = {click} AND json_extract(payload, '$.element_id') IS NOT NULL LIMIT 1"
+    ).fetchone()
+    return {"url": url[0] if url else "", "element_id": element_id[0] if element_id else ""}
+
+def representative_queries(migrated, samples):
+    """(name, sql, params) answering the same questions from the JSON or from the columns"""
+    view, click = models.EVENT_TYPE_CODES["view"], models.EVENT_TYPE_CODES["click"]
+    location = models.EVENT_TYPE_CODES["location"]
+    if migrated:
+        # The columns are only set for their own event type
+        url, element_id, cell = "url", "element_id", "geohash"
+        is_view = is_click = is_location = "1"
+    else:
+        url, element_id = "json_extract(payload, '$.url')", "json_extract(payload, '$.element_id')"
+        cell = "location_geohash(json_extract(payload, '$.latitude'), json_extract(payload, '$.longitude'))"
+        is_view, is_click = f"event_type = {view}", f"event_type = {click}"
+        is_location = f"event_type = {location}"
+    return [
+        ("views of one url",
+         f"SELECT COUNT(*) FROM events WHERE {is_view} AND {url} = ?", (samples["url"],)),
+        ("clicks on one element",
+         f"SELECT COUNT(*) FROM events WHERE {is_click} AND {element_id} = ?", (samples["element_id"],)),
+        ("top 20 urls",
+         f"SELECT {url}, COUNT(*) FROM events WHERE {is_view} AND {url} IS NOT NULL "
+         "GROUP BY 1 ORDER BY 2 DESC LIMIT 20", ()),
+        ("locations per geohash-5 cell",
+         f"SELECT substr({cell}, 1, 5), COUNT(*) FROM events WHERE {is_location} AND {cell} IS NOT NULL GROUP BY 1", ()),
+    ]
+
+def measure(conn, samples, repeat, migrated):
+    """Median latency in ms per representative query"""
+    results = {}
+    for name, sql, params in representative_queries(migrated, samples):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+    return results
+
+def migrate(path, batch_size):
+    conn = connect(path, isolation_level=None)
+    conn.execute("PRAGMA cache_size = -262144")
+
+    existing = event_columns(conn)
+    for column in models.Event.__table__.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=sqlite.dialect())
+            conn.execute(f'ALTER TABLE events ADD COLUMN "{column.name}" {column_type}')
+            print(f"  added column {column.name} {column_type}")
+
+    assignments = ", ".join(f'"{field}" = {extract_sql(field)}' for field in fields.COLUMNS)
+    low, high = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM events").fetchone()
+    if low is not None:
+        total = high - low + 1
+        for start in range(low, high + 1, batch_size):
+            conn.execute("BEGIN")
+            conn.execute(
+                f"UPDATE events SET {assignments} WHERE rowid >= ? AND rowid < ?",
+                (start, start + batch_size)
+            )
+            conn.execute("COMMIT")
+            print(f"  backfilled rowids {min(start + batch_size, high + 1) - low}/{total}")
+
+    existing_indexes = {row[1] for row in conn.execute("PRAGMA index_list(events)")}
+    for index in models.Event.__table__.indexes:
+        if index.name not in existing_indexes:
+            started = time.perf_counter()
+            conn.execute(sqlite_create_index(index))
+            print(f"  built {index.name} in {time.perf_counter() - started:.1f}s")
+
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    conn.close()
+
+def main():
+    args = parse_args()
+    if not os.path.exists(args.database):
+        sys.exit(f"Database not found: {args.database}")
+
+    conn = connect(args.database)
+    if is_legacy(conn):
+        conn.close()
+        sys.exit(f"{args.database} uses the legacy schema; run scripts/migrate_compact_storage.py instead")
+    if not event_columns(conn) >= set(fields.COLUMNS):
+        samples = pick_samples(conn)
+        before = {"size: database": database_size(conn)}
+        before.update({f"size: {name}": size for name, size in object_sizes(conn).items()})
+        before.update(measure(conn, samples, args.repeat, migrated=False))
+    else:
+        # Rerun over an already migrated table: nothing to compare against
+        samples, before = None, None
+    conn.close()
+
+    if not args.no_backup:
+        backup = f"{args.database}.bak"
+        print(f"Backing up to {backup}")
+        shutil.copy2(args.database, backup)
+
+    started = time.perf_counter()
+    print("Adding and backfilling payload columns...")
+    migrate(args.database, args.batch_size)
+    print(f"Migration finished in {time.perf_counter() - started:.1f}s")
+
+    if before is None:
+        return
+
+    conn = connect(args.database)
+    after = {"size: database": database_size(conn)}
+    after.update({f"size: {name}": size for name, size in object_sizes(conn).items()})
+    after.update(measure(conn, samples, args.repeat, migrated=True))
+    conn.close()
+
+    print_report(before, after)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Rebuild the minute/hour/day rollup tables, the hour/day unique-user
+sketches and the hour/day top-value summaries from the events table.
+
+Run this after loading events outside the API (e.g. with raw SQL) so the
+/analytics/* endpoints see them.
+
+Usage:
+    python scripts/rebuild_rollups.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import rollups, sketches, topk
+from app.database import SQLALCHEMY_DATABASE_URL, WriterSession, dispose_engines, init_db
+
+async def main():
+    print(f"Database: {SQLALCHEMY_DATABASE_URL}")
+    await init_db()
+
+    started = time.perf_counter()
+    async with WriterSession() as db:
+        scanned = await rollups.rebuild(db)
+        print(f"Rebuilt rollups from {scanned} events in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        scanned = await sketches.rebuild(db)
+        print(f"Rebuilt unique-user sketches from {scanned} events in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        scanned = await topk.rebuild(db)
+        print(f"Rebuilt top-value summaries from {scanned} view/click events in {time.perf_counter() - started:.2f}s")
+    await dispose_engines()
+
+if __name__ == "__main__":
+    asyncio.run(main())
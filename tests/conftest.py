@@ -0,0 +1,48 @@
+"""
+Shared test setup.
+
+The app reads its configuration when it is imported, so DATABASE_URL points
+at a scratch database before anything from app is imported. Tests drive
+their coroutines through `run`, which disposes the engines on the same event
+loop: pooled aiosqlite connections cannot move to the next test's loop.
+"""
+
+import asyncio
+import os
+import tempfile
+
+_DIRECTORY = tempfile.mkdtemp(prefix="analytics-tests-")
+DATABASE_PATH = os.path.join(_DIRECTORY, "analytics.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+os.environ["LOG_LEVEL"] = "WARNING"
+# Tests that need an ingest log create their own
+os.environ["INGEST_LOG_DIR"] = "none"
+
+import pytest
+
+from app.database import dispose_engines
+
+def _run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await dispose_engines()
+    return asyncio.run(main())
+
+@pytest.fixture
+def run():
+    return _run
+
+@pytest.fixture
+def database():
+    """A freshly created database; returns its path"""
+    from app import partitions, writer
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
+    # The writer remembers the partitions of the database it last wrote to
+    partitions.forget()
+    _run(writer.prepare_database())
+    return DATABASE_PATH
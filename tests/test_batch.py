@@ -0,0 +1,77 @@
+import json
+
+import httpx
+
+from app import eventlog, main
+
+def ndjson(count: int, invalid: int = 0) -> bytes:
+    lines = [
+        json.dumps({
+            "user_id": "u",
+            "event_type": "view",
+            "timestamp": "2024-01-01T12:00:00Z",
+            "payload": {"url": "/home"},
+        })
+        for _ in range(count)
+    ]
+    lines += [json.dumps({"user_id": "u", "event_type": "view"})] * invalid
+    return "\n".join(lines).encode()
+
+async def post_batch(body: bytes) -> httpx.Response:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(
+            "/events/batch", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+
+def test_storage_failure_is_retryable(run, monkeypatch):
+    async def fail(rows):
+        raise OSError("disk I/O error")
+    monkeypatch.setattr(main, "write_rows", fail)
+
+    response = run(post_batch(ndjson(2, invalid=1)))
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    body = response.json()
+    assert (body["accepted"], body["rejected"], body["failed"]) == (0, 1, 2)
+    assert [result["status"] for result in body["results"]] == ["error", "error", "rejected"]
+
+def test_partial_storage_failure(run, monkeypatch):
+    calls = []
+    async def fail_second(rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise OSError("disk I/O error")
+    monkeypatch.setattr(main, "write_rows", fail_second)
+    monkeypatch.setattr(main.config, "BULK_INGEST_CHUNK_SIZE", 2)
+
+    response = run(post_batch(ndjson(4)))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["rejected"], body["failed"]) == (2, 0, 2)
+    assert [result["status"] for result in body["results"]] == ["accepted", "accepted", "error", "error"]
+
+def test_batch_goes_through_the_ingest_log(run, database, tmp_path, monkeypatch):
+    async def unused(rows):
+        raise AssertionError("committed directly instead of logged")
+    monkeypatch.setattr(main, "write_rows", unused)
+    monkeypatch.setattr(main.config, "BULK_INGEST_CHUNK_SIZE", 2)
+
+    async def scenario():
+        log = eventlog.EventLog(str(tmp_path / "log"))
+        await log.start()
+        monkeypatch.setattr(main, "append_rows", log.append)
+        try:
+            response = await post_batch(ndjson(5, invalid=1))
+        finally:
+            await log.stop()
+        return response, log.stats()
+
+    response, stats = run(scenario())
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["rejected"], body["failed"]) == (5, 1, 0)
+    assert (stats["appended_events"], stats["syncs"]) == (5, 3)
@@ -0,0 +1,57 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import columnar, models
+
+def make_rows(count, start, user_cycle=3):
+    rows = []
+    for i in range(count):
+        ts = start + timedelta(seconds=37 * i, microseconds=i)
+        payload = json.dumps({"url": f"/page/{i}", "title": f"Café — 東京 {i} 🚀"}, ensure_ascii=False)
+        rows.append((str(models.uuid7(ts)), f"user-{i % user_cycle}", columnar.EVENT_TYPES[i % 3], ts, payload))
+    return rows
+
+def write(groups):
+    buffer = io.BytesIO()
+    writer = columnar.ColumnarWriter(buffer)
+    for rows in groups:
+        writer.write_row_group(rows)
+    writer.close()
+    return buffer.getvalue(), writer.rows_written
+
+def test_round_trip_over_several_row_groups():
+    first = make_rows(5, datetime(2026, 3, 1))
+    # Out of order and before the first group, so deltas go negative
+    second = list(reversed(make_rows(3, datetime(2025, 12, 31, 23, 59, 59))))
+    third = make_rows(1, datetime(1970, 1, 1))
+    data, written = write([first, [], second, third])
+
+    assert written == 9
+    rows = list(columnar.read_rows(io.BytesIO(data)))
+    expected = [
+        {"event_id": event_id, "user_id": user_id, "event_type": event_type, "timestamp": ts, "payload": payload}
+        for event_id, user_id, event_type, ts, payload in first + second + third
+    ]
+    assert rows == expected
+    assert [len(group["event_id"]) for group in columnar.read_row_groups(io.BytesIO(data))] == [5, 3, 1]
+
+def test_empty_file():
+    data, written = write([])
+    assert written == 0
+    assert list(columnar.read_rows(io.BytesIO(data))) == []
+
+def test_truncated_file_is_an_error():
+    data, _ = write([make_rows(4, datetime(2026, 3, 1)), make_rows(2, datetime(2026, 3, 2))])
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            list(columnar.read_rows(io.BytesIO(data[:size])))
+
+def test_other_files_are_refused():
+    with pytest.raises(ValueError, match="Not a columnar event file"):
+        list(columnar.read_rows(io.BytesIO(b"PAR1" + bytes(16))))
+    header = json.dumps({"version": columnar.VERSION + 1}).encode()
+    with pytest.raises(ValueError, match="Unsupported columnar file version"):
+        list(columnar.read_rows(io.BytesIO(columnar.MAGIC + len(header).to_bytes(4, "little") + header)))
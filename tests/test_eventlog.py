@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import sqlite3
+
+from app import crud, eventlog, schemas
+
+def make_rows(count, user="u"):
+    return [
+        crud.build_event_row(schemas.parse_event_json(json.dumps(
+            {"user_id": f"{user}{i}", "event_type": "view", "payload": {"url": f"/page/{i}"}}
+        ).encode()))
+        for i in range(count)
+    ]
+
+def stored_events(database):
+    with sqlite3.connect(database) as conn:
+        return conn.execute("SELECT COALESCE(SUM(count), 0) FROM event_rollups_day").fetchone()[0]
+
+async def wait_applied(log, timeout=10.0):
+    async with asyncio.timeout(timeout):
+        while log.lag_bytes:
+            await asyncio.sleep(0.01)
+
+def test_stop_with_pending_appends(database, run, tmp_path):
+    async def scenario():
+        log = eventlog.EventLog(str(tmp_path / "log"))
+        await log.start()
+        appends = [asyncio.create_task(log.append(make_rows(3, f"a{i}-"))) for i in range(20)]
+        # Let the appends queue up without giving the flusher a chance to write them
+        await asyncio.sleep(0)
+        async with asyncio.timeout(10):
+            await log.stop()
+        await asyncio.gather(*appends)
+        return log.appended_events
+
+    assert run(scenario()) == 60
+
+    async def replay():
+        log = eventlog.EventLog(str(tmp_path / "log"))
+        await log.start()
+        await wait_applied(log)
+        await log.stop()
+
+    run(replay())
+    assert stored_events(database) == 60
+
+def test_unapplied_events_keep_ranges_open(database, run, tmp_path, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from app.cache import QueryCache
+
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    rows = make_rows(5)
+    for row in rows:
+        row["timestamp"] = hour_ago
+    apply = eventlog.apply_logged_rows
+    gate = asyncio.Event()
+
+    async def held_apply(rows, checkpoint):
+        # The database is down until the gate opens; the materializer retries
+        if not gate.is_set():
+            raise OSError("database unavailable")
+        await apply(rows, checkpoint)
+
+    monkeypatch.setattr(eventlog, "apply_logged_rows", held_apply)
+    cache = QueryCache()
+
+    async def scenario(log, release):
+        gate.clear()
+        await log.start()
+        cache.unapplied_since = log.unapplied_since
+        if rows and not release:
+            await log.append(rows)
+        assert log.unapplied_since() == hour_ago
+        assert not cache.is_closed(hour_ago + timedelta(minutes=30))
+        assert cache.is_closed(hour_ago - timedelta(minutes=1))
+        if release:
+            gate.set()
+            await wait_applied(log)
+            assert log.unapplied_since() is None
+            assert cache.is_closed(hour_ago + timedelta(minutes=30))
+        await log.stop()
+
+    run(scenario(eventlog.EventLog(str(tmp_path / "log")), release=False))
+    # The backlog left by the first run is found again when the log is recovered
+    run(scenario(eventlog.EventLog(str(tmp_path / "log")), release=True))
+    assert stored_events(database) == 5
+
+async def crash(log):
+    """Stop the log's tasks and close its files without the final sync, as a killed process would"""
+    for task in (log._flusher, log._materializer):
+        task.cancel()
+    await asyncio.gather(log._flusher, log._materializer, return_exceptions=True)
+    os.close(log._fd)
+    os.close(log._lock_fd)
+
+def test_replay_after_unclean_stop(database, run, tmp_path, monkeypatch, caplog):
+    apply = eventlog.apply_logged_rows
+    directory = str(tmp_path / "log")
+
+    async def database_down(rows, checkpoint):
+        raise OSError("database unavailable")
+
+    async def scenario():
+        log = eventlog.EventLog(directory)
+        await log.start()
+        await log.append(make_rows(10, "applied-"))
+        await wait_applied(log)
+        monkeypatch.setattr(eventlog, "apply_logged_rows", database_down)
+        await log.append(make_rows(5, "logged-"))
+        await crash(log)
+        return log._path(log._segment)
+
+    segment = run(scenario())
+    assert stored_events(database) == 10
+
+    # The process died halfway through writing a record
+    with open(segment, "ab") as f:
+        f.write(eventlog.encode_record(make_rows(1, "torn-")[0])[:20])
+    monkeypatch.setattr(eventlog, "apply_logged_rows", apply)
+
+    async def replay():
+        log = eventlog.EventLog(directory)
+        await log.start()
+        await wait_applied(log)
+        await log.stop()
+        return log.applied_events
+
+    # Only the records after the checkpoint are applied again, and the torn one is cut off
+    assert run(replay()) == 5
+    assert "Cutting incomplete records from the ingest log" in caplog.messages
+    assert stored_events(database) == 15
@@ -0,0 +1,101 @@
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app import crud, main, models, schemas
+from app.database import WriterSession
+
+def view_row(ts, user="u", event_id=None):
+    row = crud.build_event_row(schemas.parse_event_json(
+        f'{{"user_id": "{user}", "event_type": "view", "payload": {{"url": "/"}}}}'.encode()
+    ))
+    return {**row, "event_id": event_id or models.uuid7(ts), "timestamp": ts}
+
+async def insert(rows):
+    async with WriterSession() as db:
+        await crud.insert_event_rows(db, rows)
+
+async def get(path, **params):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path, params=params)
+
+@pytest.mark.parametrize("ts", [
+    datetime(2026, 3, 1, 12, 30, 15, 123000),
+    datetime(2026, 3, 31, 23, 59, 59, 999000),
+    datetime(1999, 12, 31),
+])
+def test_uuid7_carries_its_millisecond(ts):
+    event_id = uuid.UUID(models.uuid7(ts))
+    assert event_id.version == 7
+    assert models.uuid7_time(event_id) == ts
+    # Sub-millisecond digits are dropped, never rounded up into the next millisecond
+    assert models.uuid7_time(uuid.UUID(models.uuid7(ts + timedelta(microseconds=999)))) == ts
+    assert models.uuid7(ts) != models.uuid7(ts)
+
+def test_uuid7_time_ignores_other_versions():
+    assert models.uuid7_time(uuid.uuid4()) is None
+
+def test_cursor_round_trip():
+    ts = datetime(2026, 3, 1, 12, 30, 15, 123456)
+    event_id = models.uuid7(ts)
+    cursor = crud.encode_cursor(ts, event_id)
+    assert "=" not in cursor
+    assert crud.decode_cursor(cursor) == (ts, event_id)
+
+def test_pages_cover_every_event_once_in_order(run, database):
+    start = datetime(2026, 1, 31, 23, 0)
+    same = start + timedelta(minutes=30)
+    # Events on both sides of a month partition boundary, and a run sharing one timestamp
+    rows = [view_row(start + timedelta(minutes=7 * i), f"u{i}") for i in range(15)]
+    rows += [view_row(same, f"same{i}") for i in range(10)]
+
+    async def scenario():
+        await insert(rows)
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 4, **({"cursor": cursor} if cursor else {})}
+            body = (await get("/events", **params)).json()
+            pages.append(body["items"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = run(scenario())
+    assert all(len(page) == 4 for page in pages[:-1])
+    seen = [(item["timestamp"], item["event_id"]) for page in pages for item in page]
+    expected = sorted(
+        ((row["timestamp"].isoformat(), row["event_id"]) for row in rows),
+        key=lambda pair: (datetime.fromisoformat(pair[0]), pair[1]),
+        reverse=True,
+    )
+    assert [event_id for _, event_id in seen] == [event_id for _, event_id in expected]
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"{}").decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'["yesterday", "x"]').decode(),
+])
+def test_invalid_cursor_is_a_400(run, database, cursor):
+    response = run(get("/events", cursor=cursor))
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_get_event_by_id(run, database):
+    january, february = datetime(2026, 1, 31, 23, 59, 59, 999500), datetime(2026, 2, 1, 0, 0, 0, 200)
+    legacy_id = str(uuid.uuid4())
+    rows = [view_row(january, "jan"), view_row(february, "feb"), view_row(february, "legacy", legacy_id)]
+
+    async def scenario():
+        await insert(rows)
+        found = [(await get(f"/events/{row['event_id']}")).json() for row in rows]
+        missing = await get(f"/events/{models.uuid7(february)}")
+        return found, missing
+
+    found, missing = run(scenario())
+    assert [event["user_id"] for event in found] == ["jan", "feb", "legacy"]
+    assert missing.status_code == 404
@@ -0,0 +1,109 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import crud, geohash, heatmap, models, partitions, schemas
+from app.database import WriterSession
+
+def reference_encode(latitude, longitude, precision):
+    """The textbook geohash: bisect longitude and latitude alternately, one bit at a time"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits = []
+    for bit in range(5 * precision):
+        interval, value = (lon_range, longitude) if bit % 2 == 0 else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if value >= middle:
+            bits.append(1)
+            interval[0] = middle
+        else:
+            bits.append(0)
+            interval[1] = middle
+    return "".join(
+        geohash.ALPHABET[int("".join(map(str, bits[i:i + 5])), 2)] for i in range(0, len(bits), 5)
+    )
+
+@pytest.mark.parametrize("latitude, longitude, expected", [
+    (57.64911, 10.40744, "u4pruydqqvj"),
+    (42.605, -5.603, "ezs42"),
+])
+def test_encode_reference_values(latitude, longitude, expected):
+    assert geohash.encode(latitude, longitude, len(expected)) == expected
+
+def test_encode_matches_bisection():
+    rng = random.Random(3)
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)]
+    points += [(90, 180), (-90, -180), (0, 0), (-0.000001, -0.000001)]
+    for precision in range(1, 13):
+        for latitude, longitude in points:
+            code = geohash.encode(latitude, longitude, precision)
+            assert code == reference_encode(latitude, longitude, precision)
+            west, south, east, north = geohash.bounds(code)
+            assert west <= longitude <= east and south <= latitude <= north
+
+def test_cover_clips_to_the_bounding_box():
+    rng = random.Random(5)
+    for bbox in [(10.2, 57.5, 10.6, 57.8), (-5.7, 42.5, -5.5, 42.7), (179.5, -10.0, 180.0, 10.0)]:
+        for precision in (3, 4, 5):
+            cells = set(geohash.cover(bbox, precision))
+            assert len(cells) == geohash.cell_count(bbox, precision)
+            assert all(geohash.intersects(cell, bbox) for cell in cells)
+            for _ in range(200):
+                point = (rng.uniform(bbox[1], bbox[3]), rng.uniform(bbox[0], bbox[2]))
+                assert geohash.encode(*point, precision) in cells
+            # Every cell is in exactly one of the merged scan ranges
+            ranges = heatmap.scan_ranges(bbox, precision)
+            for cell in cells:
+                assert sum(low <= cell and (high is None or cell < high) for low, high in ranges) == 1
+
+def location_row(ts, latitude, longitude):
+    row = crud.build_event_row(schemas.parse_event_json(
+        f'{{"user_id": "u", "event_type": "location", "payload": {{"latitude": {latitude}, "longitude": {longitude}}}}}'.encode()
+    ))
+    return {**row, "event_id": models.uuid7(ts), "timestamp": ts}
+
+def test_heatmap_matches_group_by(run, database):
+    rng = random.Random(11)
+    start = datetime(2026, 1, 25)
+    rows = []
+    for i in range(3000):
+        # Clustered around two cities, some scattered worldwide
+        if i % 10 == 0:
+            point = (rng.uniform(-60, 70), rng.uniform(-180, 180))
+        else:
+            latitude, longitude = (57.65, 10.41) if i % 2 else (42.6, -5.6)
+            point = (rng.gauss(latitude, 0.3), rng.gauss(longitude, 0.3))
+        rows.append(location_row(start + timedelta(minutes=7 * i), *point))
+    # Across the January/February partition boundary
+    lo, hi = start + timedelta(days=3, hours=5), start + timedelta(days=12)
+    bbox = (9.5, 57.0, 11.0, 58.2)
+
+    async def group_by(db, precision):
+        cell = func.substr(models.Event.geohash, 1, precision)
+        query = select(cell, func.count()).where(
+            models.Event.geohash.is_not(None), models.Event.timestamp >= lo, models.Event.timestamp < hi
+        ).group_by(cell)
+        counts = Counter()
+        for routed in await partitions.route(db, query, lo, hi):
+            counts.update(dict((await db.execute(routed)).all()))
+        return counts
+
+    async def scenario():
+        async with WriterSession() as db:
+            await crud.insert_event_rows(db, rows)
+            results = []
+            for precision in (2, 4, 6):
+                expected = await group_by(db, precision)
+                results.append((
+                    expected,
+                    await heatmap.cell_counts(db, precision, start=lo, stop=hi),
+                    await heatmap.cell_counts(db, precision, bbox=bbox, start=lo, stop=hi),
+                ))
+        return results
+
+    for expected, counts, clipped in run(scenario()):
+        assert counts == sorted(expected.items())
+        assert clipped == [(cell, count) for cell, count in sorted(expected.items()) if geohash.intersects(cell, bbox)]
+        assert clipped
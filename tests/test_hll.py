@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import config, crud, models, partitions, schemas, sketches
+from app.database import WriterSession
+from app.hll import HyperLogLog, relative_error
+
+def sketch(values, precision=12):
+    hll = HyperLogLog(precision)
+    hll.update(values)
+    return hll
+
+def users(start, stop):
+    return [f"user-{i}" for i in range(start, stop)]
+
+@pytest.mark.parametrize("precision, cardinality", [(10, 20_000), (12, 20_000), (14, 50_000), (12, 300)])
+def test_estimate_within_error_bound(precision, cardinality):
+    # Hashes are deterministic, so the margins are fixed rather than flaky
+    errors = [
+        sketch([f"stream-{stream}-{i}" for i in range(cardinality)], precision).count() / cardinality - 1
+        for stream in range(8)
+    ]
+    bound = relative_error(precision)
+    assert all(abs(error) <= 4 * bound for error in errors)
+    # The estimator is unbiased: averaging 8 streams shrinks the error by sqrt(8)
+    assert abs(sum(errors) / len(errors)) <= bound
+
+def test_duplicates_do_not_count():
+    assert sketch(users(0, 1000) * 5).count() == sketch(users(0, 1000)).count()
+
+def test_merge_equals_union():
+    merged = sketch(users(0, 15_000)).merge(sketch(users(10_000, 25_000)), sketch(users(24_000, 30_000)))
+    assert merged.registers == sketch(users(0, 30_000)).registers
+
+def test_merge_folds_to_the_lowest_precision():
+    merged = sketch(users(0, 5000), precision=14).merge(sketch(users(5000, 10_000), precision=10))
+    assert merged.precision == 10
+    assert merged.registers == sketch(users(0, 10_000), precision=10).registers
+
+@pytest.mark.parametrize("precision", [4, 8, 11])
+def test_fold_equals_direct_estimation(precision):
+    values = users(0, 20_000)
+    folded = sketch(values, precision=12).fold(precision)
+    direct = sketch(values, precision=precision)
+    assert folded.registers == direct.registers
+    assert folded.count() == direct.count()
+
+def test_fold_cannot_raise_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).fold(12)
+
+def test_bytes_round_trip():
+    original = sketch(users(0, 2000))
+    restored = HyperLogLog.from_bytes(original.to_bytes())
+    assert (restored.precision, restored.registers) == (12, original.registers)
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(bytes(3000))
+
+def test_range_sketch_matches_exact_users(run, database):
+    start = datetime(2026, 3, 1)
+    rows = []
+    for i in range(3000):
+        row = crud.build_event_row(schemas.parse_event_json(
+            f'{{"user_id": "u{i * 7 % 1200}", "event_type": "view", "payload": {{"url": "/"}}}}'.encode()
+        ))
+        ts = start + timedelta(minutes=i * 1.3)
+        rows.append({**row, "event_id": models.uuid7(ts), "timestamp": ts})
+    # Ragged bounds, so the range is served by day and hour sketches plus raw events at both edges
+    lo, hi = start + timedelta(hours=5, minutes=31), start + timedelta(days=2, hours=9, minutes=7)
+
+    async def scenario():
+        async with WriterSession() as db:
+            await crud.insert_event_rows(db, rows)
+            merged = await sketches.unique_users(db, lo, hi)
+            exact = await sketches.exact_unique_users(db, lo, hi)
+            query = select(models.Event.user_key).where(models.Event.timestamp >= lo, models.Event.timestamp < hi)
+            user_keys = set()
+            for routed in await partitions.route(db, query, lo, hi):
+                user_keys.update((await db.execute(routed)).scalars())
+        return merged, exact, user_keys
+
+    merged, exact, user_keys = run(scenario())
+    assert exact == len(user_keys)
+    direct = HyperLogLog(config.HLL_PRECISION)
+    for user_key in user_keys:
+        direct.add_hash(sketches.user_hash(user_key))
+    assert merged.registers == direct.registers
+    assert abs(merged.count() - exact) <= 3 * relative_error(config.HLL_PRECISION) * exact
@@ -0,0 +1,38 @@
+from app.ingest import IngestBuffer
+
+def make_writer(failures: int):
+    written = []
+    async def writer(rows):
+        writer.calls += 1
+        if writer.calls <= failures:
+            raise OSError("database is locked")
+        written.extend(rows)
+    writer.calls = 0
+    return writer, written
+
+async def ingest(buffer: IngestBuffer, count: int) -> None:
+    await buffer.start()
+    for number in range(count):
+        await buffer.put({"number": number})
+    await buffer.stop()
+
+def test_failed_flush_is_retried(run):
+    writer, written = make_writer(failures=2)
+    buffer = IngestBuffer(writer=writer, flush_interval_ms=1000, flush_retries=3)
+
+    run(ingest(buffer, 10))
+
+    assert [row["number"] for row in written] == list(range(10))
+    stats = buffer.stats()
+    assert (stats["flush_retries"], stats["failed_events"], stats["flushed_events"]) == (2, 0, 10)
+
+def test_batch_is_dropped_after_retries(run):
+    writer, written = make_writer(failures=100)
+    buffer = IngestBuffer(writer=writer, flush_interval_ms=1000, flush_retries=1)
+
+    run(ingest(buffer, 10))
+
+    assert written == []
+    assert writer.calls == 2
+    stats = buffer.stats()
+    assert (stats["flush_retries"], stats["failed_events"], stats["flushed_events"]) == (1, 10, 0)
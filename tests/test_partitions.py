@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import config, crud, models, partitions, schemas
+from app.database import WriterSession
+
+def view_row(ts: datetime):
+    row = crud.build_event_row(schemas.parse_event_json(
+        b'{"user_id": "u", "event_type": "view", "payload": {"url": "/"}}'
+    ))
+    return {**row, "event_id": models.uuid7(ts), "timestamp": ts}
+
+async def create_partition(db, name: str, start: datetime, stop: datetime) -> None:
+    partition = partitions.Partition(name, start, stop)
+    connection = await db.connection()
+    await connection.run_sync(partition.table.create, checkfirst=True)
+    await db.execute(models.EventPartition.__table__.insert().values(
+        name=partition.name, range_start=start, range_stop=stop
+    ))
+
+async def buckets(db, model):
+    return set((await db.execute(select(model.bucket_start))).scalars().all())
+
+def test_drop_expired_keeps_aggregates_of_kept_partitions(run, database, monkeypatch):
+    monkeypatch.setattr(config, "EVENT_PARTITION_INTERVAL", "day")
+    monkeypatch.setattr(config, "EVENT_RETENTION_DAYS", 30)
+    day = datetime(2026, 1, 1)
+    noon = day + timedelta(hours=12)
+
+    async def scenario():
+        async with WriterSession() as db:
+            # A partition clipped at noon by its neighbour, e.g. after an interval change
+            await create_partition(db, "events_20260101", day, noon)
+            await create_partition(db, "events_20260101_12", noon, day + timedelta(days=1))
+            await db.commit()
+            partitions.forget()
+            await crud.insert_event_rows(db, [view_row(day + timedelta(hours=10)), view_row(day + timedelta(hours=13))])
+
+            dropped = await partitions.drop_expired(db, now=noon + timedelta(days=30))
+
+            assert dropped == ["events_20260101"]
+            assert await buckets(db, models.EventRollupHour) == {day + timedelta(hours=13)}
+            assert await buckets(db, models.EventRollupMinute) == {day + timedelta(hours=13)}
+            assert await buckets(db, models.UserSketchHour) == {day + timedelta(hours=13)}
+            # The day bucket also counts the kept partition's event
+            assert await buckets(db, models.EventRollupDay) == {day}
+            assert await buckets(db, models.UserSketchDay) == {day}
+
+    run(scenario())
@@ -0,0 +1,89 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+
+from app import config, crud, main, models, schemas
+from app.database import WriterSession
+from app.spacesaving import SpaceSaving
+
+def skewed_stream(length, distinct, seed=7):
+    """Zipf-like: the value of rank r turns up about 1/r as often as the most frequent one"""
+    values = [f"/page/{rank}" for rank in range(1, distinct + 1)]
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return random.Random(seed).choices(values, weights, k=length)
+
+def assert_bounds(summary, truth, total):
+    for value, count, error in summary.top(summary.capacity):
+        assert count - error <= truth[value] <= count
+    # Every value above N / capacity is guaranteed a counter
+    for value, count in truth.items():
+        if count > total / summary.capacity:
+            assert value in summary.counts
+
+def test_summary_bounds_on_a_skewed_stream():
+    stream = skewed_stream(50_000, 2000)
+    truth = Counter(stream)
+    summary = SpaceSaving(64)
+    for value in stream:
+        summary.add(value)
+
+    assert_bounds(summary, truth, len(stream))
+    assert [value for value, _, _ in summary.top(5)] == [value for value, _ in truth.most_common(5)]
+
+def test_merged_summaries_keep_their_bounds():
+    stream = skewed_stream(50_000, 2000)
+    parts = [stream[i:i + 7000] for i in range(0, len(stream), 7000)]
+    summaries = []
+    for part in parts:
+        summary = SpaceSaving(64)
+        summary.update(Counter(part))
+        summaries.append(summary)
+
+    merged = summaries[0].merge(*summaries[1:])
+
+    truth = Counter(stream)
+    assert_bounds(merged, truth, len(stream))
+    assert [value for value, _, _ in merged.top(5)] == [value for value, _ in truth.most_common(5)]
+
+def test_summary_with_room_is_exact():
+    truth = Counter(skewed_stream(1000, 30))
+    summary = SpaceSaving(64)
+    summary.update(truth)
+    assert summary.top(64) == sorted(
+        ((value, count, 0) for value, count in truth.items()), key=lambda item: (-item[1], item[0])
+    )
+    assert SpaceSaving.from_bytes(summary.to_bytes()).top(64) == summary.top(64)
+
+def test_top_endpoint_bounds_against_exact(run, database, monkeypatch):
+    monkeypatch.setattr(config, "TOPK_CAPACITY", 16)
+    start = datetime(2026, 2, 1)
+    stream = skewed_stream(4000, 200)
+    rows = []
+    for i, url in enumerate(stream):
+        row = crud.build_event_row(schemas.parse_event_json(
+            f'{{"user_id": "u{i % 50}", "event_type": "view", "payload": {{"url": "{url}"}}}}'.encode()
+        ))
+        ts = start + timedelta(minutes=i * 1.7)
+        rows.append({**row, "event_id": models.uuid7(ts), "timestamp": ts})
+
+    async def scenario():
+        async with WriterSession() as db:
+            await crud.insert_event_rows(db, rows)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Ragged bounds: day and hour summaries plus raw events at both edges
+            params = {"field": "url", "n": 10, "start": "2026-02-01T03:20:00", "end": "2026-02-04T19:45:00"}
+            estimated = (await client.get("/analytics/top", params=params)).json()
+            exact = (await client.get("/analytics/top", params={**params, "n": 16, "exact": "true"})).json()
+        return estimated, exact
+
+    estimated, exact = run(scenario())
+
+    assert estimated["exact"] is False and exact["exact"] is True
+    truth = {item["value"]: item["count"] for item in exact["items"]}
+    for item in estimated["items"]:
+        assert item["value"] in truth
+        assert item["count"] - item["error"] <= truth[item["value"]] <= item["count"]
+    assert [item["value"] for item in estimated["items"][:3]] == [item["value"] for item in exact["items"][:3]]
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from app import crud, schemas, writer
+from app.cache import analytics_cache
+from app.ingest import IngestQueueFull
+
+def make_rows(count, user="u"):
+    return [
+        crud.build_event_row(schemas.parse_event_json(json.dumps(
+            {"user_id": f"{user}{i}", "event_type": "view", "payload": {"url": f"/page/{i}"}}
+        ).encode()))
+        for i in range(count)
+    ]
+
+def stored_events(database):
+    with sqlite3.connect(database) as conn:
+        return conn.execute("SELECT COALESCE(SUM(count), 0) FROM event_rollups_day").fetchone()[0]
+
+async def until(condition, timeout=10.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+def test_commit_round_trip(database, run, tmp_path, monkeypatch):
+    heard = []
+    monkeypatch.setattr(writer.live_counts, "add", heard.append)
+
+    async def scenario():
+        server = writer.WriterServer(str(tmp_path / "writer.sock"))
+        await server.start()
+        first, second = writer.WriterClient(server.path), writer.WriterClient(server.path)
+        await first.connect()
+        await second.connect()
+        await asyncio.gather(first.write(make_rows(3, "a")), second.write(make_rows(2, "b")))
+        # Each worker hears about the other's batch, not its own
+        await until(lambda: sum(sum(deltas.values()) for deltas in heard) == 5)
+        await first.close()
+        await second.close()
+        await server.stop()
+        return server.stats()
+
+    stats = run(scenario())
+    assert (stats["batches"], stats["events"], stats["failed_batches"]) == (2, 5, 0)
+    assert stored_events(database) == 5
+
+@pytest.mark.parametrize("error, raised", [
+    (IngestQueueFull("full"), IngestQueueFull),
+    (RuntimeError("disk I/O error"), writer.WriteFailed),
+])
+def test_store_errors_are_raised_in_the_worker(run, tmp_path, error, raised):
+    async def failing_store(rows):
+        raise error
+
+    async def scenario():
+        server = writer.WriterServer(str(tmp_path / "writer.sock"), store=failing_store)
+        await server.start()
+        client = writer.WriterClient(server.path)
+        try:
+            with pytest.raises(raised):
+                await client.write(make_rows(1))
+            # Appends need the writer's ingest log
+            with pytest.raises(writer.WriteFailed):
+                await client.append(make_rows(1))
+        finally:
+            await client.close()
+            await server.stop()
+
+    run(scenario())
+
+def test_append_round_trip(database, run, tmp_path):
+    async def scenario():
+        server = writer.WriterServer(str(tmp_path / "writer.sock"), log_directory=str(tmp_path / "log"))
+        await server.start()
+        client = writer.WriterClient(server.path)
+        await client.append(make_rows(4))
+        await until(lambda: server.event_log.applied_events == 4)
+        await until(lambda: client.unapplied_since() is None)
+        await client.close()
+        await server.stop()
+
+    run(scenario())
+    assert stored_events(database) == 4
+
+def test_stop_with_connected_workers(database, run, tmp_path):
+    async def scenario():
+        server = writer.WriterServer(str(tmp_path / "writer.sock"))
+        await server.start()
+        client = writer.WriterClient(server.path, connect_timeout=0.2)
+        await client.write(make_rows(1))
+        async with asyncio.timeout(10):
+            await server.stop()
+        with pytest.raises(writer.WriterUnavailable):
+            await client.write(make_rows(1))
+        await client.close()
+
+    run(scenario())
+    assert stored_events(database) == 1
+
+def test_dropped_partitions_clear_worker_caches(run, tmp_path):
+    async def scenario():
+        server = writer.WriterServer(str(tmp_path / "writer.sock"))
+        await server.start()
+        client = writer.WriterClient(server.path)
+        await client.connect()
+        await until(lambda: server.stats()["connections"] == 1)
+        analytics_cache.put("closed-range", b"{}", closed=True)
+        server.partitions_dropped(["events_20260101"])
+        await until(lambda: analytics_cache.get("closed-range") is None)
+        await client.close()
+        await server.stop()
+
+    run(scenario())
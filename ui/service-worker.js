@@ -1,6 +1,27 @@
 const CACHE_NAME = 'analytics-demo-v1';
 const API_BASE_URL = 'http://localhost:8000';
 
+// Events are kept in IndexedDB until the server has answered for them, so
+// they survive reloads, offline periods and the worker being stopped
+const OUTBOX_DB = 'analytics-outbox';
+const OUTBOX_STORE = 'events';
+
+// A batch is sent once this many events are waiting, after FLUSH_DELAY_MS,
+// or as soon as the page is hidden
+const FLUSH_BATCH_SIZE = 50;
+const FLUSH_DELAY_MS = 5000;
+const MAX_BATCH_EVENTS = 500;
+
+// Failed sends are retried after 1s, 2s, 4s, ... up to 5 minutes, with jitter
+const RETRY_BASE_MS = 1000;
+const RETRY_MAX_MS = 5 * 60 * 1000;
+
+let flushTimer = null;
+let flushing = null;
+let retryAttempt = 0;
+let retryAt = 0;
+let compress = typeof CompressionStream !== 'undefined';
+
 // Install event
 self.addEventListener('install', (event) => {
     console.log('Service Worker installing...');
@@ -10,49 +31,208 @@ self.addEventListener('install', (event) => {
 // Activate event
 self.addEventListener('activate', (event) => {
     console.log('Service Worker activating...');
-    event.waitUntil(self.clients.claim());
+    // Send whatever an earlier worker left in the outbox
+    event.waitUntil(self.clients.claim().then(() => flushEvents()));
 });
 
 // Message event - handle messages from the main thread
 self.addEventListener('message', (event) => {
-    console.log('Service Worker received message:', event.data);
-
     if (event.data.type === 'SEND_EVENT') {
-        sendEventToBackend(event.data.data, event.source);
+        event.waitUntil(queueEvent(event.data.data, event.source));
+    } else if (event.data.type === 'FLUSH') {
+        event.waitUntil(flushEvents());
     }
 });
 
-async function sendEventToBackend(eventData, source) {
+// Background sync - the browser wakes the worker once it is back online
+self.addEventListener('sync', (event) => {
+    if (event.tag === 'flush-events') {
+        event.waitUntil(flushEvents({ force: true }));
+    }
+});
+
+function openOutbox() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(OUTBOX_DB, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(OUTBOX_STORE, { autoIncrement: true });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Run fn(store) in one transaction and resolve with its result once the transaction completes
+async function withStore(mode, fn) {
+    const db = await openOutbox();
+    try {
+        return await new Promise((resolve, reject) => {
+            const tx = db.transaction(OUTBOX_STORE, mode);
+            let result;
+            Promise.resolve(fn(tx.objectStore(OUTBOX_STORE))).then((value) => { result = value; });
+            tx.oncomplete = () => resolve(result);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    } finally {
+        db.close();
+    }
+}
+
+function requestResult(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function queueEvent(eventData, source) {
+    let pending;
     try {
-        const response = await fetch(`${API_BASE_URL}/events`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(eventData)
+        pending = await withStore('readwrite', (store) => {
+            store.add(eventData);
+            return requestResult(store.count());
         });
+    } catch (error) {
+        // No IndexedDB (e.g. private browsing): send this event on its own
+        console.error('Error queueing event:', error);
+        return sendBatch([eventData]).then(
+            (result) => notifyClients({ type: 'EVENTS_SENT', data: result }),
+            (sendError) => source.postMessage({ type: 'EVENT_ERROR', error: sendError.message })
+        );
+    }
 
-        if (!response.ok) {
-            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    source.postMessage({ type: 'EVENT_QUEUED', data: { pending } });
+    if (pending >= FLUSH_BATCH_SIZE) {
+        return flushEvents();
+    }
+    scheduleFlush(FLUSH_DELAY_MS);
+}
+
+function scheduleFlush(delay) {
+    if (flushTimer === null) {
+        flushTimer = setTimeout(() => {
+            flushTimer = null;
+            flushEvents();
+        }, delay);
+    }
+}
+
+// Send the outbox in batches until it is empty; only one flush runs at a time
+function flushEvents({ force = false } = {}) {
+    if (!flushing) {
+        flushing = drainOutbox(force).finally(() => { flushing = null; });
+    }
+    return flushing;
+}
+
+async function drainOutbox(force) {
+    if (!force && Date.now() < retryAt) {
+        return;  // backing off; the retry timer flushes later
+    }
+    if (flushTimer !== null) {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+
+    while (true) {
+        const [keys, events] = await withStore('readonly', (store) => Promise.all([
+            requestResult(store.getAllKeys(null, MAX_BATCH_EVENTS)),
+            requestResult(store.getAll(null, MAX_BATCH_EVENTS)),
+        ]));
+        if (events.length === 0) {
+            return;
         }
 
-        const result = await response.json();
+        let result;
+        try {
+            result = await sendBatch(events);
+        } catch (error) {
+            if (error.retry) {
+                scheduleRetry(error);
+                return;
+            }
+            // The server refused the batch as a whole; retrying cannot help
+            console.error('Dropping undeliverable events:', error);
+            await withStore('readwrite', (store) => keys.forEach((key) => store.delete(key)));
+            notifyClients({ type: 'EVENT_ERROR', error: error.message });
+            continue;
+        }
 
-        // Send success message back to the main thread
-        source.postMessage({
-            type: 'EVENT_SENT',
-            data: result
-        });
+        // Accepted and invalid records are done with; records the server could not
+        // store ("error") and records it did not read stay queued
+        const done = keys.filter((key, index) => index < result.received && result.results[index].status !== 'error');
+        await withStore('readwrite', (store) => done.forEach((key) => store.delete(key)));
+        notifyClients({ type: 'EVENTS_SENT', data: result });
+        if (result.failed) {
+            scheduleRetry(new Error(`${result.failed} events could not be stored`));
+            return;
+        }
+        retryAttempt = 0;
+        retryAt = 0;
+        if (done.length === 0) {
+            return;
+        }
+    }
+}
 
-        console.log('Event sent successfully:', result);
+function scheduleRetry(error) {
+    const delay = Math.min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** retryAttempt) * (0.5 + Math.random() / 2);
+    retryAttempt += 1;
+    retryAt = Date.now() + delay;
+    console.warn(`Sending events failed (${error.message}), retrying in ${Math.round(delay)}ms`);
+    notifyClients({ type: 'EVENT_ERROR', error: `${error.message}; retrying in ${Math.round(delay / 1000)}s` });
 
+    if (flushTimer !== null) {
+        clearTimeout(flushTimer);
+    }
+    flushTimer = setTimeout(() => {
+        flushTimer = null;
+        flushEvents({ force: true });
+    }, delay);
+    // Also ask to be woken when the connection comes back, where supported
+    if (self.registration.sync) {
+        self.registration.sync.register('flush-events').catch(() => {});
+    }
+}
+
+async function gzip(text) {
+    const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+    return new Response(stream).arrayBuffer();
+}
+
+// POST events to /events/batch as gzip-compressed NDJSON; errors carry retry=true when worth retrying
+async function sendBatch(events) {
+    const ndjson = events.map((event) => JSON.stringify(event)).join('\n');
+    const headers = { 'Content-Type': 'application/x-ndjson' };
+    let body = ndjson;
+    if (compress) {
+        body = await gzip(ndjson);
+        headers['Content-Encoding'] = 'gzip';
+    }
+
+    let response;
+    try {
+        response = await fetch(`${API_BASE_URL}/events/batch`, { method: 'POST', headers, body });
     } catch (error) {
-        console.error('Error sending event:', error);
+        error.retry = true;  // offline or server unreachable
+        throw error;
+    }
 
-        // Send error message back to the main thread
-        source.postMessage({
-            type: 'EVENT_ERROR',
-            error: error.message
-        });
+    if (response.status === 415 && compress) {
+        // A server without compressed ingest: send uncompressed from now on
+        compress = false;
+        return sendBatch(events);
     }
+    if (!response.ok) {
+        const error = new Error(`HTTP ${response.status}: ${response.statusText}`);
+        error.retry = response.status >= 500 || response.status === 408 || response.status === 429;
+        throw error;
+    }
+    return response.json();
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach((client) => client.postMessage(message));
 }